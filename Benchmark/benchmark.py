@@ -0,0 +1,466 @@
+"""
+Benchmark suite of the library storage layer.
+
+For every catalog size a synthetic library is generated (see library_generator.py) and measured
+in a fresh worker process, so each size reports its own peak RSS. The results are written as JSON
+and compared against a stored baseline; an operation that got slower, or a peak RSS that grew,
+beyond the tolerance is reported as a regression and makes the run exit with status 1. So does an
+operation missing from the baseline, which could not be checked: the baseline needs updating. The
+one-shot commands of the command line ("main.py checkout ...") are timed too, each in a new process
+from its first import to its exit, so that their startup is tracked like any other operation.
+
+    python -m Benchmark.benchmark                          # 10k, 100k and 1M books against baseline.json
+    python -m Benchmark.benchmark --sizes 10000 --output results.json
+    python -m Benchmark.benchmark --update-baseline        # record the current numbers as the baseline
+
+"""
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Not available on Windows: the peak RSS is then not reported
+    resource = None
+
+from Benchmark.library_generator import book_isbn, generate_library, user_id
+from Storage.Backends.snapshot_format import json_to_snapshot
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+RESULTS_FORMAT = 1  # Bumped when the layout of the results changes incompatibly
+
+
+def summarize(latencies: list, items: int = 0) -> dict:
+    """
+    Summarizes the latencies of the calls to one operation.
+
+    Args:
+        latencies (list): The duration of every call, in seconds.
+        items (int): Number of records each call processes, for operations working on whole stores.
+
+    Returns:
+        dict: The number of calls, the total time, the throughput in calls per second (and records
+            per second when items is given) and the mean, p50, p90, p99 and max latencies in milliseconds.
+    """
+    ordered = sorted(latencies)
+    total = sum(ordered)
+
+    def percentile(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered) + 0.5) - 1))] * 1000
+
+    summary = {"calls": len(ordered), "total_seconds": total, "throughput": len(ordered) / total if total else 0.0,
+               "mean_ms": total / len(ordered) * 1000, "p50_ms": percentile(0.50), "p90_ms": percentile(0.90),
+               "p99_ms": percentile(0.99), "max_ms": ordered[-1] * 1000}
+    if items:
+        summary["records_per_second"] = items * len(ordered) / total if total else 0.0
+    return summary
+
+
+def timed(function, arguments, budget: float = 0) -> list:
+    """
+    Calls the function once per argument tuple and returns the duration of every call.
+    With a budget (in seconds), the calls stop early once they took that long in total,
+    which bounds the run time of the slow operations on the largest catalogs.
+    """
+    latencies = []
+    clock = time.perf_counter
+    deadline = clock() + budget if budget else None
+    for args in arguments:
+        started = clock()
+        function(*args)
+        latencies.append(clock() - started)
+        if deadline is not None and started > deadline:
+            break
+    return latencies
+
+
+def peak_rss() -> int:
+    """
+    Returns the peak resident set size of this process in bytes, or None where it cannot be measured.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Bytes on macOS, kilobytes elsewhere
+
+
+def storage_settings(directory: str) -> list:
+    """
+    Returns the class attributes pointing every store, journal and lock of the storage layer at the
+    given directory, and disabling the background autosave so it cannot interfere with the timings,
+    as (module, class, attribute, value) lists.
+    """
+    files = [("Storage.BookDB.book_storage_handling", "BookDB", "_dbpath", "BookData.json"),
+             ("Storage.UserDB.user_storage_handling", "UserDB", "_dbpath", "UserData.json"),
+             ("Storage.storage", "ContextManager", "_assignment_path", "AssignmentManager.json"),
+             ("Storage.storage", "ContextManager", "_holds_path", "HoldQueue.json"),
+             ("Storage.storage", "ContextManager", "_due_dates_path", "DueDates.json"),
+             ("Storage.storage", "ContextManager", "_sqlite_path", "library.db"),
+             ("Storage.storage", "ContextManager", "_shards_path", "Shards"),
+             ("Storage.storage", "ContextManager", "_journal_path", "journal.log"),
+             ("Storage.storage", "ContextManager", "_lock_path", "library.lock"),
+             ("Storage.storage", "ContextManager", "_versions_path", "versions.json")]
+    return ([[module, owner, attribute, os.path.join(directory, name)] for module, owner, attribute, name in files]
+            + [["Storage.storage", "ContextManager", "_autosave_interval", 0],
+               ["Storage.storage", "ContextManager", "_autosave_changes", 0]])
+
+
+def configure_storage(directory: str) -> None:
+    """
+    Points every store, journal and lock of the storage layer at the given directory,
+    and disables the background autosave so it cannot interfere with the timings.
+    """
+    for module, owner, attribute, value in storage_settings(directory):
+        setattr(getattr(importlib.import_module(module), owner), attribute, value)
+
+
+# Runs main.py with the settings of storage_settings, timed from its first import to its exit: the
+# startup of a one-shot command less that of the interpreter itself, which the library cannot change
+STARTUP_SCRIPT = """
+import time
+started = time.perf_counter()
+import importlib, json, runpy, sys
+for module, owner, attribute, value in json.loads(sys.argv[1]):
+    setattr(getattr(importlib.import_module(module), owner), attribute, value)
+sys.argv = sys.argv[2:]
+try:
+    runpy.run_path(sys.argv[0], run_name="__main__")
+except SystemExit:
+    pass
+print(time.perf_counter() - started, file=sys.stderr)
+"""
+
+
+def measure_startup(directory: str, commands: dict, backend: str = "json", repeat: int = 5) -> dict:
+    """
+    Measures one-shot commands of the command line (see Menu/cli.py) over a generated library, each
+    run in a new process, as a shell script would run them. The commands are run in turn, repeat times,
+    so a checkout followed by the check-in of the same book succeeds every time.
+
+    Args:
+        directory (str): The directory holding the generated store files.
+        commands (dict): The arguments of main.py of every measured command, keyed by the operation name.
+        backend (str): The storage backend to measure.
+        repeat (int): Number of runs of each command.
+
+    Returns:
+        dict: The summary of every command (see summarize), keyed by the operation name.
+    """
+    settings = json.dumps(storage_settings(directory))
+    environment = {**os.environ, "LIBRARY_STORAGE_BACKEND": backend}
+    latencies = {name: [] for name in commands}
+    for _ in range(repeat):
+        for name, arguments in commands.items():
+            run = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, settings, os.path.join(REPOSITORY, "main.py"),
+                                  *arguments], cwd=REPOSITORY, env=environment, stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.PIPE, text=True, check=True)
+            latencies[name].append(float(run.stderr.splitlines()[-1]))
+    return {name: summarize(seconds) for name, seconds in latencies.items()}
+
+
+def measure_library(directory: str, counts: dict, backend: str = "json", samples: int = 1000,
+                    repeat: int = 5, budget: float = 10.0, seed: int = 0) -> dict:
+    """
+    Measures the storage operations over a generated library. Meant to run in a fresh process:
+    it loads the library into the class-level stores and the peak RSS covers the whole process.
+
+    Args:
+        directory (str): The directory holding the generated store files.
+        counts (dict): The number of generated "books", "users" and "loans".
+        backend (str): The storage backend to measure ("json", "compact", "snapshot", "sharded" or "sqlite").
+        samples (int): Number of calls to each per-record operation (lookups, checkouts, ...).
+        repeat (int): Number of calls to each whole-store operation (loading, listing, saving).
+        budget (float): Seconds after which the calls to a per-record operation stop early.
+        seed (int): Seed choosing the records the operations target.
+
+    Returns:
+        dict: The summary of every operation (see summarize) and the peak RSS in bytes.
+    """
+    configure_storage(directory)
+    from Pydantic_Models.pydantic_models import Assignment
+    from Storage.BookDB.book_storage_handling import BookDB
+    from Storage.UserDB.user_storage_handling import UserDB
+    from Storage.storage import ContextManager
+
+    rng = random.Random(seed)
+    books, users = counts["books"], counts["users"]
+    operations = {}
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):  # The storage layer reports on stdout
+        started = time.perf_counter()
+        manager = ContextManager(ContextManager._create_backend(backend))
+        operations["ContextManager.__init__"] = summarize([time.perf_counter() - started], books)
+        try:
+            operations["BookDB.instantiate_data"] = summarize(
+                timed(BookDB.instantiate_data, [(manager._backend,)] * repeat), books)
+
+            isbns = [book_isbn(rng.randrange(books)) for _ in range(samples)]
+            logins = [user_id(rng.randrange(users)) for _ in range(samples)]
+            sample_books = [BookDB._search_by_isbn(isbn) for isbn in isbns]
+            sample_users = [UserDB._search_by_id(login) for login in logins]
+            operations["BookDB._search_by_isbn"] = summarize(
+                timed(BookDB._search_by_isbn, [(isbn,) for isbn in isbns], budget))
+            operations["BookDB._search_by_title"] = summarize(
+                timed(BookDB._search_by_title, [(book["title"],) for book in sample_books], budget))
+            operations["BookDB._search_by_author"] = summarize(
+                timed(BookDB._search_by_author, [(book["author"],) for book in sample_books], budget))
+            queries = [(book["title"].split()[0],) for book in sample_books]
+            operations["BookDB._search_full_text[first, builds the index]"] = summarize(
+                timed(BookDB._search_full_text, queries[:1]), books)
+            operations["BookDB._search_full_text"] = summarize(timed(BookDB._search_full_text, queries, budget))
+            # Kiosk traffic: a few popular searches repeated, answered by the query cache after their first run
+            popular = [(book["author"],) for book in sample_books[:20]] * 50
+            operations["BookDB._search_by_author[repeated]"] = summarize(
+                timed(BookDB._search_by_author, popular, budget))
+            popular = queries[:20] * 50
+            operations["BookDB._search_full_text[repeated]"] = summarize(
+                timed(BookDB._search_full_text, popular, budget))
+            operations["UserDB._search_by_id"] = summarize(
+                timed(UserDB._search_by_id, [(login,) for login in logins], budget))
+            operations["UserDB._search_by_name"] = summarize(
+                timed(UserDB._search_by_name, [(user["name"],) for user in sample_users], budget))
+            operations["ContextManager.is_book_available"] = summarize(
+                timed(manager.is_book_available, [(isbn,) for isbn in isbns], budget))
+
+            free = list(dict.fromkeys(isbn for isbn in isbns if manager.is_book_available(isbn)))
+            loans = [(Assignment(isbn=isbn, user_id=login),) for isbn, login in zip(free, logins)]
+            operations["ContextManager.checkout"] = summarize(timed(manager.checkout, loans))
+            operations["ContextManager.checkin"] = summarize(timed(manager.checkin, loans))
+
+            operations["BookDB._get_books"] = summarize(timed(BookDB._get_books, [()] * repeat), books)
+            operations["BookDB.page_books[title, first builds the order]"] = summarize(
+                timed(BookDB.page_books, [("title", 0, None, 100)]), books)
+            pages = [("title", rng.randrange(max(books - 100, 1)), None, 100) for _ in range(samples)]
+            operations["BookDB.page_books[title]"] = summarize(timed(BookDB.page_books, pages, budget))
+            operations["BookDB.inventory_counts[first, builds the counters]"] = summarize(
+                timed(BookDB.inventory_counts, [()]), books)
+            operations["BookDB.inventory_counts"] = summarize(timed(BookDB.inventory_counts, [()] * samples, budget))
+            operations["BookDB.page_available_books[title]"] = summarize(
+                timed(BookDB.page_available_books, pages, budget))
+
+            def save_after_checkout(loan):
+                manager.checkout(loan)
+                started = time.perf_counter()
+                manager.save_data()
+                return time.perf_counter() - started
+
+            operations["ContextManager.save_data"] = summarize([save_after_checkout(loan) for loan, in loans[:repeat]])
+
+            def save_everything():
+                manager._unsaved_stores.update(("books", "users", "loans"))  # As if every store had changed
+                manager.save_data()
+
+            operations["ContextManager.save_data[all stores]"] = summarize(timed(save_everything, [()] * repeat),
+                                                                             books + users + counts["loans"])
+
+            import_path = os.path.join(directory, "import.jsonl")  # As many new books as the catalog holds
+            with open(import_path, "w") as fp:
+                fp.writelines(json.dumps({"title": f"Imported title {index}", "author": f"Author {index % 5000}",
+                                          "isbn": f"979{index:010d}"}) + "\n" for index in range(books))
+            operations["ContextManager.import_books"] = summarize(timed(manager.import_books, [(import_path,)]), books)
+        finally:
+            manager.close()
+    return {"operations": operations, "peak_rss_bytes": peak_rss()}
+
+
+def run_suite(sizes: list, users: int = 100000, loan_ratio: float = 0.1, backend: str = "json",
+              samples: int = 1000, repeat: int = 5, budget: float = 10.0, seed: int = 0) -> dict:
+    """
+    Generates a library of every size and measures it in a worker process.
+
+    Args:
+        sizes (list): The catalog sizes, in books.
+        users (int): Number of users of every library.
+        loan_ratio (float): Fraction of the books on loan.
+        backend (str): The storage backend to measure.
+        samples (int): Number of calls to each per-record operation.
+        repeat (int): Number of calls to each whole-store operation.
+        budget (float): Seconds after which the calls to a per-record operation stop early.
+        seed (int): Seed of the generator and of the workload.
+
+    Returns:
+        dict: The results: the environment and configuration, then under "scales" the generated
+            counts, the operation summaries and the peak RSS of every size, keyed by the size.
+    """
+    results = {"format": RESULTS_FORMAT, "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+               "python": platform.python_version(), "platform": platform.platform(),
+               "config": {"users": users, "loan_ratio": loan_ratio, "backend": backend, "samples": samples,
+                          "repeat": repeat, "budget": budget, "seed": seed},
+               "scales": {}}
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix="library-benchmark-") as directory:
+            print(f"Generating {size} books, {users} users...", file=sys.stderr)
+            started = time.perf_counter()
+            library = generate_library(directory, size, users, loan_ratio, seed)
+            if backend == "snapshot":  # Start from snapshot files rather than the JSON fallback
+                for store in ("books", "users", "loans"):
+                    json_to_snapshot(library[store], store)
+            counts, generated = library["counts"], time.perf_counter() - started
+            print(f"Measuring the one-shot commands over {size} books...", file=sys.stderr)
+            with open(library["loans"], "r") as fp:
+                lent = json.load(fp)
+            free = next(book_isbn(index) for index in range(size) if book_isbn(index) not in lent)
+            startup = measure_startup(directory, {
+                "main.py search-book --isbn": ["search-book", "--isbn", book_isbn(0)],
+                "main.py is-available": ["is-available", book_isbn(0)],
+                "main.py search-user --user-id": ["search-user", "--user-id", user_id(0)],
+                "main.py checkout": ["checkout", free, user_id(0)],
+                "main.py checkin": ["checkin", free, user_id(0)],
+            }, backend, repeat)
+            print(f"Measuring {size} books...", file=sys.stderr)
+            command = [sys.executable, "-m", "Benchmark.benchmark", "--worker", directory, "--counts", json.dumps(counts),
+                       "--backend", backend, "--samples", str(samples), "--repeat", str(repeat),
+                       "--budget", str(budget), "--seed", str(seed)]
+            worker = subprocess.run(command, cwd=REPOSITORY, stdout=subprocess.PIPE, check=True)
+            measured = json.loads(worker.stdout)
+            measured["operations"].update(startup)
+            results["scales"][str(size)] = {"counts": counts, "generate_seconds": generated, **measured}
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.25, noise_ms: float = 0.02) -> list:
+    """
+    Compares results with a baseline measured with the same sizes.
+
+    An operation regressed if its median latency grew by more than the tolerance (and by more than
+    noise_ms, so sub-microsecond lookups do not flag timer jitter); a size regressed if its peak
+    RSS grew by more than the tolerance. Sizes and operations missing from either side cannot be
+    compared; unchecked lists them.
+
+    Args:
+        results (dict): The current results, as returned by run_suite.
+        baseline (dict): The baseline results.
+        tolerance (float): The accepted relative slowdown or growth, e.g. 0.25 for 25%.
+        noise_ms (float): The smallest latency increase reported, in milliseconds.
+
+    Returns:
+        list: One dict per regression, with the "scale", the "metric" (operation or peak_rss_bytes),
+            the "baseline" and "current" values and their ratio "change".
+    """
+    regressions = []
+
+    def check(scale, metric, before, after, floor=0.0):
+        if before and after is not None and after > before * (1 + tolerance) and after - before > floor:
+            regressions.append({"scale": scale, "metric": metric, "baseline": before, "current": after,
+                                "change": after / before})
+
+    for scale, current in results["scales"].items():
+        previous = baseline.get("scales", {}).get(scale)
+        if previous is None:
+            continue
+        for operation, summary in current["operations"].items():
+            if operation in previous["operations"]:
+                check(scale, operation, previous["operations"][operation]["p50_ms"], summary["p50_ms"], noise_ms)
+        check(scale, "peak_rss_bytes", previous.get("peak_rss_bytes"), current.get("peak_rss_bytes"))
+    return regressions
+
+
+def unchecked(results: dict, baseline: dict) -> list:
+    """
+    Lists what compare cannot check: the sizes and operations measured now but absent from the
+    baseline (added since it was stored, e.g. a new operation), and the operations of a measured size
+    that the baseline has but the results no longer do (renamed or removed). Either way the baseline
+    is out of date. Sizes of the baseline left out of the run (--sizes) are not listed.
+
+    Args:
+        results (dict): The current results, as returned by run_suite.
+        baseline (dict): The baseline results.
+
+    Returns:
+        list: One dict per size or operation, with the "scale", the "metric" (the operation, or None
+            for a whole size) and the side it is "missing_from" ("baseline" or "results").
+    """
+    missing = []
+    current_scales, previous_scales = results["scales"], baseline.get("scales", {})
+    for scale in current_scales.keys() - previous_scales.keys():
+        missing.append({"scale": scale, "metric": None, "missing_from": "baseline"})
+    for scale in current_scales.keys() & previous_scales.keys():
+        current, previous = current_scales[scale]["operations"], previous_scales[scale]["operations"]
+        missing += [{"scale": scale, "metric": operation, "missing_from": "baseline"}
+                    for operation in current if operation not in previous]
+        missing += [{"scale": scale, "metric": operation, "missing_from": "results"}
+                    for operation in previous if operation not in current]
+    return missing
+
+
+def report(results: dict, regressions: list, missing: list = (), output=sys.stderr) -> None:
+    """
+    Prints a human-readable table of the results, the regressions and what the baseline lacks.
+    """
+    for scale, measured in results["scales"].items():
+        rss = measured["peak_rss_bytes"]
+        print(f"\n{scale} books, {measured['counts']['users']} users, {measured['counts']['loans']} loans"
+              + (f" - peak RSS {rss / 2 ** 20:.0f} MiB" if rss else ""), file=output)
+        print(f"{'operation':<52}{'calls':>7}{'ops/s':>12}{'p50 ms':>11}{'p90 ms':>11}{'p99 ms':>11}", file=output)
+        for operation, summary in measured["operations"].items():
+            print(f"{operation:<52}{summary['calls']:>7}{summary['throughput']:>12.1f}{summary['p50_ms']:>11.4f}"
+                  f"{summary['p90_ms']:>11.4f}{summary['p99_ms']:>11.4f}", file=output)
+    for regression in regressions:
+        print(f"REGRESSION {regression['scale']} books {regression['metric']}: {regression['baseline']:.4g} -> "
+              f"{regression['current']:.4g} ({regression['change']:.2f}x)", file=output)
+    for entry in missing:
+        print(f"UNCHECKED {entry['scale']} books {entry['metric'] or '(every operation)'}: missing from the "
+              f"{entry['missing_from']}, run with --update-baseline", file=output)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the library storage layer")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000], help="catalog sizes in books")
+    parser.add_argument("--users", type=int, default=100000, help="number of users")
+    parser.add_argument("--loan-ratio", type=float, default=0.1, help="fraction of the books on loan")
+    parser.add_argument("--backend", default="json", choices=["json", "compact", "snapshot", "sharded", "sqlite"])
+    parser.add_argument("--samples", type=int, default=1000, help="calls to each per-record operation")
+    parser.add_argument("--repeat", type=int, default=5, help="calls to each whole-store operation")
+    parser.add_argument("--budget", type=float, default=10.0, help="seconds spent at most on a per-record operation")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the generator and of the workload")
+    parser.add_argument("--output", metavar="FILE", help="write the JSON results to FILE instead of stdout")
+    parser.add_argument("--baseline", metavar="FILE", default=BASELINE_PATH, help="baseline compared against")
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="accepted relative slowdown before flagging")
+    parser.add_argument("--worker", metavar="DIR", help=argparse.SUPPRESS)
+    parser.add_argument("--counts", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        measured = measure_library(args.worker, json.loads(args.counts), args.backend, args.samples, args.repeat,
+                                   args.budget, args.seed)
+        print(json.dumps(measured))
+        return 0
+
+    results = run_suite(args.sizes, args.users, args.loan_ratio, args.backend, args.samples, args.repeat,
+                        args.budget, args.seed)
+    regressions, missing = [], []
+    if args.update_baseline:
+        with open(args.baseline, "w") as fp:
+            json.dump(results, fp, indent=2)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r") as fp:
+            baseline = json.load(fp)
+        if baseline.get("config") != results["config"]:
+            print("The baseline was measured with another configuration; not comparing.", file=sys.stderr)
+        else:
+            regressions = compare(results, baseline, args.tolerance)
+            missing = unchecked(results, baseline)
+    results["regressions"] = regressions
+    results["unchecked"] = missing
+    report(results, regressions, missing)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    return 1 if regressions or missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
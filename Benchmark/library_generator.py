@@ -0,0 +1,124 @@
+"""
+Deterministic generator of synthetic library catalogs for the benchmarks.
+
+The same (books, users, loan_ratio, seed) always produces byte-identical store files,
+so runs on different commits measure the same data. Records are streamed to disk one
+per line, which keeps the generator's own memory flat even for millions of books.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+
+SYLLABLES = ["ka", "lo", "mi", "ren", "to", "sha", "vel", "dor", "an", "is", "mor", "quin", "el", "tra", "bel",
+             "nor", "ith", "gal", "or", "sen", "ul", "dra", "cor", "fen"]
+FIRST_NAMES = ["Ada", "Alan", "Grace", "Linus", "Ken", "Barbara", "Donald", "Edsger", "Frances", "John", "Margaret",
+               "Niklaus", "Radia", "Tim", "Sophie", "Guido", "Dennis", "Hedy", "Claude", "Katherine"]
+LAST_NAMES = ["Lovelace", "Turing", "Hopper", "Torvalds", "Thompson", "Liskov", "Knuth", "Dijkstra", "Allen",
+              "McCarthy", "Hamilton", "Wirth", "Perlman", "Berners-Lee", "Wilson", "Rossum", "Ritchie", "Lamarr",
+              "Shannon", "Johnson"]
+
+
+def book_isbn(index: int) -> str:
+    """
+    Returns the ISBN of the index-th generated book.
+    """
+    return f"978{index:010d}"
+
+
+def user_id(index: int) -> str:
+    """
+    Returns the login ID of the index-th generated user.
+    """
+    return f"user{index:07d}"
+
+
+def _vocabulary(rng: random.Random, size: int) -> list:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def _write_store(path: str, records) -> int:
+    """
+    Streams (key, record) pairs into a JSON object file, one record per line.
+    """
+    count = 0
+    with open(path, "w") as fp:
+        fp.write("{")
+        for key, record in records:
+            fp.write(",\n" if count else "\n")
+            fp.write(f"{json.dumps(key)}: {json.dumps(record)}")
+            count += 1
+        fp.write("\n}\n")
+    return count
+
+
+def generate_library(directory: str, books: int, users: int, loan_ratio: float = 0.1, seed: int = 0) -> dict:
+    """
+    Writes a synthetic catalog in the format of the JSON storage backend.
+
+    Titles are two to five words drawn from a vocabulary with a skewed distribution, so
+    some words are common and others rare, as in a real catalog; each author writes about
+    twenty books and user names repeat, which gives the title, author and name indexes
+    realistic bucket sizes.
+
+    Args:
+        directory (str): The directory receiving BookData.json, UserData.json and AssignmentManager.json.
+        books (int): Number of books.
+        users (int): Number of users.
+        loan_ratio (float): Fraction of the books lent out, each to a random user.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        dict: The paths of the "books", "users" and "loans" store files and the number of records
+            of each under "counts".
+    """
+    if not 0 <= loan_ratio <= 1:
+        raise ValueError(f"The loan ratio must be between 0 and 1, got {loan_ratio}")
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    vocabulary = _vocabulary(rng, 2000)
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))  # Zipf-like
+    authors = [f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(vocabulary).title()}"
+               for _ in range(max(books // 20, 1))]
+
+    def book_records():
+        for index in range(books):
+            title = " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(2, 5))).title()
+            isbn = book_isbn(index)
+            yield isbn, {"title": title, "author": rng.choice(authors), "isbn": isbn}
+
+    def user_records():
+        for index in range(users):
+            login = user_id(index)
+            yield login, {"user_id": login, "password": f"{rng.getrandbits(48):012x}",
+                          "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"}
+
+    def loan_records():
+        if not users:
+            return
+        for index in sorted(rng.sample(range(books), int(books * loan_ratio))):
+            yield book_isbn(index), user_id(rng.randrange(users))
+
+    paths = {"books": os.path.join(directory, "BookData.json"),
+             "users": os.path.join(directory, "UserData.json"),
+             "loans": os.path.join(directory, "AssignmentManager.json")}
+    counts = {"books": _write_store(paths["books"], book_records()),
+              "users": _write_store(paths["users"], user_records()),
+              "loans": _write_store(paths["loans"], loan_records())}
+    return {**paths, "counts": counts}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic library catalog")
+    parser.add_argument("directory", help="directory receiving the store files")
+    parser.add_argument("--books", type=int, default=10000, help="number of books")
+    parser.add_argument("--users", type=int, default=100000, help="number of users")
+    parser.add_argument("--loan-ratio", type=float, default=0.1, help="fraction of the books on loan")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random generator")
+    args = parser.parse_args()
+    print(json.dumps(generate_library(args.directory, args.books, args.users, args.loan_ratio, args.seed)["counts"]))
@@ -0,0 +1,315 @@
+import io
+import json
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Iterable, TextIO, Union
+from Storage.BookDB.book_storage_handling import BookDB
+from Storage.instrumentation import Instrumentation
+from Storage.UserDB.user_storage_handling import UserDB
+
+
+class ThreadOutput:
+    """
+    A replacement of sys.stdout sending what each thread prints to the stream that thread captures it
+    into, if any, and to the stream it replaced otherwise. redirect_stdout swaps sys.stdout for the whole
+    process, so two threads capturing at once (the service's event loop and writer thread) would get
+    each other's messages, and the last one to finish would leave its buffer installed.
+    """
+
+    _install_lock = threading.Lock()
+
+    def __init__(self, stream: TextIO):
+        """
+        Args:
+            stream (TextIO): The stream written to by the threads capturing nothing.
+        """
+        self.stream = stream
+        self._local = threading.local()
+
+    def _target(self) -> TextIO:
+        return getattr(self._local, "target", None) or self.stream
+
+    def write(self, text: str) -> int:
+        return self._target().write(text)
+
+    def flush(self) -> None:
+        self._target().flush()
+
+    def __getattr__(self, name: str):
+        return getattr(self._target(), name)  # encoding, isatty, fileno...
+
+    @classmethod
+    @contextmanager
+    def capture(cls, buffer: TextIO):
+        """
+        Send what the current thread prints to a buffer until the block ends, installing the
+        ThreadOutput as sys.stdout the first time. Other threads keep printing where they did.
+
+        Args:
+            buffer (TextIO): Where the output of the current thread goes.
+        """
+        with cls._install_lock:
+            if not isinstance(sys.stdout, cls):
+                sys.stdout = cls(sys.stdout)
+            output = sys.stdout
+        previous = getattr(output._local, "target", None)
+        output._local.target = buffer
+        try:
+            yield buffer
+        finally:
+            output._local.target = previous
+
+
+class BatchRunner:
+    """
+    The BatchRunner executes library commands without any prompts, for automation and nightly jobs.
+    Each command is a JSON object such as {"command": "checkout", "args": {"isbn": "1", "user_id": "u"}}
+    (an optional "id" is echoed back) and produces one JSON result line:
+    {"id": ..., "command": ..., "ok": true/false, "result": ..., "messages": [...]}.
+    The Pydantic models are imported by the commands that build them, so that the queries
+    run by the command line (see Menu/cli.py) never wait for pydantic to be imported.
+    """
+
+    all_or_nothing = ("checkout_many", "checkin_many")  # Commands returning {"ok", "items"}
+
+    def __init__(self, manager, save_every: int = 0, fsync: bool = False):
+        """
+        Initializes the runner over an already loaded context manager.
+
+        Args:
+            manager: The context manager object responsible for handling data operations.
+            save_every (int): Save the stores after this many commands (0 saves only at the end).
+            fsync (bool): Whether journal records are fsync'ed one by one; by default durability
+                comes from the periodic and final saves, which is what makes large batches fast.
+        """
+        self.manager = manager
+        self.save_every = save_every
+        self.fsync = fsync
+        self.commands = {
+            "add_book": self.add_book,
+            "update_book": self.update_book,
+            "delete_book": self.delete_book,
+            "search_books": self.search_books,
+            "list_books": self.list_books,
+            "list_available_books": self.list_available_books,
+            "add_user": self.add_user,
+            "update_user": self.update_user,
+            "delete_user": self.delete_user,
+            "search_users": self.search_users,
+            "list_users": self.list_users,
+            "checkout": self.checkout,
+            "checkin": self.checkin,
+            "checkout_many": lambda args: self.manager.checkout_many(self._assignments(args)),
+            "checkin_many": lambda args: self.manager.checkin_many(self._assignments(args)),
+            "is_available": self.is_available,
+            "list_user_books": self.list_user_books,
+            "place_hold": self.place_hold,
+            "cancel_hold": self.cancel_hold,
+            "list_user_holds": lambda args: self.manager.holds_of(args["user_id"]),
+            "hold_queue": self.hold_queue,
+            "renew": self.renew,
+            "overdue_loans": lambda args: self.manager.overdue_loans(args.get("now"), args.get("limit")),
+            "loans_due": lambda args: self.manager.loans_due_within(args["days"], args.get("now"), args.get("limit")),
+            "import_books": lambda args: self.manager.import_books(args["path"], args.get("rejects_path")),
+            "import_users": lambda args: self.manager.import_users(args["path"], args.get("rejects_path")),
+            "export_books": lambda args: self.manager.export_books(args["path"], args.get("order")),
+            "export_users": lambda args: self.manager.export_users(args["path"], args.get("order")),
+            "save": lambda args: self.manager.save_data(),
+            "stats": lambda args: Instrumentation.snapshot(),
+            "cache_stats": lambda args: self.manager.query_cache_stats(),
+            "event_stats": lambda args: self.manager.events.stats(),
+            "read_events": lambda args: self.manager.read_event_log(args.get("offset", 0), args.get("limit", 1000)),
+            "inventory": lambda args: BookDB.inventory_counts(),
+        }
+
+    def add_book(self, args: dict) -> bool:
+        from Pydantic_Models.pydantic_models import BookData
+        return BookDB.add_book(BookData(**args))
+
+    def update_book(self, args: dict) -> bool:
+        from Pydantic_Models.pydantic_models import BookData
+        return BookDB.update_book(BookData(**args))
+
+    def delete_book(self, args: dict) -> bool:
+        from Pydantic_Models.pydantic_models import BookData
+        return self.manager.remove_book(BookData(**args))
+
+    def search_books(self, args: dict) -> dict:
+        normalized = args.get("normalized", False)
+        if "isbn" in args:
+            book = BookDB._search_by_isbn(args["isbn"])
+            return {args["isbn"]: book} if book is not None else {}
+        if "title" in args:
+            return BookDB._search_by_title(args["title"], normalized)
+        if "author" in args:
+            return BookDB._search_by_author(args["author"], normalized)
+        if "query" in args:
+            return BookDB._search_full_text(args["query"], args.get("limit", 10))
+        raise ValueError("search_books expects one of 'isbn', 'title', 'author' or 'query'")
+
+    def list_books(self, args: dict) -> Union[list, dict]:
+        if "limit" in args:
+            books, next_cursor = BookDB.page_books(args.get("order"), args.get("offset", 0), args.get("cursor"),
+                                                   args["limit"])
+            return {"items": [book for _, book in books], "next_cursor": next_cursor}
+        return [book for _, book in BookDB.iter_books(args.get("order"), args.get("offset", 0), args.get("cursor"))]
+
+    def list_available_books(self, args: dict) -> Union[list, dict]:
+        if "limit" in args:
+            books, next_cursor = BookDB.page_available_books(args.get("order"), args.get("offset", 0),
+                                                             args.get("cursor"), args["limit"])
+            return {"items": [book for _, book in books], "next_cursor": next_cursor}
+        return [book for _, book in BookDB.iter_available_books(args.get("order"), args.get("offset", 0),
+                                                                args.get("cursor"))]
+
+    def add_user(self, args: dict) -> bool:
+        from Pydantic_Models.pydantic_models import UserLoggingData
+        return UserDB.add_user(UserLoggingData(**args))
+
+    def update_user(self, args: dict) -> bool:
+        from Pydantic_Models.pydantic_models import UserLoggingData
+        return UserDB.update_password(UserLoggingData(**args))
+
+    def delete_user(self, args: dict) -> bool:
+        from Pydantic_Models.pydantic_models import UserLoggingData
+        return self.manager.remove_user(UserLoggingData(**args))
+
+    def search_users(self, args: dict) -> dict:
+        if "user_id" in args:
+            user = UserDB._search_by_id(args["user_id"])
+            return {args["user_id"]: user["name"]} if user is not None else {}
+        if "name" in args:
+            return UserDB._search_by_name(args["name"], args.get("normalized", False))
+        raise ValueError("search_users expects one of 'user_id' or 'name'")
+
+    def list_users(self, args: dict) -> Union[list, dict]:
+        if "limit" in args:
+            users, next_cursor = UserDB.page_users(args.get("order"), args.get("offset", 0), args.get("cursor"),
+                                                   args["limit"])
+            return {"items": [{"user_id": user_id, "name": user["name"]} for user_id, user in users],
+                    "next_cursor": next_cursor}
+        return [{"user_id": user_id, "name": user["name"]}
+                for user_id, user in UserDB.iter_users(args.get("order"), args.get("offset", 0), args.get("cursor"))]
+
+    def checkout(self, args: dict) -> bool:
+        from Pydantic_Models.pydantic_models import Assignment
+        return self.manager.checkout(Assignment(**args))
+
+    def checkin(self, args: dict) -> bool:
+        from Pydantic_Models.pydantic_models import Assignment
+        return self.manager.checkin(Assignment(**args))
+
+    @staticmethod
+    def _assignments(args: dict) -> list:
+        from Pydantic_Models.pydantic_models import Assignment
+        if not isinstance(args.get("items"), list):
+            raise ValueError("expected 'items', a list of {'isbn', 'user_id'} objects")
+        user_id = args.get("user_id", "")  # Shared by the items that give none, e.g. one patron's stack
+        return [Assignment(**{"user_id": user_id, **item}) for item in args["items"]]
+
+    def is_available(self, args: dict) -> dict:
+        return {"isbn": args["isbn"], "available": self.manager.is_book_available(args["isbn"]),
+                "copies_available": self.manager.available_copies(args["isbn"])}
+
+    def list_user_books(self, args: dict) -> dict:
+        return self.manager.books_held_by(args["user_id"])
+
+    def place_hold(self, args: dict) -> bool:
+        from Pydantic_Models.pydantic_models import Hold
+        return self.manager.place_hold(Hold(**args))
+
+    def cancel_hold(self, args: dict) -> bool:
+        from Pydantic_Models.pydantic_models import Assignment
+        return self.manager.cancel_hold(Assignment(**args))
+
+    def hold_queue(self, args: dict) -> dict:
+        return {"isbn": args["isbn"], "waiting": self.manager.hold_queue(args["isbn"])}
+
+    def renew(self, args: dict) -> bool:
+        from Pydantic_Models.pydantic_models import Assignment
+        return self.manager.renew(Assignment(**args))
+
+    def execute(self, command: dict) -> dict:
+        """
+        Executes a single command, capturing everything the storage layer prints.
+
+        Args:
+            command (dict): The command object with "command", optional "args" and optional "id".
+
+        Returns:
+            dict: The result object. "ok" is False for unknown commands, invalid arguments,
+                operations that returned False and batch loans that were not applied.
+        """
+        name = command.get("command")
+        response = {"id": command.get("id"), "command": name}
+        handler = self.commands.get(name)
+        messages = io.StringIO()
+        try:
+            if handler is None:
+                raise ValueError(f"Unknown command '{name}'")
+            with ThreadOutput.capture(messages):  # Not redirect_stdout: the service executes on two threads
+                result = handler(command.get("args") or {})
+            response["ok"] = result is not False and not (name in self.all_or_nothing and not result["ok"])
+            response["result"] = result
+        except (ValueError, KeyError, TypeError, OSError) as e:  # pydantic's ValidationError is a ValueError
+            response["ok"] = False
+            response["error"] = f"{type(e).__name__}: {e}"
+        response["messages"] = messages.getvalue().splitlines()
+        return response
+
+    def run(self, lines: Iterable[str], output: TextIO) -> int:
+        """
+        Executes a stream of JSONL commands, writing one JSON result line per command,
+        and saves the stores every save_every commands and once at the end. A failed save writes
+        the result line of a "save" command and counts as a failed command.
+
+        Args:
+            lines (Iterable[str]): The JSONL command lines, e.g. an open file or sys.stdin.
+            output (TextIO): Where the JSON result lines are written.
+
+        Returns:
+            int: The number of commands and saves that failed.
+        """
+        journal = self.manager._journal
+        if journal is not None:
+            journal.fsync = self.fsync
+        failures = executed = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                command = json.loads(line)
+                if not isinstance(command, dict):
+                    raise ValueError("a command must be a JSON object")
+            except ValueError as e:
+                response = {"id": None, "command": None, "ok": False,
+                            "error": f"Invalid command line: {e}", "messages": []}
+            else:
+                response = self.execute(command)
+            failures += not response["ok"]
+            executed += 1
+            output.write(json.dumps(response, default=list) + "\n")
+            if self.save_every and executed % self.save_every == 0:
+                failures += self._save(output)
+        failures += self._save(output)
+        output.flush()
+        return failures
+
+    def _save(self, output: TextIO) -> int:
+        """
+        Runs one of the saves the runner makes on its own. A successful save writes nothing, so that
+        the output keeps one line per command; a failed one writes the result line of a "save" command,
+        with the messages explaining the failure, and counts as a failed command.
+
+        Args:
+            output (TextIO): Where the result line of a failed save is written.
+
+        Returns:
+            int: 1 if the save failed, 0 otherwise.
+        """
+        response = self.execute({"command": "save"})
+        if response["ok"]:
+            return 0
+        output.write(json.dumps(response, default=list) + "\n")
+        return 1
@@ -0,0 +1,138 @@
+import argparse
+import json
+import sys
+import time
+from contextlib import redirect_stdout
+from Menu.batch import BatchRunner
+
+# Command line form of the command arguments: the positional ones are given in order, the options by
+# name. Each is stored under the name of the argument of the batch command (e.g. --user-id as user_id).
+ARGUMENTS = {
+    "isbn": {"metavar": "ISBN", "help": "the ISBN of the book, or the copy ID of one of its copies"},
+    "user_id": {"metavar": "USER_ID", "help": "the ID of the user"},
+    "days": {"metavar": "DAYS", "type": float, "help": "the number of days ahead"},
+    "--isbn": {"help": "the ISBN of the book"},
+    "--title": {"help": "the title of the book"},
+    "--author": {"help": "the author of the book"},
+    "--query": {"help": "words of the title or the author, the results ranked by relevance"},
+    "--user-id": {"help": "the ID of the user"},
+    "--name": {"help": "the name of the user"},
+    "--normalized": {"action": "store_true", "help": "ignore case and extra whitespace"},
+    "--order": {"help": "the listing order: isbn, title or author for books, user_id or name for users"},
+    "--limit": {"type": int, "help": "the maximum number of results; a listing is then paged"},
+    "--offset": {"type": int, "help": "the number of records of the listing skipped"},
+    "--cursor": {"help": "the next_cursor of the previous page of the listing"},
+}
+
+
+class CommandLine(BatchRunner):
+    """
+    The CommandLine runs a single library command given as a subcommand of main.py, for shell scripts
+    and cron jobs, e.g. "python main.py search-book --author Tolkien" or "python main.py checkout ISBN USER_ID".
+    The command is executed as in batch mode and its result object is printed as one JSON line on
+    standard output; the exit status is 0 if it succeeded and 1 otherwise.
+
+    A one-shot command is dominated by its startup rather than by the operation itself, so a query only
+    loads the stores it reads, read-only (see the stores of ContextManager), and nothing imports pydantic
+    on the way; the commands changing the library load it whole and save it before exiting.
+    "--timing" reports where the time went on standard error.
+    """
+
+    # Subcommand -> (batch command, stores it reads or None if it changes the library, arguments, description)
+    subcommands = {
+        "search-book": ("search_books", ("books",),
+                        ("--isbn", "--title", "--author", "--query", "--normalized", "--limit"),
+                        "search the books by ISBN, title or author, or by words of them with --query"),
+        "search-user": ("search_users", ("users",), ("--user-id", "--name", "--normalized"),
+                        "search the users by ID or name"),
+        "list-books": ("list_books", ("books",), ("--order", "--limit", "--offset", "--cursor"),
+                       "list the books"),
+        "list-available-books": ("list_available_books", ("books", "loans"),
+                                 ("--order", "--limit", "--offset", "--cursor"),
+                                 "list the books with a copy available"),
+        "list-users": ("list_users", ("users",), ("--order", "--limit", "--offset", "--cursor"), "list the users"),
+        "is-available": ("is_available", ("books", "loans"), ("isbn",),
+                         "tell whether a copy of a book is available, and how many"),
+        "user-books": ("list_user_books", ("books", "loans"), ("user_id",), "list the books a user holds"),
+        "user-holds": ("list_user_holds", ("holds",), ("user_id",), "list the books a user is waiting for"),
+        "hold-queue": ("hold_queue", ("holds",), ("isbn",), "list the users waiting for a book"),
+        "overdue": ("overdue_loans", ("loans", "due_dates"), ("--limit",), "list the loans past their due date"),
+        "loans-due": ("loans_due", ("loans", "due_dates"), ("days", "--limit"),
+                      "list the loans due in the next days"),
+        "inventory": ("inventory", ("books", "loans"), (), "count the copies of the catalog, on loan and available"),
+        "checkout": ("checkout", None, ("isbn", "user_id"), "check out a copy of a book"),
+        "checkin": ("checkin", None, ("isbn", "user_id"), "check in a book"),
+        "renew": ("renew", None, ("isbn", "user_id"), "renew the loan of a book"),
+    }
+
+    # The arguments come from argparse, already text: the loans are made without building the Pydantic models
+    def checkout(self, args: dict) -> bool:
+        return self.manager._checkout(args["isbn"], args["user_id"])
+
+    def checkin(self, args: dict) -> bool:
+        return self.manager._checkin(args["isbn"], args["user_id"])
+
+    def renew(self, args: dict) -> bool:
+        return self.manager._renew(args["isbn"], args["user_id"])
+
+    @classmethod
+    def add_subcommands(cls, parser: argparse.ArgumentParser) -> None:
+        """
+        Add every subcommand, with its arguments, to the argument parser of main.py.
+
+        Args:
+            parser (argparse.ArgumentParser): The argument parser of main.py.
+        """
+        subparsers = parser.add_subparsers(dest="subcommand", metavar="COMMAND", title="one-shot commands",
+                                           description="run a single command and print its result as JSON")
+        for name, (_, _, arguments, description) in cls.subcommands.items():
+            # Options left out stay out of the command arguments, like the arguments left out of a batch command
+            subparser = subparsers.add_parser(name, help=description, description=description,
+                                              argument_default=argparse.SUPPRESS)
+            for argument in arguments:
+                subparser.add_argument(argument, **ARGUMENTS[argument])
+            subparser.add_argument("--timing", action="store_true", help="report the startup time on stderr")
+
+    @classmethod
+    def run_subcommand(cls, args: argparse.Namespace, started: float) -> int:
+        """
+        Load the stores the subcommand needs, execute it and print its result object.
+
+        Args:
+            args (argparse.Namespace): The parsed command line, with the subcommand and its arguments.
+            started (float): The time.perf_counter() value when main.py started importing, to report the
+                time spent on imports with --timing.
+
+        Returns:
+            int: The exit status: 0 if the command succeeded (and, for a change, was saved), 1 otherwise.
+        """
+        clock = time.perf_counter
+        from Storage.storage import ContextManager  # Only imported once the command line was parsed
+
+        imported = clock()
+        command, stores, arguments, _ = cls.subcommands[args.subcommand]
+        parsed = vars(args)
+        command_args = {}
+        for argument in arguments:
+            name = argument.lstrip("-").replace("-", "_")
+            if name in parsed:
+                command_args[name] = parsed[name]
+        with redirect_stdout(sys.stderr):  # The loading messages are not part of the result
+            manager = ContextManager(stores=stores)
+        loaded = clock()
+        try:
+            response = cls(manager).execute({"command": command, "args": command_args})
+            ran = clock()
+            if stores is None:
+                with redirect_stdout(sys.stderr):
+                    saved = manager.save_data()
+                response["ok"] = response["ok"] and saved
+        finally:
+            manager.close()
+        finished = clock()
+        print(json.dumps(response, default=list))
+        if getattr(args, "timing", False):
+            timings = {"import_ms": imported - started, "load_ms": loaded - imported, "command_ms": ran - loaded,
+                       "save_ms": finished - ran, "total_ms": finished - started}
+            print(json.dumps({phase: round(seconds * 1000, 3) for phase, seconds in timings.items()}), file=sys.stderr)
+        return 0 if response["ok"] else 1
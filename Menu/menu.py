@@ -28,7 +28,42 @@ class Menu:
             "11": "check_out_book",
             "12": "check_in_book",
             "13": "track_availability",
-            "14": "exit"
+            "14": "list_user_books",
+            "15": "import_data",
+            "16": "export_data",
+            "17": "show_stats",
+            "18": "list_available_books",
+            "19": "manage_holds",
+            "20": "manage_loans",
+            "21": "check_out_several_books",
+            "22": "check_in_several_books",
+            "23": "exit"
+        }
+        # Action name -> the function performing it with the context manager
+        self.actions = {
+            "add_book": lambda manager: manager.add_book_data(),
+            "update_book": lambda manager: manager.update_book_data(),
+            "delete_book": lambda manager: manager.delete_book_data(),
+            "list_books": lambda manager: manager.get_books_data(),
+            "search_books": lambda manager: print(manager.search_book()),
+            "add_user": lambda manager: manager.add_user_data(),
+            "update_user": lambda manager: manager.update_user_data(),
+            "delete_user": lambda manager: manager.delete_user_data(),
+            "list_users": lambda manager: manager.get_all_users(),
+            "search_users": lambda manager: print(manager.search_user()),
+            "check_out_book": lambda manager: manager.checkout_book(),
+            "check_in_book": lambda manager: manager.checkin_book(),
+            "track_availability": self.show_availability,
+            "list_user_books": lambda manager: print(manager.list_user_books()),
+            "import_data": lambda manager: manager.import_data(),
+            "export_data": lambda manager: manager.export_data(),
+            "show_stats": lambda manager: manager.show_stats(),
+            "list_available_books": lambda manager: manager.list_available_books(),
+            "manage_holds": lambda manager: manager.manage_holds(),
+            "manage_loans": lambda manager: manager.manage_loans(),
+            "check_out_several_books": lambda manager: manager.checkout_books(),
+            "check_in_several_books": lambda manager: manager.checkin_books(),
+            "exit": self.exit_system,
         }
 
     def display_menu(self):
@@ -67,41 +102,31 @@ class Menu:
             input_by_user (str): The action number chosen by the user.
             manager: The context manager object responsible for handling data operations.
         """
-        action = self.allowed_inputs[input_by_user]
-        # Perform the appropriate action based on user input
-        if action == "add_book":
-            manager.add_book_data()
-        elif action == "update_book":
-            manager.update_book_data()
-        elif action == "delete_book":
-            manager.delete_book_data()
-        elif action == "list_books":
-            manager.get_books_data()
-        elif action == "search_books":
-            print(manager.search_book())
-        elif action == "add_user":
-            manager.add_user_data()
-        elif action == "update_user":
-            manager.update_user_data()
-        elif action == "delete_user":
-            manager.delete_user_data()
-        elif action == "list_users":
-            manager.get_all_users()
-        elif action == "search_users":
-            print(manager.search_user())
-        elif action == "check_out_book":
-            manager.checkout_book()
-        elif action == "check_in_book":
-            manager.checkin_book()
-        elif action == "track_availability":
-            # Display the availability status of a book
-            if manager.track_availability():
-                print("Available!")
-            else:
-                print("Not available")
-        elif action == "exit":
-            print("Exiting the system. Goodbye!")
-            exit(0)
+        try:
+            self.actions[self.allowed_inputs[input_by_user]](manager)
+        except OSError as e:  # e.g. the SQLite database stayed locked by another process
+            print(f"The operation failed. Error: {e}")
+
+    @staticmethod
+    def show_availability(manager):
+        """
+        Display the availability status of a book.
+
+        Args:
+            manager: The context manager object responsible for handling data operations.
+        """
+        print("Available!" if manager.track_availability() else "Not available")
+
+    @staticmethod
+    def exit_system(manager):
+        """
+        Leave the Library Management System.
+
+        Args:
+            manager: The context manager object responsible for handling data operations.
+        """
+        print("Exiting the system. Goodbye!")
+        exit(0)
 
     def run(self):
         """
@@ -118,7 +143,7 @@ class Menu:
                 # Verify if the input is valid
                 if self.verify_input(user_input):
                     # Check if the user chose to exit
-                    if user_input == "14":
+                    if self.allowed_inputs[user_input] == "exit":
                         print("Exiting the system. Goodbye!")
                         break
                     # Execute the corresponding action
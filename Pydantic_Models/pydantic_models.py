@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing_extensions import Annotated, TypedDict
 
 
 class UserLoggingData(BaseModel):
@@ -10,7 +11,40 @@ class BookData(BaseModel):
     title: str = ""
     author: str = ""
     isbn: str = ""
+    copies: int = 1
 
 class Assignment(BaseModel):
     isbn: str = ""
     user_id: str = ""
+
+class Hold(BaseModel):
+    isbn: str = ""
+    user_id: str = ""
+    priority: int = 0  # Higher priorities are served first, equal ones in the order they were placed
+
+
+# Plain-dictionary shapes of the stored records, validated in bulk (see Storage/validation.py)
+# without building one model object per record.
+class UserRecord(TypedDict):
+    user_id: str
+    password: str
+    name: str
+
+class BookRecord(TypedDict):
+    title: str
+    author: str
+    isbn: str
+    copies: Annotated[int, Field(ge=1)]
+
+class HoldRecord(TypedDict):
+    hold_id: str
+    isbn: str
+    user_id: str
+    priority: int
+    placed: int
+
+class DueDateRecord(TypedDict):
+    copy: str
+    checked_out: int
+    due: int
+    renewals: Annotated[int, Field(ge=0)]
@@ -0,0 +1,349 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, unquote, urlsplit
+from Menu.batch import BatchRunner
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+           409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error"}
+BOOLEAN_PARAMETERS = ("normalized", "available")
+INTEGER_PARAMETERS = ("limit", "offset", "days")
+
+
+class LibraryService:
+    """
+    An asyncio HTTP/JSON front-end over the ContextManager, so kiosks and the web catalog share one
+    process and one copy of the data. Requests are dispatched to the same commands as the batch mode.
+
+    Reads run directly on the event loop. Mutations are queued to a single writer thread, which
+    serializes them and keeps journal fsyncs and saves off the event loop, so reads never wait
+    for the disk. A read that overlaps a mutation of the same dictionary is simply retried.
+    The reads that would hold the event loop run on reader threads instead: those of the event log,
+    which read its file, and the listings without a limit, which build the whole catalog. So do all
+    the reads with the SQLite backend, which query the database connection the writer holds for the
+    whole of a transaction, so that only they wait.
+
+    Routes:
+        GET    /books?title=|author=|query=[&normalized=1][&limit=N]    search books
+        GET    /books[?order=isbn|title|author][&limit=N][&cursor=|&offset=N]   list books, a page if limit is given
+        GET    /books/{isbn}                                            one book
+        GET    /books?available=1[&order=...][&limit=N][&cursor=|&offset=N]    list the books with a copy available
+        GET    /books/{isbn}/availability                               {"isbn", "available", "copies_available"}
+        POST   /books, PUT /books/{isbn}, DELETE /books/{isbn}          book CRUD
+        GET    /users?name=[&normalized=1]                              search users
+        GET    /users[?order=user_id|name][&limit=N][&cursor=|&offset=N]    list users, a page if limit is given
+        GET    /users/{user_id}, GET /users/{user_id}/books             one user, books held by a user
+        GET    /users/{user_id}/holds                                   books a user waits for, with their position
+        GET    /books/{isbn}/holds                                      {"isbn", "waiting"}: the waiting list
+        POST   /books/{isbn}/holds, DELETE /books/{isbn}/holds/{user_id}    body {"user_id"[, "priority"]}
+        POST   /users, PUT /users/{user_id}, DELETE /users/{user_id}    user CRUD
+        POST   /checkout, POST /checkin, POST /renew                    body {"isbn", "user_id"}
+        POST   /checkout/batch, POST /checkin/batch                     all or nothing, one result per item, body
+                                                                        {["user_id",] "items": [{"isbn"[, "user_id"]}]}
+        GET    /loans/overdue[?limit=N]                                 the overdue loans, most overdue first
+        GET    /loans/due?days=N[&limit=N]                              the loans due in the next N days
+        POST   /save                                                    save every store
+        GET    /stats                                                   operation counts and latencies
+        GET    /stats/cache                                             search cache hits, misses and evictions
+        GET    /stats/events                                            change events published, per subscriber
+        GET    /events[?offset=N][&limit=N]                             {"events", "next_offset"}: the event log
+        GET    /inventory                                               copies, copies on loan and available
+    """
+
+    max_body_bytes = 1 * 2 ** 20  # Larger request bodies are refused
+    read_retries = 5  # Attempts of a read that keeps overlapping concurrent mutations
+    reader_threads = 4  # Threads running the reads kept off the event loop
+    file_reads = ("read_events",)  # Reads of a file
+    unbounded_reads = ("list_books", "list_available_books", "list_users",  # Whole listings unless given a limit
+                       "overdue_loans", "loans_due")
+
+    def __init__(self, manager):
+        """
+        Initializes the service over an already loaded context manager.
+
+        Args:
+            manager: The context manager object responsible for handling data operations.
+        """
+        self.manager = manager
+        self.runner = BatchRunner(manager)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="library-writer")
+        self._reader = ThreadPoolExecutor(max_workers=self.reader_threads, thread_name_prefix="library-reader")
+        self._server = None
+
+    def route(self, method: str, path: str, query: dict, body: dict):
+        """
+        Maps a request onto a batch command.
+
+        Args:
+            method (str): The HTTP method.
+            path (str): The request path, without the query string.
+            query (dict): The query string parameters.
+            body (dict): The decoded JSON body (empty for GET and DELETE).
+
+        Returns:
+            tuple: (command, args, is_mutation, status on success), or None if nothing matches.
+        """
+        parts = [unquote(part) for part in path.strip("/").split("/") if part]
+        if parts[:1] == ["books"]:
+            if len(parts) == 1:
+                if method == "GET":
+                    searched = any(key in query for key in ("title", "author", "query", "isbn"))
+                    if searched:
+                        return "search_books", query, False, 200
+                    return ("list_available_books" if query.get("available") else "list_books"), query, False, 200
+                if method == "POST":
+                    return "add_book", body, True, 201
+            elif len(parts) == 2:
+                if method == "GET":
+                    return "search_books", {"isbn": parts[1]}, False, 200
+                if method == "PUT":
+                    return "update_book", {**body, "isbn": parts[1]}, True, 200
+                if method == "DELETE":
+                    return "delete_book", {"isbn": parts[1]}, True, 200
+            elif len(parts) == 3 and parts[2] == "availability" and method == "GET":
+                return "is_available", {"isbn": parts[1]}, False, 200
+            elif len(parts) == 3 and parts[2] == "holds":
+                if method == "GET":
+                    return "hold_queue", {"isbn": parts[1]}, False, 200
+                if method == "POST":
+                    return "place_hold", {**body, "isbn": parts[1]}, True, 201
+            elif len(parts) == 4 and parts[2] == "holds" and method == "DELETE":
+                return "cancel_hold", {"isbn": parts[1], "user_id": parts[3]}, True, 200
+        elif parts[:1] == ["users"]:
+            if len(parts) == 1:
+                if method == "GET":
+                    return ("search_users" if "name" in query else "list_users"), query, False, 200
+                if method == "POST":
+                    return "add_user", body, True, 201
+            elif len(parts) == 2:
+                if method == "GET":
+                    return "search_users", {"user_id": parts[1]}, False, 200
+                if method == "PUT":
+                    return "update_user", {**body, "user_id": parts[1]}, True, 200
+                if method == "DELETE":
+                    return "delete_user", {"user_id": parts[1]}, True, 200
+            elif len(parts) == 3 and parts[2] == "books" and method == "GET":
+                return "list_user_books", {"user_id": parts[1]}, False, 200
+            elif len(parts) == 3 and parts[2] == "holds" and method == "GET":
+                return "list_user_holds", {"user_id": parts[1]}, False, 200
+        elif len(parts) == 1 and parts[0] in ("checkout", "checkin", "renew", "save") and method == "POST":
+            return parts[0], body, True, 200
+        elif len(parts) == 2 and parts[0] in ("checkout", "checkin") and parts[1] == "batch" and method == "POST":
+            return f"{parts[0]}_many", body, True, 200
+        elif parts == ["loans", "overdue"] and method == "GET":
+            return "overdue_loans", query, False, 200
+        elif parts == ["loans", "due"] and method == "GET":
+            return "loans_due", query, False, 200
+        elif parts == ["stats"] and method == "GET":
+            return "stats", query, False, 200
+        elif parts == ["stats", "cache"] and method == "GET":
+            return "cache_stats", query, False, 200
+        elif parts == ["stats", "events"] and method == "GET":
+            return "event_stats", query, False, 200
+        elif parts == ["events"] and method == "GET":
+            return "read_events", query, False, 200
+        elif parts == ["inventory"] and method == "GET":
+            return "inventory", query, False, 200
+        return None
+
+    async def dispatch(self, method: str, target: str, body: bytes) -> tuple:
+        """
+        Executes one request.
+
+        Args:
+            method (str): The HTTP method.
+            target (str): The request target, path and query string.
+            body (bytes): The raw request body.
+
+        Returns:
+            tuple: (status code, JSON-serializable response body).
+        """
+        url = urlsplit(target)
+        query = dict(parse_qsl(url.query))
+        try:
+            for key in BOOLEAN_PARAMETERS:
+                if key in query:
+                    query[key] = query[key].lower() in ("1", "true", "yes")
+            for key in INTEGER_PARAMETERS:
+                if key in query:
+                    query[key] = int(query[key])
+            payload = json.loads(body) if body.strip() else {}
+            if not isinstance(payload, dict):
+                raise ValueError("the request body must be a JSON object")
+        except ValueError as e:
+            return 400, {"ok": False, "error": f"Invalid request: {e}"}
+        matched = self.route(method, url.path, query, payload)
+        if matched is None:
+            return 404, {"ok": False, "error": f"No route for {method} {url.path}"}
+        command, args, is_mutation, status = matched
+        request = {"command": command, "args": args}
+        if is_mutation:
+            response = await asyncio.get_running_loop().run_in_executor(self._writer, self.runner.execute, request)
+        elif self._off_loop(command, args):
+            response = await asyncio.get_running_loop().run_in_executor(self._reader, self._read, request)
+        else:
+            response = self._read(request)
+        if "error" in response:
+            return 400, response
+        if not response["ok"]:
+            return 409, response
+        if command in ("search_books", "search_users") and not query and not response["result"]:
+            return 404, {**response, "ok": False, "error": "Not found"}  # /books/{isbn} or /users/{user_id}
+        return status, response
+
+    def _off_loop(self, command: str, args: dict) -> bool:
+        """
+        Whether a read runs on a reader thread rather than on the event loop.
+        """
+        if not self.manager._backend.journaled:  # In-memory stores are read without waiting
+            return True
+        return command in self.file_reads or (command in self.unbounded_reads and "limit" not in args)
+
+    def _read(self, request: dict) -> dict:
+        """
+        Runs a read on the event loop or on a reader thread. Iterating a dictionary or index set while
+        the writer thread resizes it raises RuntimeError, and looking up a record the writer thread has
+        just deleted (e.g. a book still in a user's loans) raises KeyError, which the batch command
+        reports as an invalid request; such a read is retried instead of being locked out. The retry
+        sees the record gone, and a KeyError that persists is a missing argument.
+        """
+        for attempt in range(self.read_retries):
+            try:
+                response = self.runner.execute(request)
+            except RuntimeError:
+                if attempt == self.read_retries - 1:
+                    raise
+            else:
+                if attempt == self.read_retries - 1 or not response.get("error", "").startswith("KeyError:"):
+                    return response
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Serves the requests of one connection, keeping it open between requests (HTTP/1.1 keep-alive).
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > self.max_body_bytes:
+                    status, response = 413, {"ok": False, "error": "Request body too large"}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    try:
+                        status, response = await self.dispatch(method.upper(), target, body)
+                    except Exception as e:
+                        status, response = 500, {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                    keep_alive = (headers.get("connection", "").lower() != "close"
+                                  and version.strip().upper() != "HTTP/1.0")
+                payload = json.dumps(response, default=list).encode("utf-8")
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                             f"Content-Type: application/json\r\n"
+                             f"Content-Length: {len(payload)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1")
+                             + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass  # Malformed request line or headers, or the client went away
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080) -> tuple:
+        """
+        Starts listening.
+
+        Args:
+            host (str): The interface to bind.
+            port (int): The port to bind, 0 for any free port.
+
+        Returns:
+            tuple: The (host, port) actually bound.
+        """
+        self._server = await asyncio.start_server(self.handle_connection, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def stop(self) -> None:
+        """
+        Stops accepting connections, waits for queued mutations and saves every store.
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        await asyncio.get_running_loop().run_in_executor(self._writer, self.manager.save_data)
+        self._writer.shutdown(wait=True)
+        self._reader.shutdown(wait=True)
+
+    async def serve_forever(self, host: str = "127.0.0.1", port: int = 8080) -> None:
+        """
+        Starts the service and runs until cancelled (e.g. by Ctrl+C), then stops it cleanly.
+        """
+        bound = await self.start(host, port)
+        print(f"Serving the library on http://{bound[0]}:{bound[1]}")
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+
+class LibraryClient:
+    """
+    A minimal asyncio HTTP/JSON client for the service over one keep-alive connection,
+    for local testing and for scripts running next to the service.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8080):
+        """
+        Args:
+            host (str): The service host.
+            port (int): The service port.
+        """
+        self.host = host
+        self.port = port
+        self._reader = self._writer = None
+
+    async def request(self, method: str, path: str, body: dict = None) -> tuple:
+        """
+        Sends one request and waits for its response.
+
+        Args:
+            method (str): The HTTP method.
+            path (str): The path, with its query string if any.
+            body (dict): The JSON body, if any.
+
+        Returns:
+            tuple: (status code, decoded JSON response).
+        """
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        payload = json.dumps(body).encode("utf-8") if body is not None else b""
+        self._writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                           f"Content-Type: application/json\r\n"
+                           f"Content-Length: {len(payload)}\r\n\r\n".encode("latin-1") + payload)
+        await self._writer.drain()
+        status = int((await self._reader.readline()).split(b" ", 2)[1])
+        headers = {}
+        while (line := await self._reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        content = await self._reader.readexactly(int(headers.get("content-length", 0)))
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, json.loads(content)
+
+    async def close(self) -> None:
+        """
+        Closes the connection.
+        """
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+            self._reader = self._writer = None
@@ -0,0 +1,105 @@
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from typing import MutableMapping
+from Storage.due_dates import DueIndex
+from Storage.holds import HoldQueues
+from Storage.indexing import HashIndex
+from Storage.inventory import Inventory
+
+# Schema of every store: the key field followed by the record fields. The "loans" store maps the
+# ID of a copy of a book (its ISBN for the first copy, see Storage/inventory.py) straight to the ID
+# of the user holding it instead of to a record. The "holds" store keeps the users waiting for a
+# book (see Storage/holds.py), and the "due_dates" store when every loan was made and is due back
+# (see Storage/due_dates.py), under the same copy ID as the loan.
+STORE_FIELDS = {
+    "books": ("isbn", ("title", "author", "isbn", "copies")),
+    "users": ("user_id", ("user_id", "password", "name")),
+    "loans": ("isbn", ("user_id",)),
+    "holds": ("hold_id", ("hold_id", "isbn", "user_id", "priority", "placed")),
+    "due_dates": ("copy", ("copy", "checked_out", "due", "renewals")),
+}
+# The fields holding integers rather than text, with the value given to them in the records
+# stored before the field existed
+INTEGER_FIELDS = {"books": {"copies": 1}, "users": {}, "loans": {}, "holds": {"priority": 0, "placed": 0},
+                  "due_dates": {"checked_out": 0, "due": 0, "renewals": 0}}
+
+
+class StorageBackend(ABC):
+    """
+    Interface between the stores (BookDB, UserDB and the ContextManager's loans, holds and due dates)
+    and the medium they are persisted in. A backend hands out a mutable mapping per store, the
+    secondary indexes over it, and persists the mapping when the stores are saved.
+    """
+
+    name: str = ""
+    journaled: bool = True  # Whether mutations must go through the write-ahead journal to be durable
+    merged_stores: tuple = ()  # Stores reloaded and merged at save time when another process saved them first
+
+    @abstractmethod
+    def load(self, store: str) -> MutableMapping:
+        """
+        Open a store.
+
+        :param store: One of "books", "users", "loans", "holds" or "due_dates".
+        :return: A mutable mapping from record key to record.
+        """
+
+    @abstractmethod
+    def save(self, store: str, data: MutableMapping) -> int:
+        """
+        Persist a store previously opened with load.
+
+        :param store: One of "books", "users", "loans", "holds" or "due_dates".
+        :param data: The mapping returned by load.
+        :return: The number of bytes written.
+        """
+
+    def create_index(self, store: str, field: str, normalize: bool = True):
+        """
+        Create a secondary index (field value -> set of record keys) over a store. The default is an
+        in-memory HashIndex that the caller fills with rebuild() and maintains with add()/discard().
+
+        :param store: One of "books", "users", "loans", "holds" or "due_dates".
+        :param field: The indexed field.
+        :param normalize: Whether case- and whitespace-insensitive lookups are needed.
+        :return: An object with the HashIndex interface.
+        """
+        return HashIndex(normalize)
+
+    def create_inventory(self) -> Inventory:
+        """
+        Create the copy counts and availability of the catalog (see Storage/inventory.py). The default is
+        an in-memory Inventory that counts the loans when they are loaded and is maintained on every loan.
+
+        :return: An object with the Inventory interface.
+        """
+        return Inventory()
+
+    def create_hold_queues(self) -> HoldQueues:
+        """
+        Create the waiting lists of the books. The default is an in-memory HoldQueues that the caller
+        fills with rebuild() and maintains with add()/discard().
+
+        :return: An object with the HoldQueues interface.
+        """
+        return HoldQueues()
+
+    def create_due_index(self) -> DueIndex:
+        """
+        Create the index of the loans by due date. The default is an in-memory DueIndex that the caller
+        fills with rebuild() and maintains with add()/discard().
+
+        :return: An object with the DueIndex interface.
+        """
+        return DueIndex()
+
+    def transaction(self):
+        """
+        :return: A context manager making the enclosed mutations atomic, where the backend supports it.
+        """
+        return nullcontext()
+
+    def close(self) -> None:
+        """
+        Release any resources held by the backend.
+        """
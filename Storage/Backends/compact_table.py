@@ -0,0 +1,172 @@
+from array import array
+from collections.abc import ItemsView, MutableMapping, ValuesView
+
+
+class CompactTable(MutableMapping):
+    """
+    A memory-compact, dictionary-like store of records with a fixed set of fields.
+
+    Instead of one dict per record, every field is kept in a column indexed by row number,
+    the record key is not stored a second time as a field, and fields with many repeated
+    values (such as authors) are dictionary-encoded: the column holds 4-byte codes into a
+    list of distinct values. Records are rebuilt as plain dicts on access, so callers see
+    the same records as with a dictionary of dicts.
+    """
+
+    def __init__(self, key_field: str, fields: tuple, encoded_fields: tuple = ()):
+        """
+        :param key_field: The record field used as the key, e.g. "isbn".
+        :param fields: Every record field, in the order records are rebuilt with.
+        :param encoded_fields: The fields to dictionary-encode.
+        """
+        self._key_field = key_field
+        self._fields = fields
+        self._rows: dict = {}  # key -> row number, in insertion order
+        self._free: list = []  # row numbers released by deletions, reused by insertions
+        self._row_count = 0  # Number of allocated rows, live or free
+        self._columns: dict = {}  # field -> list of values, or array of codes for encoded fields
+        self._dictionaries: dict = {}  # encoded field -> (list of distinct values, value -> code)
+        for field in fields:
+            if field == key_field:
+                continue
+            if field in encoded_fields:
+                self._columns[field] = array("I")
+                self._dictionaries[field] = ([], {})
+            else:
+                self._columns[field] = []
+
+    @classmethod
+    def from_mapping(cls, records: dict, key_field: str, fields: tuple, encoded_fields: tuple = ()) -> "CompactTable":
+        """
+        Build a table from a dictionary of records.
+
+        :param records: A dictionary mapping keys to record dictionaries.
+        :param key_field: The record field used as the key.
+        :param fields: Every record field.
+        :param encoded_fields: The fields to dictionary-encode.
+        :return: The populated table.
+        """
+        table = cls(key_field, fields, encoded_fields)
+        for key, record in records.items():
+            table[key] = record
+        return table
+
+    @classmethod
+    def from_columns(cls, keys: list, columns: dict, key_field: str, fields: tuple) -> "CompactTable":
+        """
+        Build a table straight from columns, such as those of a snapshot file, without building any record.
+
+        :param keys: The record keys.
+        :param columns: A dictionary mapping every field but the key field to either the list of its
+                        values, or a (distinct values, array of codes) tuple for dictionary-encoded fields.
+        :param key_field: The record field used as the key.
+        :param fields: Every record field.
+        :return: The populated table, with the tuple columns dictionary-encoded.
+        """
+        table = cls(key_field, fields, tuple(field for field, column in columns.items() if isinstance(column, tuple)))
+        table._rows = dict(zip(keys, range(len(keys))))
+        table._row_count = len(keys)
+        for field, column in columns.items():
+            if isinstance(column, tuple):
+                values, codes = column
+                table._columns[field] = codes
+                table._dictionaries[field] = (values, {value: code for code, value in enumerate(values)})
+            else:
+                table._columns[field] = column
+        return table
+
+    def to_columns(self) -> tuple:
+        """
+        Export the table as columns, the inverse of from_columns.
+
+        :return: (keys, columns), the keys in insertion order and the columns in the same order. The columns
+                 may be the table's own, so they must be consumed before the table is modified again.
+        """
+        keys, rows = list(self._rows), list(self._rows.values())
+        in_place = rows == list(range(self._row_count))  # No deletion left a hole or reordered the rows
+        columns = {}
+        for field, column in self._columns.items():
+            if not in_place:
+                column = array("I", [column[row] for row in rows]) if field in self._dictionaries \
+                    else [column[row] for row in rows]
+            columns[field] = (self._dictionaries[field][0], column) if field in self._dictionaries else column
+        return keys, columns
+
+    def field_items(self, field: str):
+        """
+        Iterate over the (value, key) pairs of a field without rebuilding the records, for index builds.
+
+        :param field: A record field other than the key field.
+        :return: An iterator of (field value, record key) tuples.
+        """
+        values = map(self._columns[field].__getitem__, self._rows.values())  # No Python frame per record
+        if field in self._dictionaries:
+            values = map(self._dictionaries[field][0].__getitem__, values)
+        return zip(values, self._rows)
+
+    def _encode(self, field: str, value: str) -> int:
+        values, codes = self._dictionaries[field]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def __getitem__(self, key: str) -> dict:
+        row = self._rows[key]
+        record = {}
+        for field in self._fields:
+            if field == self._key_field:
+                record[field] = key
+            elif field in self._dictionaries:
+                record[field] = self._dictionaries[field][0][self._columns[field][row]]
+            else:
+                record[field] = self._columns[field][row]
+        return record
+
+    def __setitem__(self, key: str, record: dict) -> None:
+        row = self._rows.get(key)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                row, self._row_count = self._row_count, self._row_count + 1
+                for field, column in self._columns.items():
+                    column.append(0 if field in self._dictionaries else None)
+            self._rows[key] = row
+        for field, column in self._columns.items():
+            column[row] = self._encode(field, record[field]) if field in self._dictionaries else record[field]
+
+    def __delitem__(self, key: str) -> None:
+        row = self._rows.pop(key)
+        for field, column in self._columns.items():
+            if field not in self._dictionaries:
+                column[row] = None  # Release the value; encoded codes are simply overwritten on reuse
+        self._free.append(row)
+
+    def __contains__(self, key) -> bool:
+        return key in self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def items(self):
+        return _CompactItemsView(self)
+
+    def values(self):
+        return _CompactValuesView(self)
+
+
+class _CompactItemsView(ItemsView):
+    def __iter__(self):
+        table = self._mapping
+        return ((key, table[key]) for key in table._rows)
+
+
+class _CompactValuesView(ValuesView):
+    def __iter__(self):
+        table = self._mapping
+        return (table[key] for key in table._rows)
@@ -0,0 +1,70 @@
+import json
+from itertools import islice
+from typing import MutableMapping
+from Storage.Backends.base_backend import STORE_FIELDS, StorageBackend
+from Storage.Backends.compact_table import CompactTable
+from Storage.coordination import write_atomically
+from Storage.validation import validate_store
+
+# Fields with many repeated values, dictionary-encoded by the compact record representation
+ENCODED_FIELDS = {"books": ("author",), "users": ("name",)}
+# Number of records encoded and written together when saving
+WRITE_BATCH = 10000
+
+
+class JSONBackend(StorageBackend):
+    """
+    The original storage: every store is a plain dictionary loaded whole from a JSON file
+    and written back whole on save. Durability between saves comes from the journal.
+    With compact=True books and users are held in CompactTables instead of dicts of dicts.
+    """
+
+    name = "json"
+    journaled = True
+    merged_stores = ("books", "users", "loans", "holds", "due_dates")
+
+    def __init__(self, paths: dict, compact: bool = False):
+        """
+        :param paths: A dictionary mapping store names to their JSON file paths.
+        :param compact: Keep book and user records in the compact columnar representation.
+        """
+        self.paths = paths
+        self.compact = compact
+
+    def load(self, store: str) -> MutableMapping:
+        """
+        Read a store from its JSON file and validate it (see validate_store).
+
+        :param store: One of "books", "users", "loans", "holds" or "due_dates".
+        :return: The store content, or an empty dictionary if the file is empty.
+        :raises FileNotFoundError: If the file does not exist.
+        :raises json.JSONDecodeError: If the file is not valid JSON.
+        """
+        with open(self.paths[store], "r") as fp:
+            content = fp.read()
+        data = json.loads(content) if content.strip() else {}  # Check if the file content is not empty
+        data = validate_store(store, data, self.paths[store])
+        if self.compact and store in ENCODED_FIELDS:
+            key_field, fields = STORE_FIELDS[store]
+            return CompactTable.from_mapping(data, key_field, fields, ENCODED_FIELDS[store])
+        return data
+
+    def save(self, store: str, data: MutableMapping) -> int:
+        """
+        Write a store to its JSON file, atomically: a reader never sees a half-written file.
+        Every record is written on its own line by the C JSON encoder, which is much faster than
+        an indented dump of the whole store and still easy to read.
+
+        :param store: One of "books", "users", "loans", "holds" or "due_dates".
+        :param data: The store content.
+        :return: The number of bytes written.
+        """
+        encode = json.JSONEncoder().encode
+
+        def write(fp):
+            lines = (f"\n    {encode(key)}: {encode(record)}" for key, record in data.items())
+            fp.write("{")
+            for position, batch in enumerate(iter(lambda: list(islice(lines, WRITE_BATCH)), [])):
+                fp.write(("," if position else "") + ",".join(batch))
+            fp.write("\n}")
+        return write_atomically(self.paths[store], write)
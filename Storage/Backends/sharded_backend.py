@@ -0,0 +1,273 @@
+import json
+import os
+import sys
+import threading
+import zlib
+from collections import OrderedDict
+from collections.abc import ItemsView, MutableMapping, ValuesView
+from Storage.Backends.json_backend import JSONBackend
+from Storage.indexing import LazyIndex
+from Storage.validation import validate_store
+
+
+class ShardedBackend(JSONBackend):
+    """
+    Keeps the book catalog in many small JSON shard files, bucketed by a hash of the ISBN, while
+    the other stores stay in their JSON files. Shards are read on first access and kept in an LRU
+    cache with a memory budget; dirty shards are written back when evicted or saved. Startup cost
+    and memory therefore stay bounded however large the catalog grows.
+    """
+
+    name = "sharded"
+    journaled = True
+    merged_stores = ("users", "loans", "holds", "due_dates")  # Shards are written whole and atomically, but not merged
+
+    def __init__(self, paths: dict, shards_path: str, shard_count: int = 256, cache_bytes: int = 64 * 2 ** 20):
+        """
+        :param paths: A dictionary mapping store names to their JSON file paths. The "books" file is
+                      only read to migrate an existing catalog into shards.
+        :param shards_path: The directory holding the book shards.
+        :param shard_count: The number of shards for a new catalog (an existing one keeps its own).
+        :param cache_bytes: The approximate memory budget of the shard cache, in bytes.
+        """
+        super().__init__(paths)
+        self.shards_path = shards_path
+        self.shard_count = shard_count
+        self.cache_bytes = cache_bytes
+
+    def load(self, store: str) -> MutableMapping:
+        """
+        Open a store: the book catalog as a ShardedTable, the others from their JSON files.
+
+        :param store: One of "books", "users", "loans", "holds" or "due_dates".
+        :return: The store content.
+        """
+        if store != "books":
+            return super().load(store)
+        table = ShardedTable(self.shards_path, self.shard_count, self.cache_bytes)
+        if table.is_new and os.path.exists(self.paths.get("books", "")):
+            print("Migrating the book catalog into shards...")
+            table.bulk_load(super().load("books"))
+        return table
+
+    def save(self, store: str, data: MutableMapping) -> int:
+        """
+        Persist a store: only the dirty shards of the book catalog are written.
+
+        :param store: One of "books", "users", "loans", "holds" or "due_dates".
+        :param data: The mapping returned by load.
+        :return: The number of bytes written.
+        """
+        if store == "books":
+            return data.flush()
+        return super().save(store, data)
+
+    def create_index(self, store: str, field: str, normalize: bool = True):
+        """
+        Book indexes are built on their first lookup instead of scanning every shard at startup.
+        """
+        if store == "books":
+            return LazyIndex(normalize)
+        return super().create_index(store, field, normalize)
+
+
+def _record_size(key: str, record: dict) -> int:
+    """
+    Estimate the memory held by a cached record.
+    """
+    return (sys.getsizeof(key) + sys.getsizeof(record)
+            + sum(sys.getsizeof(field) + sys.getsizeof(value) for field, value in record.items()))
+
+
+class ShardedTable(MutableMapping):
+    """
+    A dictionary-like view of the sharded book catalog. A manifest stores the shard count and
+    the number of records in each shard, so len() never needs to read a shard.
+    """
+
+    def __init__(self, path: str, shard_count: int, cache_bytes: int):
+        """
+        :param path: The directory holding the shards and their manifest.
+        :param shard_count: The number of shards if the directory holds no catalog yet.
+        :param cache_bytes: The approximate memory budget of the shard cache, in bytes.
+        """
+        self._path = path
+        self._cache_bytes = cache_bytes
+        self._cache: OrderedDict = OrderedDict()  # shard number -> {ISBN: book}, least recently used first
+        self._sizes: dict = {}  # shard number -> estimated bytes held in the cache
+        self._cached_bytes = 0  # Sum of _sizes
+        self._dirty: set = set()  # shard numbers modified since they were last written
+        self._lock = threading.RLock()  # Reads reorder and evict cached shards too, so they take it as well
+        os.makedirs(path, exist_ok=True)
+        try:
+            with open(self._manifest_path, "r") as fp:
+                manifest = json.load(fp)
+            self.is_new = False
+        except FileNotFoundError:
+            manifest = {"shard_count": shard_count, "counts": [0] * shard_count}
+            self.is_new = True
+        self._shard_count = manifest["shard_count"]
+        self._counts = manifest["counts"]
+
+    @property
+    def _manifest_path(self) -> str:
+        return os.path.join(self._path, "manifest.json")
+
+    def _shard_path(self, number: int) -> str:
+        return os.path.join(self._path, f"shard-{number:05d}.json")
+
+    def _bucket(self, isbn: str) -> int:
+        return zlib.crc32(isbn.encode("utf-8")) % self._shard_count  # Stable across runs, unlike hash()
+
+    def _shard(self, number: int) -> dict:
+        """
+        Return a shard from the cache, reading it from disk and evicting others if needed.
+        """
+        with self._lock:
+            shard = self._cache.get(number)
+            if shard is not None:
+                self._cache.move_to_end(number)
+                return shard
+            shard = {}
+            if self._counts[number]:
+                with open(self._shard_path(number), "r") as fp:
+                    shard = validate_store("books", json.load(fp), self._shard_path(number))
+                if len(shard) != self._counts[number]:  # Invalid records were set aside
+                    self._counts[number] = len(shard)
+                    self._dirty.add(number)
+            self._cache[number] = shard
+            self._resize(number, sum(_record_size(isbn, book) for isbn, book in shard.items()))
+            self._evict()
+            return shard
+
+    def _evict(self) -> None:
+        """
+        Drop least recently used shards, writing back dirty ones, until the cache fits its budget.
+        The most recently used shard always stays.
+        """
+        while len(self._cache) > 1 and self._cached_bytes > self._cache_bytes:
+            number, shard = self._cache.popitem(last=False)
+            if number in self._dirty:
+                self._write_shard(number, shard)
+            self._cached_bytes -= self._sizes.pop(number)
+
+    def _resize(self, number: int, delta: int) -> None:
+        self._sizes[number] = self._sizes.get(number, 0) + delta
+        self._cached_bytes += delta
+
+    def _write_shard(self, number: int, shard: dict) -> int:
+        temp_path = self._shard_path(number) + ".tmp"
+        with open(temp_path, "w") as fp:
+            json.dump(shard, fp, separators=(",", ":"))
+            written = fp.tell()
+        os.replace(temp_path, self._shard_path(number))
+        self._dirty.discard(number)
+        return written
+
+    def flush(self) -> int:
+        """
+        Write every dirty shard and the manifest to disk.
+
+        :return: The number of bytes written.
+        """
+        with self._lock:
+            written = sum(self._write_shard(number, self._cache[number]) for number in list(self._dirty))
+            temp_path = self._manifest_path + ".tmp"
+            with open(temp_path, "w") as fp:
+                json.dump({"shard_count": self._shard_count, "counts": self._counts}, fp)
+                written += fp.tell()
+            os.replace(temp_path, self._manifest_path)
+            self.is_new = False
+            return written
+
+    def bulk_load(self, books: dict) -> None:
+        """
+        Fill an empty catalog by grouping the books per shard and writing every shard once,
+        instead of going through the cache record by record.
+
+        :param books: A dictionary of ISBNs and corresponding book data.
+        """
+        shards = [{} for _ in range(self._shard_count)]
+        for isbn, book in books.items():
+            shards[self._bucket(isbn)][isbn] = book
+        for number, shard in enumerate(shards):
+            self._write_shard(number, shard)
+            self._counts[number] = len(shard)
+        self.flush()
+
+    def fetch_many(self, isbns) -> dict:
+        """
+        Look up several books, visiting each shard once rather than once per book.
+
+        :param isbns: An iterable of ISBNs present in the catalog.
+        :return: A dictionary of ISBNs and corresponding book data, in the order they were given.
+        """
+        with self._lock:
+            isbns = list(isbns)
+            buckets: dict = {}
+            for isbn in isbns:
+                buckets.setdefault(self._bucket(isbn), []).append(isbn)
+            found = {}
+            for number, members in buckets.items():
+                shard = self._shard(number)
+                for isbn in members:
+                    found[isbn] = shard[isbn]
+            return {isbn: found[isbn] for isbn in isbns}
+
+    def __getitem__(self, isbn: str) -> dict:
+        return self._shard(self._bucket(isbn))[isbn]
+
+    def __setitem__(self, isbn: str, book: dict) -> None:
+        number = self._bucket(isbn)
+        with self._lock:
+            shard = self._shard(number)
+            previous = shard.get(isbn)
+            if previous is None:
+                self._counts[number] += 1
+            else:
+                self._resize(number, -_record_size(isbn, previous))
+            shard[isbn] = book
+            self._resize(number, _record_size(isbn, book))
+            self._dirty.add(number)
+            self._evict()
+
+    def __delitem__(self, isbn: str) -> None:
+        number = self._bucket(isbn)
+        with self._lock:
+            book = self._shard(number).pop(isbn)
+            self._counts[number] -= 1
+            self._resize(number, -_record_size(isbn, book))
+            self._dirty.add(number)
+
+    def __contains__(self, isbn) -> bool:
+        return isinstance(isbn, str) and isbn in self._shard(self._bucket(isbn))
+
+    def __iter__(self):
+        return (isbn for isbn, _ in self._iter_items())
+
+    def __len__(self) -> int:
+        return sum(self._counts)
+
+    def items(self):
+        return _ShardedItemsView(self)
+
+    def values(self):
+        return _ShardedValuesView(self)
+
+    def _iter_items(self):
+        """
+        Walk the shards one at a time through the cache, so memory stays within the budget.
+        """
+        for number in range(self._shard_count):
+            if self._counts[number]:
+                yield from list(self._shard(number).items())
+
+
+class _ShardedItemsView(ItemsView):
+    def __iter__(self):
+        return self._mapping._iter_items()
+
+
+class _ShardedValuesView(ValuesView):
+    def __iter__(self):
+        return (book for _, book in self._mapping._iter_items())
@@ -0,0 +1,58 @@
+from typing import MutableMapping
+from Storage.Backends.base_backend import STORE_FIELDS
+from Storage.Backends.compact_table import CompactTable
+from Storage.Backends.json_backend import ENCODED_FIELDS, JSONBackend
+from Storage.Backends.snapshot_format import (columns_from_records, read_snapshot, records_from_columns,
+                                              snapshot_path, write_snapshot)
+
+
+class SnapshotBackend(JSONBackend):
+    """
+    Keeps every store in a binary, columnar snapshot file (see snapshot_format.py) next to its JSON
+    file, for a fast cold start. A store without a snapshot file yet is read from its JSON file and
+    written as a snapshot by the next save, so switching an existing library over needs no step.
+
+    With compact=True, books and users are held in CompactTables built straight from the snapshot
+    columns, so loading creates no per-record dictionary at all.
+    """
+
+    name = "snapshot"
+
+    def __init__(self, paths: dict, compact: bool = True, compression: str = "zlib"):
+        """
+        :param paths: A dictionary mapping store names to their JSON file paths; the snapshot files
+                      share their names, with the .snap extension.
+        :param compact: Keep book and user records in the compact columnar representation.
+        :param compression: The compression of the snapshot files: "none", "zlib", "bz2" or "lzma".
+        """
+        super().__init__(paths, compact)
+        self.compression = compression
+
+    def load(self, store: str) -> MutableMapping:
+        """
+        Read a store from its snapshot file, or from its JSON file if it has no snapshot yet.
+
+        :param store: One of "books", "users", "loans", "holds" or "due_dates".
+        :return: The store content.
+        :raises FileNotFoundError: If neither file exists.
+        :raises ValueError: If the snapshot file is corrupted.
+        """
+        try:
+            _, keys, columns = read_snapshot(snapshot_path(self.paths[store]))
+        except FileNotFoundError:
+            return super().load(store)
+        if self.compact and store in ENCODED_FIELDS:
+            key_field, fields = STORE_FIELDS[store]
+            return CompactTable.from_columns(keys, columns, key_field, fields)
+        return records_from_columns(store, keys, columns)
+
+    def save(self, store: str, data: MutableMapping) -> int:
+        """
+        Write a store to its snapshot file, atomically.
+
+        :param store: One of "books", "users", "loans", "holds" or "due_dates".
+        :param data: The store content.
+        :return: The number of bytes written.
+        """
+        return write_snapshot(snapshot_path(self.paths[store]), store, *columns_from_records(store, data),
+                              self.compression)
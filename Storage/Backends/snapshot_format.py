@@ -0,0 +1,272 @@
+"""
+Binary, columnar snapshot files for the stores, and a converter to and from the JSON files.
+
+A snapshot file is the 8-byte magic, one byte naming the compression, then the (possibly compressed)
+payload: a one-line JSON header followed by the column blobs, whose sizes the header lists.
+Every column holds one field for all records, in key order:
+
+- "text": the values joined by NUL characters and UTF-8 encoded, split back in one call on load
+  ("json" instead, a JSON array, in the rare case a value contains a NUL character);
+- "dict": dictionary encoding for fields with many repeated values (authors, user names, loan
+  holders, held books): the distinct values as a "text" blob followed by one 4-byte code per record;
+- "int": one 8-byte signed integer per record, for the integer fields (a book's number of copies,
+  a hold's priority and time, a loan's dates and renewals).
+  Files written before such a field existed load with its default value.
+
+Record keys are a "text" column of their own, and a field equal to the key (a book's ISBN, a user's
+ID) is not stored again. Loading therefore decodes a few large blobs instead of parsing one JSON
+object per record, and the columns can be handed to a CompactTable without building any record.
+
+    python -m Storage.Backends.snapshot_format to-snapshot [--compression zlib]   # JSON files -> .snap
+    python -m Storage.Backends.snapshot_format to-json                            # .snap -> JSON files
+
+"""
+
+import argparse
+import bz2
+import json
+import lzma
+import os
+import sys
+import zlib
+from array import array
+from typing import MutableMapping
+
+from Storage.Backends.base_backend import INTEGER_FIELDS, STORE_FIELDS
+from Storage.coordination import write_atomically
+from Storage.validation import validate_store
+
+MAGIC = b"LIBSNAP\x01"
+SEPARATOR = "\x00"
+# Compression codecs: name -> (code byte, compress, decompress)
+CODECS = {
+    "none": (0, lambda data: data, lambda data: data),
+    "zlib": (1, lambda data: zlib.compress(data, 1), zlib.decompress),
+    "bz2": (2, lambda data: bz2.compress(data, 9), bz2.decompress),
+    "lzma": (3, lambda data: lzma.compress(data, preset=1), lzma.decompress),
+}
+# Fields dictionary-encoded in the snapshot files ("loans" maps a key straight to its user_id value)
+DICTIONARY_FIELDS = {"books": ("author",), "users": ("name",), "loans": ("user_id",), "holds": ("isbn",),
+                     "due_dates": ()}
+
+
+def _encode_text(values: list) -> tuple:
+    joined = SEPARATOR.join(values)
+    if joined.count(SEPARATOR) == max(len(values) - 1, 0):
+        return "text", joined.encode("utf-8")
+    return "json", json.dumps(values).encode("utf-8")  # A value contains the separator itself
+
+
+def _decode_text(encoding: str, blob: memoryview, count: int) -> list:
+    text = str(blob, "utf-8")
+    if encoding == "json":
+        values = json.loads(text)
+        if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+            raise ValueError("a text column holds values that are not text")
+        return values
+    return text.split(SEPARATOR) if count else []
+
+
+def _encode_dictionary(values: list) -> tuple:
+    """
+    :return: (distinct values, array of the code of every value).
+    """
+    codes_by_value = {}
+    codes = array("I", [codes_by_value.setdefault(value, len(codes_by_value)) for value in values])
+    return list(codes_by_value), codes
+
+
+def write_snapshot(path: str, store: str, keys: list, columns: dict, compression: str = "zlib") -> int:
+    """
+    Write a store as a snapshot file, atomically.
+
+    :param path: The snapshot file.
+    :param store: One of "books", "users", "loans", "holds" or "due_dates".
+    :param keys: The record keys.
+    :param columns: A dictionary mapping every stored field to either the list of its values (one per key)
+                    or, for the fields of DICTIONARY_FIELDS, a (distinct values, array of codes) tuple.
+                    The values of the fields of INTEGER_FIELDS are integers, all the others text.
+    :param compression: One of "none", "zlib", "bz2" or "lzma".
+    :return: The number of bytes written.
+    """
+    code, compress, _ = CODECS[compression]
+    header = {"store": store, "count": len(keys), "byteorder": sys.byteorder, "columns": []}
+    blobs = []
+    for field, column in [("", keys)] + list(columns.items()):
+        if isinstance(column, tuple):
+            distinct, codes = column
+            encoding, blob = _encode_text(distinct)
+            header["columns"].append({"field": field, "encoding": "dict", "values": encoding,
+                                      "distinct": len(distinct), "size": len(blob), "codes": len(codes) * 4})
+            blobs += [blob, codes.tobytes()]
+        elif field in INTEGER_FIELDS[store]:
+            blob = array("q", column).tobytes()
+            header["columns"].append({"field": field, "encoding": "int", "size": len(blob)})
+            blobs.append(blob)
+        else:
+            encoding, blob = _encode_text(column)
+            header["columns"].append({"field": field, "encoding": encoding, "size": len(blob)})
+            blobs.append(blob)
+    payload = compress(json.dumps(header).encode("utf-8") + b"\n" + b"".join(blobs))
+    return write_atomically(path, lambda fp: fp.write(MAGIC + bytes([code]) + payload), binary=True)
+
+
+def read_snapshot(path: str) -> tuple:
+    """
+    Read a snapshot file.
+
+    :param path: The snapshot file.
+    :return: (store name, keys, columns) with the columns as accepted by write_snapshot.
+    :raises FileNotFoundError: If the file does not exist.
+    :raises ValueError: If the file is not a snapshot or is corrupted. Every column is checked to hold
+                        one text value per record, so the records need no further validation.
+    """
+    with open(path, "rb") as fp:
+        content = fp.read()
+    if content[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a library snapshot file")
+    decompress = next((codec[2] for codec in CODECS.values() if codec[0] == content[len(MAGIC)]), None)
+    if decompress is None:
+        raise ValueError(f"{path} uses an unknown compression")
+    try:
+        payload = decompress(content[len(MAGIC) + 1:])
+    except (zlib.error, OSError, lzma.LZMAError) as e:
+        raise ValueError(f"{path} is corrupted: {e}") from e
+    del content
+    view = memoryview(payload)  # Columns are decoded straight from the payload, without copies
+    header_end = payload.index(b"\n")
+    header = json.loads(payload[:header_end])
+    count, position, columns, keys = header["count"], header_end + 1, {}, None
+    for column in header["columns"]:
+        blob = view[position:position + column["size"]]
+        position += column["size"]
+        if column["encoding"] == "dict":
+            distinct = _decode_text(column["values"], blob, column["distinct"])
+            codes = array("I")
+            codes.frombytes(view[position:position + column["codes"]])
+            position += column["codes"]
+            if header["byteorder"] != sys.byteorder:
+                codes.byteswap()
+            value = (distinct, codes)
+            if len(codes) != count or (codes and max(codes) >= len(distinct)):
+                raise ValueError(f"{path} is corrupted: column '{column['field']}' has invalid codes")
+        elif column["encoding"] == "int":
+            integers = array("q")
+            integers.frombytes(blob)
+            if header["byteorder"] != sys.byteorder:
+                integers.byteswap()
+            value = integers.tolist()
+            if len(value) != count:
+                raise ValueError(f"{path} is corrupted: column '{column['field']}' has {len(value)} values")
+        else:
+            value = _decode_text(column["encoding"], blob, count)
+            if len(value) != count:
+                raise ValueError(f"{path} is corrupted: column '{column['field']}' has {len(value)} values")
+        if column["field"]:
+            columns[column["field"]] = value
+        else:
+            keys = value
+    if position != len(payload) or keys is None or len(keys) != count:
+        raise ValueError(f"{path} is corrupted: the columns do not match the header")
+    for field, default in INTEGER_FIELDS.get(header["store"], {}).items():
+        columns.setdefault(field, [default] * count)  # Written before the field existed
+    return header["store"], keys, columns
+
+
+def columns_from_records(store: str, data: MutableMapping) -> tuple:
+    """
+    Split a store into columns. CompactTables hand over their columns directly.
+
+    :param store: One of "books", "users", "loans", "holds" or "due_dates".
+    :param data: The store content.
+    :return: (keys, columns) as accepted by write_snapshot.
+    """
+    to_columns = getattr(data, "to_columns", None)
+    if to_columns is not None:
+        keys, columns = to_columns()
+    elif store == "loans":
+        keys, columns = list(data), {"user_id": list(data.values())}
+    else:
+        key_field, fields = STORE_FIELDS[store]
+        records = list(data.values())
+        keys = list(data)
+        columns = {field: [record[field] for record in records] for field in fields if field != key_field}
+    for field in DICTIONARY_FIELDS[store]:
+        if not isinstance(columns[field], tuple):
+            columns[field] = _encode_dictionary(columns[field])
+    return keys, columns
+
+
+def records_from_columns(store: str, keys: list, columns: dict) -> dict:
+    """
+    Rebuild a plain dictionary store from its columns.
+
+    :param store: One of "books", "users", "loans", "holds" or "due_dates".
+    :param keys: The record keys.
+    :param columns: The columns, as returned by read_snapshot.
+    :return: A dictionary mapping keys to records (to user IDs for the loans).
+    """
+    values = {}
+    for field, column in columns.items():
+        if isinstance(column, tuple):
+            distinct, codes = column
+            column = [distinct[code] for code in codes]
+        values[field] = column
+    if store == "loans":
+        return dict(zip(keys, values["user_id"]))
+    key_field, fields = STORE_FIELDS[store]
+    rows = zip(*[keys if field == key_field else values[field] for field in fields])
+    return {key: dict(zip(fields, row)) for key, row in zip(keys, rows)}
+
+
+def snapshot_path(json_path: str) -> str:
+    """
+    :return: The snapshot file kept next to a JSON store file.
+    """
+    return os.path.splitext(json_path)[0] + ".snap"
+
+
+def json_to_snapshot(json_path: str, store: str, compression: str = "zlib") -> int:
+    """
+    Convert a JSON store file into a snapshot file next to it, validating it first (see validate_store).
+
+    :return: The size of the snapshot file, in bytes.
+    """
+    with open(json_path, "r") as fp:
+        content = fp.read()
+    data = validate_store(store, json.loads(content) if content.strip() else {}, json_path)
+    return write_snapshot(snapshot_path(json_path), store, *columns_from_records(store, data), compression)
+
+
+def snapshot_to_json(json_path: str, store: str) -> int:
+    """
+    Convert the snapshot file next to a JSON store file back into the JSON file.
+
+    :return: The size of the JSON file, in bytes.
+    """
+    from Storage.Backends.json_backend import JSONBackend
+
+    _, keys, columns = read_snapshot(snapshot_path(json_path))
+    return JSONBackend({store: json_path}).save(store, records_from_columns(store, keys, columns))
+
+
+if __name__ == "__main__":
+    from Storage.BookDB.book_storage_handling import BookDB
+    from Storage.UserDB.user_storage_handling import UserDB
+    from Storage.storage import ContextManager
+
+    parser = argparse.ArgumentParser(description="Convert the library stores between JSON and snapshot files")
+    parser.add_argument("direction", choices=["to-snapshot", "to-json"])
+    parser.add_argument("--compression", choices=list(CODECS), default="zlib")
+    parser.add_argument("--books", default=BookDB._dbpath, help="JSON file of the books")
+    parser.add_argument("--users", default=UserDB._dbpath, help="JSON file of the users")
+    parser.add_argument("--loans", default=ContextManager._assignment_path, help="JSON file of the loans")
+    parser.add_argument("--holds", default=ContextManager._holds_path, help="JSON file of the holds")
+    parser.add_argument("--due-dates", default=ContextManager._due_dates_path, help="JSON file of the due dates")
+    args = parser.parse_args()
+    for store in ("books", "users", "loans", "holds", "due_dates"):
+        path = getattr(args, store)
+        if args.direction == "to-snapshot":
+            print(f"{path} -> {snapshot_path(path)}: {json_to_snapshot(path, store, args.compression)} bytes")
+        else:
+            print(f"{snapshot_path(path)} -> {path}: {snapshot_to_json(path, store)} bytes")
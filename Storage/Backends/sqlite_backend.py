@@ -0,0 +1,548 @@
+import sqlite3
+import threading
+from collections.abc import ItemsView, MutableMapping, ValuesView
+from contextlib import contextmanager
+from functools import partial
+from typing import Optional
+from Storage.Backends.base_backend import INTEGER_FIELDS, STORE_FIELDS, StorageBackend
+from Storage.indexing import normalize_key
+from Storage.inventory import COPY_SEPARATOR, copy_id, copy_isbn
+
+# Fields holding an additional normalized column for case- and whitespace-insensitive lookups
+NORMALIZED_FIELDS = {"books": ("title", "author"), "users": ("name",), "loans": (), "holds": (), "due_dates": ()}
+# Fields with an SQL index, used by the secondary index lookups, the waiting lists and the due date ranges
+INDEXED_FIELDS = {"books": ("title", "author"), "users": ("name",), "loans": ("user_id",),
+                  "holds": ("isbn", "user_id"), "due_dates": ("due",)}
+# PRAGMA user_version of a database whose stores were imported from the JSON files, or found not empty
+IMPORTED_VERSION = 1
+
+
+class SQLiteError(OSError):
+    """
+    A failed statement of the SQLite database, most often "database is locked" when another process
+    holds it for longer than the connection's timeout. It is an OSError, so that the batch commands,
+    the one-shot commands and the service report it like any other failed read or write of the stores.
+    """
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Stores books, users, loans, holds and due dates in SQLite tables (stdlib sqlite3). Nothing is loaded at startup:
+    every store is a mapping that queries its table on access, secondary lookups use SQL indexes,
+    and each mutation is committed immediately, so the journal is not needed. SQLite's own locking
+    already lets several processes share the database, so nothing is merged at save time; for the
+    same reason the availability of the copies is read from the tables rather than counted in memory.
+
+    A new database is filled from the JSON files of the stores, if there are any, so that switching
+    an existing library to SQLite keeps its books, users, loans, holds and due dates.
+    """
+
+    name = "sqlite"
+    journaled = False
+
+    def __init__(self, path: str, json_paths: Optional[dict] = None):
+        """
+        Open (or create) the database and its schema.
+
+        :param path: Location of the SQLite database file.
+        :param json_paths: A dictionary mapping store names to their JSON file paths, imported into the
+                           database the first time it is opened (see import_json).
+        """
+        self.path = path
+        self._connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.create_function("copy_isbn", 1, copy_isbn, deterministic=True)
+        self._transaction_depth = 0
+        self._lock = threading.RLock()  # The connection is shared: a transaction excludes other threads' statements
+        for store, (key, fields) in STORE_FIELDS.items():
+            integers = {field: f"{field} INTEGER NOT NULL DEFAULT {default}"
+                        for field, default in INTEGER_FIELDS[store].items()}
+            columns = [f"{key} TEXT PRIMARY KEY"] + [integers.get(field, f"{field} TEXT NOT NULL")
+                                                      for field in fields if field != key]
+            columns += [f"{field}_norm TEXT NOT NULL" for field in NORMALIZED_FIELDS[store]]
+            self._connection.execute(f"CREATE TABLE IF NOT EXISTS {store} ({', '.join(columns)})")
+            existing = {row[1] for row in self._connection.execute(f"PRAGMA table_info({store})")}
+            for field in integers.keys() - existing:  # Databases created before the field existed
+                self._connection.execute(f"ALTER TABLE {store} ADD COLUMN {integers[field]}")
+            for field in INDEXED_FIELDS[store]:
+                self._connection.execute(f"CREATE INDEX IF NOT EXISTS {store}_{field} ON {store} ({field})")
+            for field in NORMALIZED_FIELDS[store]:
+                self._connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {store}_{field}_norm ON {store} ({field}_norm)")
+        if self.execute("PRAGMA user_version").fetchone()[0] < IMPORTED_VERSION:
+            if json_paths and not any(self.execute(f"SELECT 1 FROM {store} LIMIT 1").fetchone()
+                                      for store in STORE_FIELDS):
+                self.import_json(json_paths)
+            else:
+                self.execute(f"PRAGMA user_version = {IMPORTED_VERSION}")
+
+    def import_json(self, json_paths: dict) -> dict:
+        """
+        Copy the stores from their JSON files into the tables, validating them first (see validate_store),
+        in one transaction, then mark the database as imported so that it is never done again: a library
+        emptied later must not get its old records back. Missing files are skipped. If a file cannot be
+        read nothing is imported, and the next opening of the database tries again.
+
+        :param json_paths: A dictionary mapping store names to their JSON file paths.
+        :return: The number of records imported per store.
+        """
+        from Storage.Backends.json_backend import JSONBackend
+
+        source = JSONBackend(json_paths)
+        imported = {}
+        try:
+            with self.transaction():
+                for store in STORE_FIELDS:
+                    try:
+                        data = source.load(store)
+                    except FileNotFoundError:
+                        continue
+                    table = SQLiteTable(self, store)
+                    with self._lock:
+                        self._connection.executemany(table._upsert, (table._row(key, record)
+                                                                     for key, record in data.items()))
+                    imported[store] = len(data)
+                self.execute(f"PRAGMA user_version = {IMPORTED_VERSION}")
+        except (OSError, ValueError) as e:  # json.JSONDecodeError is a ValueError, SQLiteError an OSError
+            print(f"Unable to import the JSON files into the SQLite database. Error: {e}")
+            return {}
+        if any(imported.values()):
+            print("Imported " + ", ".join(f"{count} {store.replace('_', ' ')}" for store, count in imported.items())
+                  + " from the JSON files into the SQLite database.")
+        return imported
+
+    def execute(self, sql: str, parameters: tuple = ()) -> sqlite3.Cursor:
+        """
+        Run a single SQL statement.
+
+        :param sql: The statement.
+        :param parameters: The values bound to its placeholders.
+        :return: The cursor over the results.
+        :raises SQLiteError: If the statement fails, e.g. because another process keeps the database locked.
+        """
+        with self._lock:
+            try:
+                return self._connection.execute(sql, parameters)
+            except sqlite3.Error as e:
+                raise SQLiteError(f"{e} ({self.path})") from e
+
+    def load(self, store: str) -> MutableMapping:
+        """
+        :param store: One of "books", "users", "loans", "holds" or "due_dates".
+        :return: A mapping backed by the store's table.
+        """
+        return SQLiteTable(self, store)
+
+    def save(self, store: str, data: MutableMapping) -> int:
+        """
+        Nothing to do: every mutation has already been committed.
+
+        :return: 0, no bytes are written.
+        """
+        return 0
+
+    def create_index(self, store: str, field: str, normalize: bool = True):
+        """
+        :param store: One of "books", "users", "loans", "holds" or "due_dates".
+        :param field: The indexed field.
+        :param normalize: Unused, normalized columns are always maintained for the fields that have one.
+        :return: An index answering lookups with the table's SQL indexes.
+        """
+        return SQLiteIndex(self, store, field)
+
+    def create_inventory(self) -> "SQLiteInventory":
+        """
+        :return: An inventory answering from the loans and books tables.
+        """
+        return SQLiteInventory(self)
+
+    def create_hold_queues(self) -> "SQLiteHoldQueues":
+        """
+        :return: Waiting lists answered by the holds table.
+        """
+        return SQLiteHoldQueues(self)
+
+    def create_due_index(self) -> "SQLiteDueIndex":
+        """
+        :return: A due date index answered by the due dates table.
+        """
+        return SQLiteDueIndex(self)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run the enclosed statements in one transaction, committed on success and rolled back
+        on error. Nested transactions join the outermost one, and statements from other threads
+        wait until it ends instead of slipping into it.
+
+        :raises SQLiteError: If the transaction cannot begin or commit (e.g. "database is locked"), or a
+                             statement of it fails; nothing of the transaction is then applied.
+        """
+        with self._lock:
+            if self._transaction_depth == 0:
+                self.execute("BEGIN IMMEDIATE")
+            self._transaction_depth += 1
+            try:
+                yield
+            except BaseException as e:
+                self._transaction_depth -= 1
+                if self._transaction_depth == 0:
+                    self._rollback()
+                if isinstance(e, sqlite3.Error):  # Raised while fetching the rows of a cursor
+                    raise SQLiteError(f"{e} ({self.path})") from e
+                raise
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                try:
+                    self.execute("COMMIT")
+                except SQLiteError:
+                    self._rollback()
+                    raise
+
+    def _rollback(self) -> None:
+        if self._connection.in_transaction:  # SQLite already rolled back after some errors, e.g. a full disk
+            self.execute("ROLLBACK")
+
+    def close(self) -> None:
+        """
+        Close the database connection.
+        """
+        self._connection.close()
+
+
+class SQLiteTable(MutableMapping):
+    """
+    A dictionary-like view of one store's table, so BookDB, UserDB and the ContextManager
+    can use it exactly like the dictionaries of the JSON backend.
+    """
+
+    def __init__(self, backend: SQLiteBackend, store: str):
+        """
+        :param backend: The backend owning the connection.
+        :param store: One of "books", "users", "loans", "holds" or "due_dates".
+        """
+        self._backend = backend
+        self._store = store
+        self._key, self._fields = STORE_FIELDS[store]
+        self._scalar = store == "loans"  # Loans map an ISBN directly to a user ID
+        columns = [self._key] + [field for field in self._fields if field != self._key]
+        columns += [f"{field}_norm" for field in NORMALIZED_FIELDS[store]]
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns[1:])
+        self._upsert = (f"INSERT INTO {store} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                        f"ON CONFLICT ({self._key}) DO UPDATE SET {updates}")
+        self._select = f"SELECT {', '.join(self._fields)} FROM {store}"
+
+    def _record(self, row: tuple):
+        if self._scalar:
+            return row[0]
+        return dict(zip(self._fields, row))
+
+    def __getitem__(self, key: str):
+        row = self._backend.execute(f"{self._select} WHERE {self._key} = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return self._record(row)
+
+    def _row(self, key: str, record) -> tuple:
+        record = {self._fields[0]: record} if self._scalar else record
+        values = [key] + [record[field] for field in self._fields if field != self._key]
+        values += [normalize_key(record[field]) for field in NORMALIZED_FIELDS[self._store]]
+        return tuple(values)
+
+    def __setitem__(self, key: str, record) -> None:
+        self._backend.execute(self._upsert, self._row(key, record))
+
+    def __delitem__(self, key: str) -> None:
+        if self._backend.execute(f"DELETE FROM {self._store} WHERE {self._key} = ?", (key,)).rowcount == 0:
+            raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        return self._backend.execute(f"SELECT 1 FROM {self._store} WHERE {self._key} = ?", (key,)).fetchone() is not None
+
+    def __iter__(self):
+        for (key,) in self._backend.execute(f"SELECT {self._key} FROM {self._store} ORDER BY rowid"):
+            yield key
+
+    def __len__(self) -> int:
+        return self._backend.execute(f"SELECT COUNT(*) FROM {self._store}").fetchone()[0]
+
+    def items(self):
+        return _SQLiteItemsView(self)
+
+    def values(self):
+        return _SQLiteValuesView(self)
+
+    def _iter_items(self):
+        query = f"SELECT {self._key}, {', '.join(self._fields)} FROM {self._store} ORDER BY rowid"
+        for row in self._backend.execute(query):
+            yield row[0], self._record(row[1:])
+
+
+class _SQLiteItemsView(ItemsView):
+    def __iter__(self):
+        return self._mapping._iter_items()
+
+
+class _SQLiteValuesView(ValuesView):
+    def __iter__(self):
+        return (record for _, record in self._mapping._iter_items())
+
+
+class SQLiteIndex:
+    """
+    The HashIndex interface answered by the table's SQL indexes. The table itself keeps them
+    up to date, so add, discard and rebuild do nothing.
+    """
+
+    def __init__(self, backend: SQLiteBackend, store: str, field: str):
+        """
+        :param backend: The backend owning the connection.
+        :param store: One of "books", "users", "loans", "holds" or "due_dates".
+        :param field: The indexed field.
+        """
+        self._backend = backend
+        self._store = store
+        self._field = field
+        self._key = STORE_FIELDS[store][0]
+
+    def __len__(self) -> int:
+        return self._backend.execute(f"SELECT COUNT(DISTINCT {self._field}) FROM {self._store}").fetchone()[0]
+
+    def add(self, value: str, key: str) -> None:
+        pass
+
+    def discard(self, value: str, key: str) -> None:
+        pass
+
+    def rebuild(self, pairs) -> None:
+        pass  # The generator of pairs is deliberately never consumed
+
+    def clear(self) -> None:
+        pass
+
+    def lookup(self, value: str, normalized: bool = False) -> set:
+        """
+        :param value: The value to look up.
+        :param normalized: Match case- and whitespace-insensitively when True.
+        :return: A set of matching record keys (empty if none match).
+        """
+        if normalized and self._field in NORMALIZED_FIELDS[self._store]:
+            column, value = f"{self._field}_norm", normalize_key(value)
+        else:
+            column = self._field
+        cursor = self._backend.execute(f"SELECT {self._key} FROM {self._store} WHERE {column} = ?", (value,))
+        return {key for (key,) in cursor}
+
+
+class SQLiteInventory:
+    """
+    The Inventory interface answered by the loans and books tables. Other processes lend and return
+    copies of the same database, so a process cannot count the copies on loan itself: every question
+    is asked to the tables, which a checkout does inside its transaction, and lend, give_back and the
+    resets do nothing. Nothing is counted at startup either.
+    """
+
+    # The books with copies on loan, joined with their number of copies on loan
+    _LENT_BOOKS = ("books JOIN (SELECT copy_isbn(isbn) AS book, COUNT(*) AS lent FROM loans GROUP BY book) "
+                   "ON book = books.isbn")
+
+    def __init__(self, backend: SQLiteBackend):
+        """
+        :param backend: The backend owning the connection.
+        """
+        self._backend = backend
+
+    def reset_catalog(self, copies_of, total_of) -> None:
+        pass
+
+    def reset_loans(self, loans) -> None:
+        pass  # The loans are deliberately never scanned
+
+    @property
+    def built(self) -> bool:
+        return True
+
+    def build(self) -> None:
+        pass
+
+    def lend(self, isbn: str) -> None:
+        pass
+
+    def give_back(self, isbn: str) -> None:
+        pass
+
+    def set_copies(self, isbn: str, previous: int, copies: int) -> None:
+        pass
+
+    def _lent_copies(self, isbn: str) -> dict:
+        """
+        :return: A dictionary mapping the copy IDs of the copies of a book on loan to the IDs of their holders.
+        """
+        # The copies are the ISBN itself and the keys starting with "<ISBN>#", a range of the primary key
+        cursor = self._backend.execute("SELECT isbn, user_id FROM loans WHERE isbn = ? OR (isbn > ? AND isbn < ?)",
+                                       (isbn, isbn + COPY_SEPARATOR, isbn + chr(ord(COPY_SEPARATOR) + 1)))
+        return {copy: user_id for copy, user_id in cursor if copy_isbn(copy) == isbn}
+
+    def lent(self, isbn: str) -> int:
+        """
+        :return: The number of copies of a book on loan.
+        """
+        return len(self._lent_copies(isbn))
+
+    def loans_of(self, isbn: str, copies: int, first: int = 1) -> dict:
+        """
+        :param isbn: The ISBN of a book.
+        :param copies: Its number of copies.
+        :param first: The number of the first copy to look at.
+        :return: A dictionary mapping the copy IDs of its copies on loan to the IDs of their holders.
+        """
+        lent = self._lent_copies(isbn)
+        return {copy: lent[copy] for copy in map(partial(copy_id, isbn), range(first, copies + 1)) if copy in lent}
+
+    def free_copy(self, isbn: str, copies: int) -> Optional[str]:
+        """
+        :param isbn: The ISBN of a book.
+        :param copies: Its number of copies.
+        :return: The ID of its lowest-numbered copy not on loan, None if every copy is on loan.
+        """
+        free = self.free_copies(isbn, copies, 1)
+        return free[0] if free else None
+
+    def free_copies(self, isbn: str, copies: int, count: int) -> list:
+        """
+        :param isbn: The ISBN of a book.
+        :param copies: Its number of copies.
+        :param count: The number of copies wanted.
+        :return: The IDs of its lowest-numbered copies not on loan, at most count of them.
+        """
+        lent = self._lent_copies(isbn)
+        free = []
+        for number in range(1, copies + 1):
+            if len(free) == count:
+                break
+            copy = copy_id(isbn, number)
+            if copy not in lent:
+                free.append(copy)
+        return free
+
+    def exhausted(self) -> set:
+        """
+        :return: The ISBNs of the catalog with no copy left.
+        """
+        cursor = self._backend.execute(f"SELECT books.isbn FROM {self._LENT_BOOKS} WHERE 0 < copies AND copies <= lent")
+        return {isbn for (isbn,) in cursor}
+
+    def counts(self, titles: int) -> dict:
+        """
+        :param titles: The number of books in the catalog.
+        :return: The numbers of titles, titles with a copy available, copies, copies on loan and copies
+                 available.
+        """
+        total, on_loan, out, exhausted = self._backend.execute(
+            f"SELECT (SELECT COALESCE(SUM(copies), 0) FROM books), (SELECT COUNT(*) FROM loans), "
+            f"COALESCE(SUM(MIN(lent, copies)), 0), COUNT(CASE WHEN 0 < copies AND copies <= lent THEN 1 END) "
+            f"FROM {self._LENT_BOOKS}").fetchone()
+        return {"titles": titles, "titles_available": titles - exhausted, "copies": total, "on_loan": on_loan,
+                "available": total - out}
+
+
+class SQLiteHoldQueues:
+    """
+    The HoldQueues interface answered by the holds table, in the same serving order: higher priorities
+    first, then first come, first served. The table itself is the queue, so add, discard and rebuild
+    do nothing, and the holds placed by other processes are in line too.
+    """
+
+    _ORDER = "ORDER BY priority DESC, placed, user_id"
+
+    def __init__(self, backend: SQLiteBackend):
+        """
+        :param backend: The backend owning the connection.
+        """
+        self._backend = backend
+
+    def rebuild(self, holds) -> None:
+        pass  # The holds are deliberately never read
+
+    def add(self, hold: dict) -> None:
+        pass
+
+    def discard(self, hold: dict) -> None:
+        pass
+
+    def first(self, isbn: str) -> Optional[str]:
+        """
+        :return: The ID of the user next in line for a book, None if nobody waits for it.
+        """
+        row = self._backend.execute(f"SELECT user_id FROM holds WHERE isbn = ? {self._ORDER} LIMIT 1",
+                                    (isbn,)).fetchone()
+        return row[0] if row is not None else None
+
+    def position(self, hold: dict) -> int:
+        """
+        :return: The position of a hold in its book's queue, from 1.
+        """
+        return self._backend.execute(
+            "SELECT COUNT(*) FROM holds WHERE isbn = ? AND (-priority, placed, user_id) < (?, ?, ?)",
+            (hold["isbn"], -hold["priority"], hold["placed"], hold["user_id"])).fetchone()[0] + 1
+
+    def waiting(self, isbn: str) -> list:
+        """
+        :return: The IDs of the users waiting for a book, next in line first.
+        """
+        return [user_id for (user_id,) in
+                self._backend.execute(f"SELECT user_id FROM holds WHERE isbn = ? {self._ORDER}", (isbn,))]
+
+    def length(self, isbn: str) -> int:
+        """
+        :return: The number of users waiting for a book.
+        """
+        return self._backend.execute("SELECT COUNT(*) FROM holds WHERE isbn = ?", (isbn,)).fetchone()[0]
+
+    def counts(self) -> dict:
+        """
+        :return: The number of holds and the number of books with a hold on them.
+        """
+        holds, books_held = self._backend.execute("SELECT COUNT(*), COUNT(DISTINCT isbn) FROM holds").fetchone()
+        return {"holds": holds, "books_held": books_held}
+
+
+class SQLiteDueIndex:
+    """
+    The DueIndex interface answered by the SQL index of the due dates table, so add, discard and
+    rebuild do nothing.
+    """
+
+    def __init__(self, backend: SQLiteBackend):
+        """
+        :param backend: The backend owning the connection.
+        """
+        self._backend = backend
+
+    def rebuild(self, dues) -> None:
+        pass  # The generator of pairs is deliberately never consumed
+
+    def add(self, copy: str, due: int) -> None:
+        pass
+
+    def discard(self, copy: str, due: int) -> None:
+        pass
+
+    def between(self, start: Optional[int], end: int, limit: Optional[int] = None) -> list:
+        """
+        :param start: The earliest due time included, None for no lower bound.
+        :param end: The due time from which copies are excluded.
+        :param limit: The maximum number of copies returned, None for all of them.
+        :return: (due time, copy ID) pairs of the copies due in [start, end), soonest due first.
+        """
+        lower, bounds = ("", (end,)) if start is None else ("due >= ? AND ", (start, end))
+        cursor = self._backend.execute(f"SELECT due, copy FROM due_dates WHERE {lower}due < ? ORDER BY due, copy "
+                                       f"LIMIT ?", (*bounds, -1 if limit is None else limit))
+        return cursor.fetchall()
+
+    def __len__(self) -> int:
+        """
+        :return: The number of copies in the index.
+        """
+        return self._backend.execute("SELECT COUNT(*) FROM due_dates").fetchone()[0]
@@ -0,0 +1,280 @@
+import heapq
+import math
+import re
+from bisect import bisect_left, insort
+from collections import Counter
+from operator import itemgetter
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list:
+    """
+    Split a title or author into lower-cased word tokens.
+
+    :param text: The text to tokenize.
+    :return: A list of tokens in the order they appear.
+    """
+    return _TOKEN_PATTERN.findall(text.casefold())
+
+
+def trigrams(token: str) -> set:
+    """
+    Build the padded character trigrams of a token, used for typo-tolerant matching.
+
+    :param token: A single token.
+    :return: The set of trigrams, e.g. {"$ca", "cat", "at$"} for "cat".
+    """
+    padded = f"${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class BookSearchEngine:
+    """
+    An in-memory full-text search engine over book titles and authors.
+
+    Keeps an inverted index (token -> ISBNs), a sorted vocabulary for prefix lookups via bisect
+    and a trigram index (trigram -> tokens) for typo-tolerant matching. Every query token must
+    match (AND semantics) either exactly, as a prefix or, optionally, approximately; results are
+    ranked by an idf-weighted score where title hits count more than author hits.
+
+    Only the books matching the most selective query token are candidates, intersected with the
+    postings of the other tokens, and they are scored one matched token at a time, best weighted
+    first: the search stops as soon as the top-k heap holds k books no remaining candidate can beat,
+    so a common word costs about as much as a rare one. Which of the books scoring the same make the
+    top k depends on the order they are found in.
+    """
+
+    TITLE_WEIGHT = 2.0
+    AUTHOR_WEIGHT = 1.0
+    PREFIX_QUALITY = 0.7  # Score factor of a prefix match compared to an exact token match
+    FUZZY_QUALITY = 0.5  # Score factor of an approximate match, scaled by its trigram similarity
+    TITLE_START_BONUS = 1.5  # Score factor of the titles beginning with the query as typed
+    FUZZY_THRESHOLD = 0.4  # Minimum Dice similarity of trigrams for an approximate match
+    MAX_EXPANSION_POSTINGS = 1000000  # Postings the tokens a prefix or typo expands into may hold, most frequent first
+
+    def __init__(self):
+        """
+        Create an empty search engine.
+        """
+        self._postings: dict = {}  # token -> set of ISBNs
+        self._documents: dict = {}  # ISBN -> (title tokens, author tokens, normalized title)
+        self._vocabulary: list = []  # sorted list of every indexed token
+        self._grams: dict = {}  # trigram -> set of tokens
+        self._titled: dict = {}  # token -> number of titles holding it, which bounds the scores
+        self._openings: dict = {}  # token -> set of ISBNs whose title begins with it
+
+    def __len__(self) -> int:
+        """
+        :return: The number of indexed books.
+        """
+        return len(self._documents)
+
+    def _register(self, isbn: str, title: str, author: str) -> list:
+        """
+        Index a book in the postings and return the tokens that were new to the vocabulary.
+        """
+        title_tokens, author_tokens = tuple(tokenize(title)), tuple(tokenize(author))
+        self._documents[isbn] = (title_tokens, author_tokens, " ".join(title_tokens))
+        new_tokens = []
+        for token in set(title_tokens + author_tokens):
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = set()
+                new_tokens.append(token)
+                for gram in trigrams(token):
+                    self._grams.setdefault(gram, set()).add(token)
+            postings.add(isbn)
+        for token in set(title_tokens):
+            self._titled[token] = self._titled.get(token, 0) + 1
+        if title_tokens:
+            self._openings.setdefault(title_tokens[0], set()).add(isbn)
+        return new_tokens
+
+    def add(self, isbn: str, title: str, author: str) -> None:
+        """
+        Index a book, replacing any previous entry for the same ISBN.
+
+        :param isbn: The ISBN of the book.
+        :param title: The title of the book.
+        :param author: The author of the book.
+        """
+        self.remove(isbn)
+        for token in self._register(isbn, title, author):
+            insort(self._vocabulary, token)
+
+    def remove(self, isbn: str) -> None:
+        """
+        Remove a book from the index if it is present.
+
+        :param isbn: The ISBN of the book.
+        """
+        document = self._documents.pop(isbn, None)
+        if document is None:
+            return
+        for token in set(document[0]):
+            if self._titled[token] == 1:
+                del self._titled[token]
+            else:
+                self._titled[token] -= 1
+        if document[0]:
+            openings = self._openings[document[0][0]]
+            openings.discard(isbn)
+            if not openings:
+                del self._openings[document[0][0]]
+        for token in set(document[0] + document[1]):
+            postings = self._postings[token]
+            postings.discard(isbn)
+            if not postings:
+                del self._postings[token]
+                del self._vocabulary[bisect_left(self._vocabulary, token)]
+                for gram in trigrams(token):
+                    tokens = self._grams[gram]
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._grams[gram]
+
+    def rebuild(self, books) -> None:
+        """
+        Replace the index content with the given books, sorting the vocabulary only once.
+
+        :param books: An iterable of (ISBN, title, author) tuples.
+        """
+        self._postings, self._documents, self._grams = {}, {}, {}
+        self._titled, self._openings = {}, {}
+        for isbn, title, author in books:
+            self._register(isbn, title, author)
+        self._vocabulary = sorted(self._postings)
+
+    def _field_weight(self, token: str) -> float:
+        """
+        :return: The weight of the best field a token is found in.
+        """
+        return self.TITLE_WEIGHT if token in self._titled else self.AUTHOR_WEIGHT
+
+    def _idf(self, token: str) -> float:
+        return math.log(1 + len(self._documents) / len(self._postings[token]))
+
+    def _most_frequent(self, tokens) -> list:
+        """
+        :return: The most frequent of the tokens, until their postings hold MAX_EXPANSION_POSTINGS books
+                 (at least one token).
+        """
+        kept, postings = [], 0
+        for token in sorted(tokens, key=lambda token: len(self._postings[token]), reverse=True):
+            if kept and postings + len(self._postings[token]) > self.MAX_EXPANSION_POSTINGS:
+                continue
+            kept.append(token)
+            postings += len(self._postings[token])
+        return kept
+
+    def _expand(self, token: str, prefix: bool, fuzzy: bool) -> dict:
+        """
+        Find the vocabulary tokens a query token matches, with the quality of each match.
+        """
+        expansions = {}
+        if prefix:
+            start = bisect_left(self._vocabulary, token)
+            end = bisect_left(self._vocabulary, token + "\U0010ffff", start)
+            expansions = dict.fromkeys(self._most_frequent(self._vocabulary[start:end]), self.PREFIX_QUALITY)
+        if fuzzy and token not in self._postings:
+            query_grams = trigrams(token)
+            overlaps = Counter(candidate for gram in query_grams for candidate in self._grams.get(gram, ()))
+            similar = {}
+            for candidate, common in overlaps.items():
+                similarity = 2 * common / (len(query_grams) + len(candidate))
+                if similarity >= self.FUZZY_THRESHOLD:
+                    similar[candidate] = similarity
+            for candidate in self._most_frequent(similar):
+                expansions.setdefault(candidate, self.FUZZY_QUALITY * similar[candidate])
+        if token in self._postings:
+            expansions[token] = 1.0
+        return expansions
+
+    def search(self, query: str, limit: int = 10, prefix: bool = True, fuzzy: bool = True) -> list:
+        """
+        Find the books matching every token of the query, best matches first.
+
+        :param query: Free text, e.g. a partial title and/or author name.
+        :param limit: The maximum number of results (top-k).
+        :param prefix: Let query tokens match longer tokens starting with them.
+        :param fuzzy: Let query tokens that are not in the vocabulary match similarly spelled tokens.
+        :return: A list of (ISBN, score) tuples ordered by descending relevance.
+        """
+        query_tokens = list(dict.fromkeys(tokenize(query)))
+        if not query_tokens or not self._documents or limit <= 0:
+            return []
+        expansions = []
+        for token in query_tokens:
+            matches = self._expand(token, prefix, fuzzy)
+            if not matches:
+                return []  # AND semantics: one unmatched token rules out every book
+            weights = {match: quality * self._idf(match) for match, quality in matches.items()}
+            expansions.append(weights)
+        # Only the books matching the most selective token are candidates: the others cannot match it
+        expansions.sort(key=lambda weights: sum(len(self._postings[match]) for match in weights))
+        driver, others = expansions[0], [[self._postings[match] for match in weights] for weights in expansions[1:]]
+        # The best score of the books matching each token of the driving one, but for the title bonus
+        others_best = sum(max(weight * self._field_weight(match) for match, weight in weights.items())
+                          for weights in expansions[1:])
+        weighted = [(weight * self._field_weight(match) + others_best, match) for match, weight in driver.items()]
+        weighted.sort(reverse=True)
+        # Only the books whose title begins with the query get the bonus. For several tokens, those are among the
+        # books whose title begins with the first one, scored in tiers of their own. For a single token, every
+        # book may get it if a title begins with a token starting with it, and then plenty of books do
+        if len(query_tokens) > 1:
+            opening = self._openings.get(query_tokens[0], set())
+            tiers = [(weight * self.TITLE_START_BONUS, match, opening) for weight, match in weighted]
+            tiers += [(weight, match, None) for weight, match in weighted]
+            tiers.sort(key=itemgetter(0), reverse=True)
+        else:
+            start = bisect_left(self._vocabulary, query_tokens[0])
+            end = bisect_left(self._vocabulary, query_tokens[0] + "\U0010ffff", start)
+            opens = any(map(self._openings.__contains__, self._vocabulary[start:end]))
+            tiers = [(weight * (self.TITLE_START_BONUS if opens else 1.0), match, None) for weight, match in weighted]
+        normalized_query = " ".join(query_tokens)
+        top, seen, matching = [], set(), {}
+        for bound, match, opening in tiers:
+            # The books left to score are in no better tier, so none of them can score more than the bound
+            if len(top) == limit and top[0][0] >= bound:
+                break
+            candidates = matching.get(match)
+            if candidates is None:
+                candidates = self._postings[match]
+                for postings in others:  # AND semantics, as set intersections rather than book by book
+                    candidates = set().union(*(candidates & matches for matches in postings))
+                matching[match] = candidates
+            if opening is not None:
+                candidates = candidates & opening
+            for isbn in candidates:
+                if isbn in seen:
+                    continue  # Already scored in a better tier
+                seen.add(isbn)
+                score = self._score(isbn, expansions, normalized_query)
+                if not score:
+                    continue
+                if len(top) < limit:
+                    heapq.heappush(top, (score, isbn))
+                else:
+                    heapq.heappushpop(top, (score, isbn))
+                    if top[0][0] >= bound:
+                        break  # The top k is settled
+        return [(isbn, score) for score, isbn in sorted(top, reverse=True)]
+
+    def _score(self, isbn: str, expansions: list, normalized_query: str) -> float:
+        """
+        :return: The score of a book for the expansions of every query token, 0 if a token does not match it.
+        """
+        title_tokens, author_tokens, normalized_title = self._documents[isbn]
+        score = 0.0
+        for weights in expansions:
+            best = max((weights[token] * self.TITLE_WEIGHT for token in title_tokens if token in weights),
+                       default=0.0)
+            best = max(best, max((weights[token] * self.AUTHOR_WEIGHT for token in author_tokens
+                                  if token in weights), default=0.0))
+            if not best:
+                return 0.0
+            score += best
+        if normalized_title.startswith(normalized_query):
+            score *= self.TITLE_START_BONUS  # Reward titles that begin with the query as typed
+        return score
@@ -1,6 +1,21 @@
 import json
 import os
-from Pydantic_Models.pydantic_models import BookData
+import threading
+from functools import partial
+from operator import itemgetter
+from typing import Container, Iterator, Optional, TYPE_CHECKING, Tuple
+from Storage.Backends.base_backend import StorageBackend
+from Storage.Backends.json_backend import JSONBackend
+from Storage.BookDB.book_search import BookSearchEngine, tokenize
+from Storage.events import EventBus
+from Storage.indexing import HashIndex, SortedIndex, normalize_key
+from Storage.inventory import COPY_SEPARATOR, Inventory
+from Storage.journal import Journal
+from Storage.listing import iter_listing, take_page, write_buffered
+from Storage.query_cache import QueryCache
+
+if TYPE_CHECKING:  # Annotations only: pydantic is imported by whoever builds the models
+    from Pydantic_Models.pydantic_models import BookData
 
 
 class BookDB:
@@ -9,21 +24,34 @@ class BookDB:
     """
     _data: dict = {}
     _dbpath: str = os.path.join(os.path.dirname(__file__), 'BookData.json')
+    _backend: Optional[StorageBackend] = None  # Medium the books are persisted in, set by instantiate_data
+    _journal: Optional[Journal] = None  # Write-ahead journal attached by the ContextManager
+    _events: Optional[EventBus] = None  # Change event bus attached by the ContextManager
+    _title_index: HashIndex = HashIndex()  # title -> set of ISBNs
+    _author_index: HashIndex = HashIndex()  # author -> set of ISBNs
+    _search_engine: BookSearchEngine = BookSearchEngine()  # Full-text index over titles and authors
+    _search_engine_ready: bool = False  # The full-text index is built on the first full-text search
+    _book_orders: dict = {}  # Listing order ("isbn", "title" or "author") -> SortedIndex, built on first use
+    _book_query_cache: QueryCache = QueryCache()  # Recent title, author and full-text search results
+    _inventory: Inventory = Inventory()  # Copies on loan and availability counters, fed by the ContextManager's loans
+    _books_lock = threading.RLock()  # Serializes catalog mutations; reads do not take it
+    _changed_books: Optional[dict] = {}  # ISBN -> book as of the last load or save (None if absent), for save-time merges
 
     @classmethod
-    def instantiate_data(cls) -> bool:
+    def instantiate_data(cls, backend: Optional[StorageBackend] = None) -> bool:
         """
-        Load existing book data from the JSON file into the class-level _data attribute.
+        Open the book store of the storage backend into the class-level _data attribute
+        and build the title and author indexes over it.
 
+        :param backend: The storage backend to use, by default the JSON file at _dbpath.
         :return: True if data is successfully loaded, False otherwise.
         """
+        cls._backend = backend or JSONBackend({"books": cls._dbpath})
+        cls._changed_books = {} if cls._backend.journaled else None  # Stores committing each mutation need no tracking
+        cls._title_index = cls._backend.create_index("books", "title")
+        cls._author_index = cls._backend.create_index("books", "author")
         try:
-            with open(cls._dbpath, "r") as fp:
-                content = fp.read()
-                if content.strip():  # Check if the file content is not empty
-                    cls._data = json.loads(content)
-                else:
-                    cls._data = {}  # Initialize with an empty dictionary if file is empty
+            cls._data = cls._backend.load("books")
             return True
         except json.JSONDecodeError as e:
             print(f"Error decoding JSON data: {e}")
@@ -36,6 +64,130 @@ class BookDB:
         except Exception as e:
             print(f"Unable to instantiate data\nError: {e}")
             return False
+        finally:
+            cls._rebuild_indexes()
+
+    @classmethod
+    def _rebuild_indexes(cls) -> None:
+        """
+        Build the title and author indexes from scratch over the loaded books. The full-text
+        index is only marked stale and the listing orders only scheduled, so they do not slow down startup.
+        """
+        field_items = getattr(cls._data, "field_items", None)  # Compact stores iterate a column, not records
+        if field_items is not None:
+            cls._title_index.rebuild(field_items("title"))
+            cls._author_index.rebuild(field_items("author"))
+        else:
+            cls._title_index.rebuild((book["title"], isbn) for isbn, book in cls._data.items())
+            cls._author_index.rebuild((book["author"], isbn) for isbn, book in cls._data.items())
+        cls._search_engine_ready = False
+        cls._book_query_cache.invalidate()
+        cls._inventory.reset_catalog(cls._book_copies, cls._count_copies)
+        cls._book_orders = {"isbn": SortedIndex(normalize=False), "title": SortedIndex(), "author": SortedIndex()}
+        for field, index in cls._book_orders.items():
+            index.rebuild(partial(cls._book_order_pairs, field))
+
+    @classmethod
+    def _book_order_pairs(cls, field: str):
+        """
+        :param field: The field of a listing order.
+        :return: An iterator of the (field value, ISBN) pairs of every book, to build the order from.
+        """
+        if field == "isbn":
+            return zip(cls._data, cls._data)
+        field_items = getattr(cls._data, "field_items", None)
+        if field_items is not None:
+            return field_items(field)
+        return zip(map(itemgetter(field), cls._data.values()), cls._data)
+
+    @classmethod
+    def _book_copies(cls, isbn: str) -> int:
+        """
+        :return: The number of copies of a book, 0 if it is not in the catalog.
+        """
+        book = cls._data.get(isbn)
+        return book["copies"] if book is not None else 0
+
+    @classmethod
+    def _count_copies(cls) -> int:
+        """
+        :return: The number of copies of the whole catalog.
+        """
+        return sum(map(itemgetter(0), cls._book_order_pairs("copies")))
+
+    @staticmethod
+    def _book_problem(record: dict) -> Optional[str]:
+        """
+        :return: Why a book record cannot be stored, None if it can.
+        """
+        if COPY_SEPARATOR in record["isbn"]:
+            return f"an ISBN cannot contain '{COPY_SEPARATOR}', which numbers the copies of a book"
+        if record["copies"] < 1:
+            return "a book has at least one copy"
+        return None
+
+    @classmethod
+    def _put_book(cls, record: dict) -> None:
+        """
+        Store a book record without any validation, keeping the indexes up to date.
+        Used by the public mutators and journal replay.
+
+        :param record: The book record, keyed in the store by its ISBN.
+        """
+        isbn = record["isbn"]
+        previous = cls._data.get(isbn)
+        if cls._changed_books is not None and isbn not in cls._changed_books:
+            cls._changed_books[isbn] = previous
+        if previous is not None:
+            cls._title_index.discard(previous["title"], isbn)
+            cls._author_index.discard(previous["author"], isbn)
+        cls._data[isbn] = record
+        cls._title_index.add(record["title"], isbn)
+        cls._author_index.add(record["author"], isbn)
+        cls._inventory.set_copies(isbn, previous["copies"] if previous is not None else 0, record["copies"])
+        for field, index in cls._book_orders.items():
+            if previous is None or previous[field] != record[field]:
+                if previous is not None:
+                    index.discard(previous[field], isbn)
+                index.add(record[field], isbn)
+        if cls._search_engine_ready:
+            cls._search_engine.add(isbn, record["title"], record["author"])
+        cls._book_query_cache.invalidate()
+
+    @classmethod
+    def _drop_book(cls, isbn: str) -> None:
+        """
+        Remove a book record if it exists, keeping the indexes up to date.
+        Used by the public mutators and journal replay.
+
+        :param isbn: The ISBN of the book to remove.
+        """
+        record = cls._data.pop(isbn, None)
+        if record is not None:
+            if cls._changed_books is not None:
+                cls._changed_books.setdefault(isbn, record)
+            cls._title_index.discard(record["title"], isbn)
+            cls._author_index.discard(record["author"], isbn)
+            cls._inventory.set_copies(isbn, record["copies"], 0)
+            for field, index in cls._book_orders.items():
+                index.discard(record[field], isbn)
+            if cls._search_engine_ready:
+                cls._search_engine.remove(isbn)
+            cls._book_query_cache.invalidate()
+
+    @classmethod
+    def _fetch_books(cls, isbns) -> dict:
+        """
+        Look up several books at once, letting stores that can batch lookups (such as the
+        sharded catalog) do so.
+
+        :param isbns: An iterable of ISBNs present in the store.
+        :return: A dictionary of ISBNs and corresponding book data, in the order they were given.
+        """
+        fetch_many = getattr(cls._data, "fetch_many", None)
+        if fetch_many is not None:
+            return fetch_many(isbns)
+        return {isbn: cls._data[isbn] for isbn in isbns}
 
     @classmethod
     def _search_by_isbn(cls, isbn: str):
@@ -48,27 +200,58 @@ class BookDB:
         return cls._data.get(isbn)
 
     @classmethod
-    def _search_by_title(cls, title: str) -> dict:
+    def _search_by_title(cls, title: str, normalized: bool = False) -> dict:
         """
-        Search for books by title.
+        Search for books by title using the title index. Recent results are served from the query cache.
 
         :param title: The title of the book(s) to search for.
+        :param normalized: Ignore case and extra whitespace when True.
         :return: A dictionary of ISBNs and corresponding book data if found, empty dictionary otherwise.
         """
-        return {isbn: book for isbn, book in cls._data.items() if book["title"] == title}
+        key = ("title", normalized, normalize_key(title) if normalized else title)
+        return cls._book_query_cache.lookup(key, lambda: cls._fetch_books(cls._title_index.lookup(title, normalized)))
 
     @classmethod
-    def _search_by_author(cls, author: str) -> dict:
+    def _search_by_author(cls, author: str, normalized: bool = False) -> dict:
         """
-        Search for books by author.
+        Search for books by author using the author index. Recent results are served from the query cache.
 
         :param author: The author of the book(s) to search for.
+        :param normalized: Ignore case and extra whitespace when True.
         :return: A dictionary of ISBNs and corresponding book data if found, empty dictionary otherwise.
         """
-        return {isbn: book for isbn, book in cls._data.items() if book["author"] == author}
+        key = ("author", normalized, normalize_key(author) if normalized else author)
+        return cls._book_query_cache.lookup(key, lambda: cls._fetch_books(cls._author_index.lookup(author, normalized)))
+
+    @classmethod
+    def _search_full_text(cls, query: str, limit: int = 10) -> dict:
+        """
+        Search for books whose title and author match every word of the query, allowing
+        partial words and small typos. Recent results are served from the query cache, keyed on the
+        query's distinct tokens, which are all the ranking depends on.
+
+        :param query: Free text such as a partial title and/or author name.
+        :param limit: The maximum number of books to return.
+        :return: A dictionary of ISBNs and corresponding book data ordered by relevance, empty if nothing matches.
+        """
+        key = ("text", limit, " ".join(dict.fromkeys(tokenize(query))))
+        return cls._book_query_cache.lookup(key, lambda: cls._rank_books(query, limit))
 
     @classmethod
-    def verify_book(cls, book_data: BookData) -> bool:
+    def _rank_books(cls, query: str, limit: int) -> dict:
+        """
+        :return: The uncached result of _search_full_text, building the full-text index on first use.
+        """
+        if not cls._search_engine_ready:
+            with cls._books_lock:  # Build once, and not while a mutation is half applied
+                if not cls._search_engine_ready:
+                    cls._search_engine.rebuild((isbn, book["title"], book["author"])
+                                               for isbn, book in cls._data.items())
+                    cls._search_engine_ready = True
+        return cls._fetch_books(isbn for isbn, _ in cls._search_engine.search(query, limit))
+
+    @classmethod
+    def verify_book(cls, book_data: "BookData") -> bool:
         """
         Verify if the provided book exists in the database.
 
@@ -81,74 +264,253 @@ class BookDB:
         return False
 
     @classmethod
-    def add_book(cls, book_data: BookData) -> bool:
+    def add_book(cls, book_data: "BookData") -> bool:
         """
         Add a new book to the database.
 
         :param book_data: The BookData object containing book information.
-        :return: True if the book is added successfully, False if the book already exists.
+        :return: True if the book is added successfully, False if the book already exists or is invalid.
         """
-        if book_data.isbn not in cls._data:
-            cls._data[book_data.isbn] = book_data.model_dump()
-            return True
-        print(f"Book already exists with ISBN: {book_data.isbn}")
-        return False
+        with cls._books_lock:
+            if book_data.isbn not in cls._data:
+                record = book_data.model_dump()
+                problem = cls._book_problem(record)
+                if problem is not None:
+                    print(f"Invalid book: {problem}")
+                    return False
+                cls._put_book(record)
+                if cls._journal is not None:
+                    cls._journal.append("add_book", record=record)
+                if cls._events:
+                    cls._events.publish("book_added", record["isbn"], record)
+                return True
+            print(f"Book already exists with ISBN: {book_data.isbn}")
+            return False
 
     @classmethod
-    def update_book(cls, book_data: BookData) -> bool:
+    def add_books(cls, books: list) -> list:
+        """
+        Add a batch of already validated books without per-record output, journaling them together.
+        Books whose ISBN is empty or already present (in the store or earlier in the batch) are skipped.
+
+        :param books: A list of BookData objects.
+        :return: A list of (BookData, reason) tuples for the books that were not added.
         """
-        Update an existing book's data.
+        records = [book_data.model_dump() for book_data in books]
+        models = {id(record): book_data for record, book_data in zip(records, books)}
+        return [(models[id(record)], reason) for record, reason in cls.add_book_records(records)]
+
+    @classmethod
+    def add_book_records(cls, records: list) -> list:
+        """
+        Add a batch of trusted book records (validated in bulk, see Storage/validation.py) as they are,
+        without building a model per record, journaling them together. Records whose ISBN is empty or
+        already present (in the store or earlier in the batch) are skipped.
+
+        :param records: A list of book dictionaries with exactly the BookData fields.
+        :return: A list of (record, reason) tuples for the records that were not added.
+        """
+        with cls._books_lock:
+            rejected, added = [], []
+            with cls._backend.transaction():
+                for record in records:
+                    isbn = record["isbn"]
+                    if not isbn:
+                        rejected.append((record, "missing ISBN"))
+                    elif isbn in cls._data:
+                        rejected.append((record, f"book already exists with ISBN: {isbn}"))
+                    elif (problem := cls._book_problem(record)) is not None:
+                        rejected.append((record, problem))
+                    else:
+                        cls._put_book(record)
+                        added.append({"record": record})
+            if cls._journal is not None:
+                cls._journal.append_many("add_book", added)
+            if cls._events:
+                cls._events.publish_many("book_added", [(item["record"]["isbn"], item["record"]) for item in added])
+            return rejected
+
+    @classmethod
+    def update_book(cls, book_data: "BookData") -> bool:
+        """
+        Update an existing book's data. Its number of copies cannot drop below a copy that is on loan.
 
         :param book_data: The BookData object containing updated book information.
-        :return: True if the book is updated successfully, False if the book does not exist.
+        :return: True if the book is updated successfully, False if the book does not exist or is invalid.
         """
-        if book_data.isbn not in cls._data:
-            print("Book does not exist")
-            return False
-        cls._data[book_data.isbn] = book_data.model_dump()
-        return True
+        with cls._books_lock:
+            previous = cls._data.get(book_data.isbn)
+            if previous is None:
+                print("Book does not exist")
+                return False
+            record = book_data.model_dump()
+            problem = cls._book_problem(record)
+            if problem is not None:
+                print(f"Invalid book: {problem}")
+                return False
+            lent = cls._inventory.loans_of(book_data.isbn, previous["copies"], first=record["copies"] + 1)
+            if lent:
+                print(f"Copies {', '.join(lent)} of the book are on loan and must be checked in before "
+                      f"its copies are reduced to {record['copies']}")
+                return False
+            cls._put_book(record)
+            if cls._journal is not None:
+                cls._journal.append("update_book", record=record)
+            if cls._events:
+                cls._events.publish("book_updated", record["isbn"], record)
+            return True
 
     @classmethod
-    def delete_book(cls, book_data: BookData) -> bool:
+    def delete_book(cls, book_data: "BookData") -> bool:
         """
         Delete a book from the database.
 
         :param book_data: The BookData object of the book to delete.
         :return: True if the book is deleted successfully, False if the book does not exist.
         """
-        if book_data.isbn not in cls._data:
-            print("Book does not exist")
-            return False
-        cls._data.pop(book_data.isbn)
-        return True
+        with cls._books_lock:
+            if book_data.isbn not in cls._data:
+                print("Book does not exist")
+                return False
+            removed = cls._data[book_data.isbn] if cls._events else None
+            cls._drop_book(book_data.isbn)
+            if cls._journal is not None:
+                cls._journal.append("delete_book", isbn=book_data.isbn)
+            if cls._events:
+                cls._events.publish("book_deleted", book_data.isbn, removed)
+            return True
 
     @classmethod
     def save_data(cls) -> bool:
         """
-        Save the book data to the JSON file.
+        Save the book data through the storage backend.
 
         :return: True if data is saved successfully, False otherwise.
         """
         try:
-            with open(cls._dbpath, "w") as fp:
-                json.dump(cls._data, fp, indent=4)  # Pretty printing for better readability
+            cls._backend.save("books", cls._data)
             return True
         except Exception as e:
             print(f"Unable to save data\nError: {e}")
             return False
 
     @classmethod
-    def _get_books(cls) -> None:
+    def _book_listing(cls, order: Optional[str] = None, offset: int = 0, cursor: Optional[str] = None,
+                      exclude: Optional[Container] = None):
+        """
+        :return: The lazy listing of the books (see iter_listing), building the sorted order on first use.
+        """
+        if order is None:
+            return iter_listing(cls._data, None, None, offset, cursor, exclude=exclude)
+        index = cls._book_orders.get(order)
+        if index is None:
+            raise ValueError(f"Unknown order '{order}', expected one of: {', '.join(cls._book_orders)}")
+        if not index.built:
+            with cls._books_lock:  # Build once, and not while a mutation is half applied
+                index.build()
+        return iter_listing(cls._data, index, order, offset, cursor, exclude=exclude)
+
+    @classmethod
+    def iter_books(cls, order: Optional[str] = None, offset: int = 0,
+                   cursor: Optional[str] = None) -> Iterator[Tuple[str, dict]]:
+        """
+        Lazily iterate over the books, without materializing the listing.
+
+        :param order: None for store order, or "isbn", "title" or "author" (case-insensitive).
+        :param offset: The number of books to skip (after the cursor, if any).
+        :param cursor: A cursor returned by page_books, to resume after its page.
+        :return: An iterator of (ISBN, book data) tuples.
         """
-        Display all books and their information.
+        return ((isbn, book) for _, isbn, book in cls._book_listing(order, offset, cursor))
+
+    @classmethod
+    def page_books(cls, order: Optional[str] = None, offset: int = 0, cursor: Optional[str] = None,
+                   limit: int = 20) -> tuple:
+        """
+        Get one page of books. Following the returned cursor rather than increasing the offset
+        neither repeats nor skips books when the catalog changes between pages.
+
+        :param order: None for store order, or "isbn", "title" or "author" (case-insensitive).
+        :param offset: The number of books to skip (after the cursor, if any).
+        :param cursor: A cursor returned with the previous page.
+        :param limit: The maximum number of books on the page.
+        :return: (list of (ISBN, book data) tuples, cursor of the next page or None on the last page).
+        """
+        return take_page(cls._book_listing(order, offset, cursor), order, limit)
+
+    @classmethod
+    def _built_inventory(cls) -> Inventory:
+        """
+        :return: The inventory, building its catalog-wide counters on first use.
+        """
+        if not cls._inventory.built:
+            with cls._books_lock:  # Build once, and not while a mutation is half applied
+                cls._inventory.build()
+        return cls._inventory
+
+    @classmethod
+    def inventory_counts(cls) -> dict:
+        """
+        :return: The numbers of titles, titles with a copy available, copies, copies on loan and copies
+                 available, maintained on every change rather than counted.
+        """
+        return cls._built_inventory().counts(len(cls._data))
+
+    @classmethod
+    def _available_listing(cls, order: Optional[str] = None, offset: int = 0, cursor: Optional[str] = None):
+        """
+        :return: The lazy listing of the books with a copy available. Only the books with every copy on
+                 loan are left out, so the cost follows the length of the page rather than of the catalog.
+        """
+        return cls._book_listing(order, offset, cursor, exclude=cls._built_inventory().exhausted())
+
+    @classmethod
+    def iter_available_books(cls, order: Optional[str] = None, offset: int = 0,
+                             cursor: Optional[str] = None) -> Iterator[Tuple[str, dict]]:
+        """
+        Lazily iterate over the books with at least one copy available.
+
+        :param order: None for store order, or "isbn", "title" or "author" (case-insensitive).
+        :param offset: The number of available books to skip (after the cursor, if any).
+        :param cursor: A cursor returned by page_available_books, to resume after its page.
+        :return: An iterator of (ISBN, book data) tuples.
+        """
+        return ((isbn, book) for _, isbn, book in cls._available_listing(order, offset, cursor))
+
+    @classmethod
+    def page_available_books(cls, order: Optional[str] = None, offset: int = 0, cursor: Optional[str] = None,
+                             limit: int = 20) -> tuple:
+        """
+        Get one page of the books with at least one copy available, like page_books.
+
+        :param order: None for store order, or "isbn", "title" or "author" (case-insensitive).
+        :param offset: The number of available books to skip (after the cursor, if any).
+        :param cursor: A cursor returned with the previous page.
+        :param limit: The maximum number of books on the page.
+        :return: (list of (ISBN, book data) tuples, cursor of the next page or None on the last page).
+        """
+        return take_page(cls._available_listing(order, offset, cursor), order, limit)
+
+    @staticmethod
+    def _format_book(number: int, isbn: str, info: dict) -> str:
+        """
+        :return: The display text of a book in listings.
+        """
+        return (f"Book {number}\nISBN: {isbn}\nTitle: {info['title']}\nAuthor: {info['author']}\n"
+                f"Copies: {info['copies']}\n{'-' * 40}\n")
+
+    @classmethod
+    def _get_books(cls, order: Optional[str] = None) -> None:
+        """
+        Display all books and their information, written in buffered chunks.
+
+        :param order: None for store order, or "isbn", "title" or "author".
         """
         if not cls._data:
             print("No books found.")
         else:
-            for idx, (isbn_num, info) in enumerate(cls._data.items(), start=1):
-                print(f"Book {idx}\nISBN: {isbn_num}\nTitle: {info['title']}\nAuthor: {info['author']}")
-                print("-" * 40)
-
+            write_buffered(cls._format_book(number, isbn, info)
+                           for number, (isbn, info) in enumerate(cls.iter_books(order), start=1))
 
 # Example interaction
 # db = BookDB()  # Create an instance of BookDB
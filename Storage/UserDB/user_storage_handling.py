@@ -1,6 +1,19 @@
 import json
 import os
-from Pydantic_Models.pydantic_models import UserLoggingData
+import threading
+from functools import partial
+from operator import itemgetter
+from typing import Iterator, Optional, TYPE_CHECKING, Tuple
+from Storage.Backends.base_backend import StorageBackend
+from Storage.Backends.json_backend import JSONBackend
+from Storage.events import EventBus
+from Storage.indexing import HashIndex, SortedIndex, normalize_key
+from Storage.journal import Journal
+from Storage.listing import iter_listing, take_page, write_buffered
+from Storage.query_cache import QueryCache
+
+if TYPE_CHECKING:
+    from Pydantic_Models.pydantic_models import UserLoggingData
 
 
 class UserDB:
@@ -9,21 +22,29 @@ class UserDB:
     """
     _data: dict = {}
     _dbpath: str = os.path.join(os.path.dirname(__file__), 'UserData.json')
+    _backend: Optional[StorageBackend] = None  # Medium the users are persisted in, set by instantiate_data
+    _journal: Optional[Journal] = None  # Write-ahead journal attached by the ContextManager
+    _events: Optional[EventBus] = None  # Change event bus attached by the ContextManager
+    _name_index: HashIndex = HashIndex()  # name -> set of user IDs
+    _user_orders: dict = {}  # Listing order ("user_id" or "name") -> SortedIndex, built on first use
+    _user_query_cache: QueryCache = QueryCache()  # Recent name search results
+    _users_lock = threading.RLock()  # Serializes user mutations; reads do not take it
+    _changed_users: Optional[dict] = {}  # user ID -> user as of the last load or save (None if absent), for save-time merges
 
     @classmethod
-    def instantiate_data(cls) -> bool:
+    def instantiate_data(cls, backend: Optional[StorageBackend] = None) -> bool:
         """
-        Load existing user data from the JSON file into the class-level _data attribute.
+        Open the user store of the storage backend into the class-level _data attribute,
+        build the name index over it and schedule the build of the listing orders.
 
+        :param backend: The storage backend to use, by default the JSON file at _dbpath.
         :return: True if data is successfully loaded, False otherwise.
         """
+        cls._backend = backend or JSONBackend({"users": cls._dbpath})
+        cls._changed_users = {} if cls._backend.journaled else None  # Stores committing each mutation need no tracking
+        cls._name_index = cls._backend.create_index("users", "name")
         try:
-            with open(cls._dbpath, "r") as fp:
-                content = fp.read()
-                if content.strip():  # Check if the file content is not empty
-                    cls._data = json.loads(content)
-                else:
-                    cls._data = {}  # Initialize with an empty dictionary if file is empty
+            cls._data = cls._backend.load("users")
             return True
         except json.JSONDecodeError as e:
             print(f"Error decoding JSON data: {e}")
@@ -36,6 +57,75 @@ class UserDB:
         except Exception as e:
             print(f"Unable to instantiate data\nError: {e}")
             return False
+        finally:
+            field_items = getattr(cls._data, "field_items", None)  # Compact stores iterate a column, not records
+            cls._name_index.rebuild(field_items("name") if field_items is not None
+                                    else ((user["name"], user_id) for user_id, user in cls._data.items()))
+            cls._user_query_cache.invalidate()
+            cls._user_orders = {"user_id": SortedIndex(normalize=False), "name": SortedIndex()}
+            for field, index in cls._user_orders.items():
+                index.rebuild(partial(cls._user_order_pairs, field))
+
+    @classmethod
+    def _user_order_pairs(cls, field: str):
+        """
+        :param field: The field of a listing order.
+        :return: An iterator of the (field value, user ID) pairs of every user, to build the order from.
+        """
+        if field == "user_id":
+            return zip(cls._data, cls._data)
+        field_items = getattr(cls._data, "field_items", None)
+        if field_items is not None:
+            return field_items(field)
+        return zip(map(itemgetter(field), cls._data.values()), cls._data)
+
+    @classmethod
+    def _put_user(cls, record: dict) -> None:
+        """
+        Store a user record without any validation, keeping the name index and listing orders up to date.
+        Used by the public mutators and journal replay.
+
+        :param record: The user record, keyed in the store by its user ID.
+        """
+        user_id = record["user_id"]
+        previous = cls._data.get(user_id)
+        if cls._changed_users is not None and user_id not in cls._changed_users:
+            cls._changed_users[user_id] = previous
+        if previous is not None:
+            cls._name_index.discard(previous["name"], user_id)
+        cls._data[user_id] = record
+        cls._name_index.add(record["name"], user_id)
+        for field, index in cls._user_orders.items():
+            if previous is None or previous[field] != record[field]:
+                if previous is not None:
+                    index.discard(previous[field], user_id)
+                index.add(record[field], user_id)
+        cls._user_query_cache.invalidate()
+
+    @classmethod
+    def _drop_user(cls, user_id: str) -> None:
+        """
+        Remove a user record if it exists, keeping the name index and listing orders up to date.
+        Used by the public mutators and journal replay.
+
+        :param user_id: The ID of the user to remove.
+        """
+        record = cls._data.pop(user_id, None)
+        if record is not None:
+            if cls._changed_users is not None:
+                cls._changed_users.setdefault(user_id, record)
+            cls._name_index.discard(record["name"], user_id)
+            for field, index in cls._user_orders.items():
+                index.discard(record[field], user_id)
+            cls._user_query_cache.invalidate()
+
+    @staticmethod
+    def _event_record(record: dict) -> dict:
+        """
+        :param record: A user record.
+        :return: The user as published in the change events: every field but the password.
+        """
+        return {field: value for field, value in record.items() if field != "password"}
 
     @classmethod
     def _search_by_id(cls, user_id: str):
@@ -48,17 +138,19 @@ class UserDB:
         return cls._data.get(user_id)
 
     @classmethod
-    def _search_by_name(cls, name: str) -> dict:
+    def _search_by_name(cls, name: str, normalized: bool = False) -> dict:
         """
-        Search for users by name.
+        Search for users by name using the name index. Recent results are served from the query cache.
 
         :param name: The name of the user(s) to search for.
+        :param normalized: Ignore case and extra whitespace when True.
         :return: A dictionary of user IDs and corresponding names if found, empty dictionary otherwise.
         """
-        found_matches = {user_id: user_info["name"] for user_id, user_info in cls._data.items() if user_info["name"] == name}
-        return found_matches
+        key = ("name", normalized, normalize_key(name) if normalized else name)
+        return cls._user_query_cache.lookup(key, lambda: {user_id: cls._data[user_id]["name"]
+                                                          for user_id in cls._name_index.lookup(name, normalized)})
 
-    def verify_user(self, user_data: UserLoggingData) -> bool:
+    def verify_user(self, user_data: "UserLoggingData") -> bool:
         """
         Verify if the provided user credentials are correct.
 
@@ -72,73 +164,182 @@ class UserDB:
         return False
 
     @classmethod
-    def add_user(cls, user_data: UserLoggingData) -> bool:
+    def add_user(cls, user_data: "UserLoggingData") -> bool:
         """
         Add a new user to the database.
 
         :param user_data: The UserLoggingData object containing user information.
         :return: True if the user is added successfully, False if the user already exists.
         """
-        if user_data.user_id not in cls._data:
-            cls._data[user_data.user_id] = user_data.model_dump()
-            return True
-        print(f"User already exists with login ID: {user_data.user_id}")
-        return False
+        with cls._users_lock:
+            if user_data.user_id not in cls._data:
+                record = user_data.model_dump()
+                cls._put_user(record)
+                if cls._journal is not None:
+                    cls._journal.append("add_user", record=record)
+                if cls._events:
+                    cls._events.publish("user_added", record["user_id"], cls._event_record(record))
+                return True
+            print(f"User already exists with login ID: {user_data.user_id}")
+            return False
+
+    @classmethod
+    def add_users(cls, users: list) -> list:
+        """
+        Add a batch of already validated users without per-record output, journaling them together.
+        Users whose ID is empty or already present (in the store or earlier in the batch) are skipped.
+
+        :param users: A list of UserLoggingData objects.
+        :return: A list of (UserLoggingData, reason) tuples for the users that were not added.
+        """
+        records = [user_data.model_dump() for user_data in users]
+        models = {id(record): user_data for record, user_data in zip(records, users)}
+        return [(models[id(record)], reason) for record, reason in cls.add_user_records(records)]
+
+    @classmethod
+    def add_user_records(cls, records: list) -> list:
+        """
+        Add a batch of trusted user records (validated in bulk, see Storage/validation.py) as they are,
+        without building a model per record, journaling them together. Records whose user ID is empty
+        or already present (in the store or earlier in the batch) are skipped.
+
+        :param records: A list of user dictionaries with exactly the UserLoggingData fields.
+        :return: A list of (record, reason) tuples for the records that were not added.
+        """
+        with cls._users_lock:
+            rejected, added = [], []
+            with cls._backend.transaction():
+                for record in records:
+                    user_id = record["user_id"]
+                    if not user_id:
+                        rejected.append((record, "missing user ID"))
+                    elif user_id in cls._data:
+                        rejected.append((record, f"user already exists with login ID: {user_id}"))
+                    else:
+                        cls._put_user(record)
+                        added.append({"record": record})
+            if cls._journal is not None:
+                cls._journal.append_many("add_user", added)
+            if cls._events:
+                cls._events.publish_many("user_added", [(item["record"]["user_id"], cls._event_record(item["record"]))
+                                                        for item in added])
+            return rejected
 
     @classmethod
-    def update_password(cls, user_data: UserLoggingData) -> bool:
+    def update_password(cls, user_data: "UserLoggingData") -> bool:
         """
         Update the password for an existing user.
 
         :param user_data: The UserLoggingData object containing the updated password.
         :return: True if the password is updated successfully, False otherwise.
         """
-        stored_user = cls._search_by_id(user_data.user_id)
-        if not stored_user:
-            print("User does not exist")
-            return False
-        if stored_user["password"] == user_data.password:
-            print("Previous and new password cannot be the same")
-            return False
-        cls._data[user_data.user_id]["password"] = user_data.password
-        return True
+        with cls._users_lock:
+            stored_user = cls._search_by_id(user_data.user_id)
+            if not stored_user:
+                print("User does not exist")
+                return False
+            if stored_user["password"] == user_data.password:
+                print("Previous and new password cannot be the same")
+                return False
+            cls._put_user({**stored_user, "password": user_data.password})
+            if cls._journal is not None:
+                cls._journal.append("update_password", user_id=user_data.user_id, password=user_data.password)
+            if cls._events:
+                cls._events.publish("user_updated", user_data.user_id, cls._event_record(stored_user))
+            return True
 
     @classmethod
-    def delete_user(cls, user_data: UserLoggingData) -> bool:
+    def delete_user(cls, user_data: "UserLoggingData") -> bool:
         """
         Delete a user from the database.
 
         :param user_data: The UserLoggingData object of the user to delete.
         :return: True if the user is deleted successfully, False if the user does not exist.
         """
-        if user_data.user_id not in cls._data:
-            print("User does not exist")
-            return False
-        cls._data.pop(user_data.user_id)
-        return True
+        with cls._users_lock:
+            if user_data.user_id not in cls._data:
+                print("User does not exist")
+                return False
+            removed = cls._data[user_data.user_id] if cls._events else None
+            cls._drop_user(user_data.user_id)
+            if cls._journal is not None:
+                cls._journal.append("delete_user", user_id=user_data.user_id)
+            if cls._events:
+                cls._events.publish("user_deleted", user_data.user_id, cls._event_record(removed))
+            return True
 
     @classmethod
-    def _get_users(cls) -> None:
+    def _user_listing(cls, order: Optional[str] = None, offset: int = 0, cursor: Optional[str] = None):
         """
-        Display all users and their information.
+        :return: The lazy listing of the users (see iter_listing), building the sorted order on first use.
+        """
+        if order is None:
+            return iter_listing(cls._data, None, None, offset, cursor)
+        index = cls._user_orders.get(order)
+        if index is None:
+            raise ValueError(f"Unknown order '{order}', expected one of: {', '.join(cls._user_orders)}")
+        if not index.built:
+            with cls._users_lock:  # Build once, and not while a mutation is half applied
+                index.build()
+        return iter_listing(cls._data, index, order, offset, cursor)
+
+    @classmethod
+    def iter_users(cls, order: Optional[str] = None, offset: int = 0,
+                   cursor: Optional[str] = None) -> Iterator[Tuple[str, dict]]:
+        """
+        Lazily iterate over the users, without materializing the listing.
+
+        :param order: None for store order, or "user_id" or "name" (case-insensitive).
+        :param offset: The number of users to skip (after the cursor, if any).
+        :param cursor: A cursor returned by page_users, to resume after its page.
+        :return: An iterator of (user ID, user data) tuples.
+        """
+        return ((user_id, user) for _, user_id, user in cls._user_listing(order, offset, cursor))
+
+    @classmethod
+    def page_users(cls, order: Optional[str] = None, offset: int = 0, cursor: Optional[str] = None,
+                   limit: int = 20) -> tuple:
+        """
+        Get one page of users. Following the returned cursor rather than increasing the offset
+        neither repeats nor skips users when the store changes between pages.
+
+        :param order: None for store order, or "user_id" or "name" (case-insensitive).
+        :param offset: The number of users to skip (after the cursor, if any).
+        :param cursor: A cursor returned with the previous page.
+        :param limit: The maximum number of users on the page.
+        :return: (list of (user ID, user data) tuples, cursor of the next page or None on the last page).
+        """
+        return take_page(cls._user_listing(order, offset, cursor), order, limit)
+
+    @staticmethod
+    def _format_user(number: int, user_id: str, info: dict) -> str:
+        """
+        :return: The display text of a user in listings.
+        """
+        return f"User {number}:\nUser ID: {user_id}\nName: {info['name']}\n{'-' * 40}\n"
+
+    @classmethod
+    def _get_users(cls, order: Optional[str] = None) -> None:
+        """
+        Display all users and their information, written in buffered chunks.
+
+        :param order: None for store order, or "user_id" or "name".
         """
         if not cls._data:
             print("No users found.")
         else:
-            for idx, (user_id, info) in enumerate(cls._data.items(), start=1):
-                print(f"User {idx}:\nUser ID: {user_id}\nName: {info['name']}")
-                print("-" * 40)
+            write_buffered(cls._format_user(number, user_id, info)
+                           for number, (user_id, info) in enumerate(cls.iter_users(order), start=1))
 
     @classmethod
     def save_data(cls) -> bool:
         """
-        Save the user data to the JSON file.
+        Save the user data through the storage backend.
 
         :return: True if data is saved successfully, False otherwise.
         """
         try:
-            with open(cls._dbpath, "w") as fp:
-                json.dump(cls._data, fp, indent=4)  # Pretty printing for better readability
+            cls._backend.save("users", cls._data)
             return True
         except Exception as e:
             print(f"Unable to save data\nError: {e}")
@@ -0,0 +1,62 @@
+import sys
+import threading
+import time
+
+
+class Autosaver:
+    """
+    A background thread saving the ContextManager whenever it has unsaved changes and either
+    `interval` seconds have passed since the last save or `max_changes` records have changed,
+    whichever comes first. Together with the journal this bounds both the work a crash can cost
+    and the journal a restart has to replay, without the interactive loop ever waiting for a save.
+    """
+
+    def __init__(self, manager, interval: float = 30.0, max_changes: int = 1000, poll: float = 1.0):
+        """
+        :param manager: The ContextManager to save.
+        :param interval: Seconds after which pending changes are saved (0 disables the time policy).
+        :param max_changes: Number of changed records that triggers a save (0 disables the count policy).
+        :param poll: Seconds between two checks of the policy.
+        """
+        self.manager = manager
+        self.interval = interval
+        self.max_changes = max_changes
+        self.poll = poll
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="library-autosave", daemon=True)
+        self._last_save = time.monotonic()
+
+    def start(self) -> None:
+        """
+        Start the background thread.
+        """
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the background thread, waiting for a save in progress to finish.
+        """
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def due(self) -> bool:
+        """
+        :return: True if the policy calls for a save now.
+        """
+        pending = self.manager.pending_changes()
+        if not pending:
+            self._last_save = time.monotonic()  # Nothing is at risk, e.g. after an explicit save
+            return False
+        if self.max_changes and pending >= self.max_changes:
+            return True
+        return bool(self.interval) and time.monotonic() - self._last_save >= self.interval
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.poll):
+            if self.due():
+                try:
+                    self.manager.save_data(quiet=True)  # Its output would land amid that of the running command
+                except Exception as e:
+                    print(f"Autosave failed. Error: {e}", file=sys.stderr)
+                self._last_save = time.monotonic()
@@ -0,0 +1,110 @@
+import csv
+import json
+import os
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+
+def detect_format(path: str) -> str:
+    """
+    Infer the file format from its extension.
+
+    :param path: Path of the CSV or JSONL file.
+    :return: "csv" or "jsonl".
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    raise ValueError(f"Unsupported file format '{extension}', expected .csv or .jsonl")
+
+
+def iter_rows(path: str) -> Iterator[Tuple[int, object]]:
+    """
+    Stream the rows of a CSV (with a header line) or JSONL file one at a time.
+
+    :param path: Path of the file to read.
+    :return: An iterator of (line number, row) tuples. A JSONL line that is not valid JSON is
+             yielded as its raw text so that it can be reported as rejected.
+    """
+    fmt = detect_format(path)
+    with open(path, "r", newline="", encoding="utf-8") as fp:
+        if fmt == "csv":
+            reader = csv.DictReader(fp)
+            for row in reader:
+                row.pop(None, None)  # Drop surplus unnamed columns
+                yield reader.line_num, row
+        else:
+            for line_no, line in enumerate(fp, start=1):
+                if line.strip():
+                    try:
+                        yield line_no, json.loads(line)
+                    except json.JSONDecodeError:
+                        yield line_no, line.rstrip("\n")
+
+
+def import_records(path: str, validate: Callable[[list], Tuple[list, list]], insert_batch: Callable[[list], list],
+                   rejects_path: Optional[str] = None, chunk_size: int = 1000) -> Tuple[int, int]:
+    """
+    Stream a CSV/JSONL file into a store in fixed-size chunks, so memory use does not depend on
+    the file size. Every chunk is validated in a single call and its valid records are handed to
+    the store's batched insert. Rejected rows are written to a side file.
+
+    :param path: Path of the file to import.
+    :param validate: The batch validation of the rows, e.g. validate_records for the store, returning
+                     (valid records, list of (position, reason) tuples for the rejected rows).
+    :param insert_batch: The batched insert of the store, returning (record, reason) tuples for skipped records.
+    :param rejects_path: Where rejected rows are reported as JSONL (defaults to "<path>.rejects.jsonl").
+    :param chunk_size: The number of rows validated and inserted at a time.
+    :return: A tuple with the number of imported and rejected rows.
+    """
+    rejects_path = rejects_path or f"{path}.rejects.jsonl"
+    imported = rejected = 0
+    rows = iter_rows(path)
+    with open(rejects_path, "w", encoding="utf-8") as rejects:
+        def reject(line_no: int, row, reason: str) -> None:
+            rejects.write(json.dumps({"line": line_no, "row": row, "error": reason}) + "\n")
+
+        while chunk := list(islice(rows, chunk_size)):
+            records, invalid = validate([row for _, row in chunk])
+            for position, reason in invalid:
+                reject(*chunk[position], reason)
+            skipped = insert_batch(records)
+            if skipped:
+                invalid_positions = {position for position, _ in invalid}
+                valid_rows = (row for position, row in enumerate(chunk) if position not in invalid_positions)
+                line_numbers = {id(record): line_no for record, (line_no, _) in zip(records, valid_rows)}
+                for record, reason in skipped:
+                    reject(line_numbers[id(record)], record, reason)
+            imported += len(records) - len(skipped)
+            rejected += len(invalid) + len(skipped)
+    if not rejected:
+        os.remove(rejects_path)
+    return imported, rejected
+
+
+def export_records(path: str, records: Iterable[dict], fields: list, chunk_size: int = 1000) -> int:
+    """
+    Stream records into a CSV/JSONL file, writing them in buffered chunks.
+
+    :param path: Path of the file to write; the format is taken from its extension.
+    :param records: An iterable of record dictionaries, consumed lazily.
+    :param fields: The record fields to export, in column order.
+    :param chunk_size: The number of records formatted per write call.
+    :return: The number of exported records.
+    """
+    fmt = detect_format(path)
+    exported = 0
+    records = iter(records)
+    with open(path, "w", newline="", encoding="utf-8") as fp:
+        writer = csv.DictWriter(fp, fieldnames=fields, extrasaction="ignore") if fmt == "csv" else None
+        if writer is not None:
+            writer.writeheader()
+        while chunk := list(islice(records, chunk_size)):
+            if writer is not None:
+                writer.writerows(chunk)
+            else:
+                fp.write("".join(json.dumps({field: record[field] for field in fields}) + "\n" for record in chunk))
+            exported += len(chunk)
+    return exported
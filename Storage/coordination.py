@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+from typing import Callable
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows: locking degrades to a single process per Storage directory
+    fcntl = None
+
+
+class FileLock:
+    """
+    An advisory inter-process lock on a file (flock), coordinating every process that opens the
+    same Storage directory. Within a process it behaves like a threading.Lock: it is not reentrant
+    and any thread may release it. The operating system releases it if the process dies, so a
+    crashed process can never leave it held.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: The lock file, created if missing. Its content is irrelevant.
+        """
+        self.path = path
+        self._fp = None
+        self._thread_lock = threading.Lock()
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Take the lock exclusively.
+
+        :param blocking: When False, return immediately if another process or thread holds the lock.
+        :return: True if the lock is now held.
+        """
+        if not self._thread_lock.acquire(blocking):
+            return False
+        self._fp = open(self.path, "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._fp.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                self._fp.close()
+                self._fp = None
+                self._thread_lock.release()
+                return False
+        return True
+
+    def release(self) -> None:
+        """
+        Release the lock.
+        """
+        self._fp.close()  # Closing the descriptor drops the flock
+        self._fp = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+def read_versions(path: str) -> dict:
+    """
+    Read the version stamps of the stores.
+
+    :param path: The version file.
+    :return: A dictionary mapping store names to the number of saves they went through (empty if none yet).
+    """
+    try:
+        with open(path, "r") as fp:
+            return json.load(fp)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_atomically(path: str, write: Callable, fsync: bool = True, binary: bool = False) -> int:
+    """
+    Write a file through a temporary file renamed over it, so readers only ever see
+    the previous or the new complete content.
+
+    :param path: The destination file.
+    :param write: A callable receiving the open temporary file and writing the content.
+    :param fsync: Whether the content reaches the disk before the rename.
+    :param binary: Open the temporary file in binary mode instead of text mode.
+    :return: The size of the written file, in bytes.
+    """
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb" if binary else "w") as fp:
+            write(fp)
+            if fsync:
+                fp.flush()
+                os.fsync(fp.fileno())
+        os.replace(temp_path, path)
+        return os.path.getsize(path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def merge_store(current, fresh, changed: dict, put: Callable, drop: Callable) -> list:
+    """
+    Bring a store up to date with the copy saved by another process, keeping this process's changes.
+    A record changed both here and there since this process last loaded or saved it is a conflict:
+    the copy saved first wins and this process's change is discarded.
+
+    :param current: This process's in-memory store.
+    :param fresh: The store as saved on disk by the other process.
+    :param changed: A dictionary of the keys changed here since the last load or save, mapped to
+                    their value at that time (None if they were absent).
+    :param put: Stores a value in the in-memory store, keeping its indexes up to date: put(key, value).
+    :param drop: Removes a key from the in-memory store, keeping its indexes up to date: drop(key).
+    :return: The conflicting keys, sorted.
+    """
+    conflicts = set()
+    for key, base in changed.items():
+        saved = fresh.get(key)
+        if saved != base and saved != current.get(key):
+            conflicts.add(key)
+    for key, saved in fresh.items():
+        if (key not in changed or key in conflicts) and current.get(key) != saved:
+            put(key, saved)
+    for key in [key for key in current if key not in fresh and (key not in changed or key in conflicts)]:
+        drop(key)
+    return sorted(conflicts)
@@ -0,0 +1,103 @@
+import threading
+import time
+from bisect import bisect_left, insort
+from typing import Iterable, Optional
+
+DAY_SECONDS = 24 * 60 * 60
+
+
+def format_time(seconds: float) -> str:
+    """
+    :param seconds: A time, in seconds since the epoch.
+    :return: The local date and time, to the minute.
+    """
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(seconds))
+
+
+class DueIndex:
+    """
+    The loans ordered by due time, in a bucketed timing wheel: the copy IDs are spread over buckets
+    of bucket_seconds each, by their due time, and the numbers of the non-empty buckets are kept
+    sorted. Lending, returning and renewing a copy is a dictionary insertion and deletion; a bucket is
+    only added to or removed from the sorted numbers when it gets its first copy or loses its last one.
+
+    A range query ("overdue now", "due in the next N days") finds its first bucket with one bisection
+    and reads the buckets in order from there, so it costs O(log buckets + results) plus the loans of
+    the two boundary buckets that fall outside the range, whatever the number of loans.
+    """
+
+    def __init__(self, bucket_seconds: int = 60 * 60):
+        """
+        :param bucket_seconds: The span of due times of one bucket.
+        """
+        self._bucket_seconds = bucket_seconds
+        self._buckets = {}  # Bucket number -> {copy ID: due time}
+        self._numbers = []  # Numbers of the non-empty buckets, sorted
+        self._count = 0  # Copies in every bucket
+        self._lock = threading.Lock()  # Loans of different books change concurrently
+
+    def rebuild(self, dues: Iterable[tuple]) -> None:
+        """
+        Build the wheel from scratch.
+
+        :param dues: (copy ID, due time) pairs.
+        """
+        buckets = {}
+        for copy, due in dues:
+            buckets.setdefault(due // self._bucket_seconds, {})[copy] = due
+        with self._lock:
+            self._buckets = buckets
+            self._numbers = sorted(buckets)
+            self._count = sum(map(len, buckets.values()))
+
+    def add(self, copy: str, due: int) -> None:
+        """
+        Put a copy in the bucket of its due time.
+        """
+        number = due // self._bucket_seconds
+        with self._lock:
+            bucket = self._buckets.get(number)
+            if bucket is None:
+                bucket = self._buckets[number] = {}
+                insort(self._numbers, number)
+            bucket[copy] = due
+            self._count += 1
+
+    def discard(self, copy: str, due: int) -> None:
+        """
+        Take a copy out of the bucket of its due time, if it is there.
+        """
+        number = due // self._bucket_seconds
+        with self._lock:
+            bucket = self._buckets.get(number)
+            if bucket is None or bucket.pop(copy, None) is None:
+                return
+            self._count -= 1
+            if not bucket:
+                del self._buckets[number]
+                del self._numbers[bisect_left(self._numbers, number)]
+
+    def between(self, start: Optional[int], end: int, limit: Optional[int] = None) -> list:
+        """
+        :param start: The earliest due time included, None for no lower bound.
+        :param end: The due time from which copies are excluded.
+        :param limit: The maximum number of copies returned, None for all of them.
+        :return: (due time, copy ID) pairs of the copies due in [start, end), soonest due first.
+        """
+        found = []
+        with self._lock:
+            position = 0 if start is None else bisect_left(self._numbers, start // self._bucket_seconds)
+            while position < len(self._numbers) and (limit is None or len(found) < limit):
+                number = self._numbers[position]
+                if number * self._bucket_seconds >= end:
+                    break
+                found += sorted((due, copy) for copy, due in self._buckets[number].items()
+                                if (start is None or due >= start) and due < end)
+                position += 1
+        return found if limit is None else found[:limit]
+
+    def __len__(self) -> int:
+        """
+        :return: The number of copies in the wheel.
+        """
+        return self._count
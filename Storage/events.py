@@ -0,0 +1,337 @@
+import json
+import os
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Optional, Tuple
+
+# The type of every change event, and the store it changes. An event is a dictionary
+# {"type", "key", "data", "time"}: the key of the record changed (ISBN, user ID, copy ID or hold ID),
+# the record added or changed, or the record removed, and the time of the change in seconds since the
+# epoch. The loan events carry the loan as the due date listings return it (copy, isbn, user_id and,
+# for loans that have them, checked_out, due and renewals); the user events leave the password out.
+EVENT_TYPES = {
+    "book_added": "books", "book_updated": "books", "book_deleted": "books",
+    "user_added": "users", "user_updated": "users", "user_deleted": "users",
+    "checkout": "loans", "checkin": "loans", "renewal": "loans",
+    "hold_placed": "holds", "hold_dropped": "holds",
+}
+
+_STOP = object()  # Queued after the last event of a closed subscription
+
+
+class Subscription:
+    """
+    A subscriber of an EventBus: its handler, the event types it receives and its delivery counters.
+    A queued subscription hands the events to a thread of its own, in order, so a slow handler
+    never delays the operation that changed the library.
+    """
+
+    def __init__(self, handler: Callable[[dict], object], types: Optional[Iterable[str]] = None,
+                 queued: bool = False, max_pending: int = 0, name: Optional[str] = None):
+        """
+        :param handler: Called with every event, which it must not modify.
+        :param types: The event types delivered, None for all of them (see EVENT_TYPES).
+        :param queued: Deliver the events from a background thread instead of the changing thread.
+        :param max_pending: Number of queued events after which the changes wait for the handler (0 for no limit).
+        :param name: The name of the subscriber in messages and stats, by default that of the handler.
+        """
+        self.handler = handler
+        self.types = None if types is None else frozenset(types)
+        unknown = (self.types or frozenset()) - EVENT_TYPES.keys()
+        if unknown:
+            raise ValueError(f"Unknown event type(s) {', '.join(sorted(unknown))}, expected some of: "
+                             f"{', '.join(EVENT_TYPES)}")
+        self.name = name or getattr(handler, "__name__", type(handler).__name__)
+        self.delivered = 0
+        self.failed = 0  # Events the handler raised an exception on
+        self._queue = queue.Queue(max_pending) if queued else None
+        self._thread = None
+        if queued:
+            self._thread = threading.Thread(target=self._run, name=f"library-events-{self.name}", daemon=True)
+            self._thread.start()
+
+    def deliver(self, event: dict) -> None:
+        """
+        Hand an event to the handler, or to the queue of the background thread.
+
+        :param event: The change event.
+        """
+        if self.types is not None and event["type"] not in self.types:
+            return
+        if self._queue is None:
+            self._handle(event)
+        else:
+            self._queue.put(event)
+
+    def _handle(self, event: dict) -> None:
+        try:
+            self.handler(event)
+            self.delivered += 1
+        except Exception as e:  # The change is already made: a failing subscriber cannot undo it
+            self.failed += 1
+            print(f"Event subscriber {self.name} failed on a {event['type']} event. Error: {e}")
+
+    def _run(self) -> None:
+        while True:
+            event = self._queue.get()
+            try:
+                if event is _STOP:
+                    return
+                self._handle(event)
+            finally:
+                self._queue.task_done()
+
+    def drain(self) -> None:
+        """
+        Wait until the background thread has handled every queued event.
+        """
+        if self._queue is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        """
+        Stop delivering events, handling those already queued first.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        close = getattr(self.handler, "close", None)  # The sinks below
+        if close is not None:
+            close()
+
+    def stats(self) -> dict:
+        """
+        :return: The name, event types, delivery mode and counters of the subscription.
+        """
+        return {"name": self.name, "types": None if self.types is None else sorted(self.types),
+                "queued": self._queue is not None, "delivered": self.delivered, "failed": self.failed,
+                "pending": self._queue.qsize() if self._queue is not None else 0}
+
+
+class EventBus:
+    """
+    An in-process change data capture bus: BookDB, UserDB and the ContextManager publish an event
+    for every change they make (see EVENT_TYPES), so downstream consumers (search replicas, reports,
+    notifications) maintain their state incrementally instead of re-reading the stores.
+
+    Events are published by the changing thread while it holds the locks of the change, so every
+    subscriber receives them in the order the changes were made. A synchronous subscriber is called
+    right there, and should be quick and must not change the library itself; a queued one is called
+    from its own thread. Changes replayed from a journal or merged from another process's save are
+    not published again. Without subscribers, publishing costs a single test.
+    """
+
+    def __init__(self):
+        self._subscriptions = ()  # Replaced, never changed in place, so publish reads it without the lock
+        self._lock = threading.RLock()  # Orders the events; reentrant for handlers publishing on the same thread
+        self.published = 0
+
+    def __bool__(self) -> bool:
+        """
+        :return: True if anyone is subscribed, i.e. the events are worth building.
+        """
+        return bool(self._subscriptions)
+
+    def subscribe(self, handler: Callable[[dict], object], types: Optional[Iterable[str]] = None,
+                  queued: bool = False, max_pending: int = 0, name: Optional[str] = None) -> Subscription:
+        """
+        Subscribe a handler to the change events (see Subscription for the parameters).
+
+        :return: The subscription, to drain, unsubscribe or read the counters of.
+        """
+        subscription = Subscription(handler, types, queued, max_pending, name)
+        with self._lock:
+            self._subscriptions += (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Stop delivering events to a subscription, once it has handled those already queued.
+
+        :param subscription: A subscription returned by subscribe.
+        """
+        with self._lock:
+            self._subscriptions = tuple(other for other in self._subscriptions if other is not subscription)
+        subscription.close()
+
+    def publish(self, event_type: str, key: str, data: Optional[dict]) -> None:
+        """
+        Deliver a change event to every subscriber.
+
+        :param event_type: The type of the change, one of EVENT_TYPES.
+        :param key: The key of the record changed.
+        :param data: The record added or changed, or the record removed.
+        """
+        self.publish_many(event_type, [(key, data)])
+
+    def publish_many(self, event_type: str, changes: list) -> None:
+        """
+        Deliver the events of several changes of the same type, e.g. of a bulk import, in one go.
+
+        :param event_type: The type of the changes, one of EVENT_TYPES.
+        :param changes: A list of (key, data) tuples, as given to publish.
+        """
+        subscriptions = self._subscriptions
+        if not subscriptions or not changes:
+            return
+        now = time.time()
+        with self._lock:
+            for key, data in changes:
+                event = {"type": event_type, "key": key, "data": data, "time": now}
+                for subscription in subscriptions:
+                    subscription.deliver(event)
+            self.published += len(changes)
+
+    def drain(self) -> None:
+        """
+        Wait until every queued subscriber has handled the events published so far.
+        """
+        for subscription in self._subscriptions:
+            subscription.drain()
+
+    def close(self) -> None:
+        """
+        Unsubscribe everyone, handling the queued events first and closing the sinks.
+        """
+        with self._lock:
+            subscriptions, self._subscriptions = self._subscriptions, ()
+        for subscription in subscriptions:
+            subscription.close()
+
+    def stats(self) -> dict:
+        """
+        :return: The number of events published and the counters of every subscription.
+        """
+        return {"published": self.published, "subscribers": [subscription.stats()
+                                                             for subscription in self._subscriptions]}
+
+
+class EventLog:
+    """
+    A file sink: the events appended to a file, one JSON line each, which consumers read from the offset
+    they reached (see read_events) to resume where they stopped, e.g. after a restart. Several processes
+    can append to the same log: each event is a single write to a file opened for appending.
+    """
+
+    def __init__(self, path: str, fsync: bool = False):
+        """
+        Open (or create) the log for appending.
+
+        :param path: Location of the log file.
+        :param fsync: Whether every event is fsync'ed to disk before the change returns.
+        """
+        self.path = path
+        self.fsync = fsync
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        with open(path, "rb") as fp:
+            if fp.seek(0, os.SEEK_END):
+                fp.seek(-1, os.SEEK_END)
+                if fp.read(1) != b"\n":  # A line torn by a crash is ended, so the next event starts a line
+                    os.write(self._fd, b"\n")
+
+    def __call__(self, event: dict) -> None:
+        """
+        Append an event to the log.
+
+        :param event: The change event.
+        """
+        os.write(self._fd, json.dumps(event, separators=(",", ":")).encode("utf-8") + b"\n")
+        if self.fsync:
+            os.fsync(self._fd)
+
+    def close(self) -> None:
+        """
+        Close the log file.
+        """
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def read_events(path: str, offset: int = 0, limit: Optional[int] = None) -> Tuple[list, int]:
+    """
+    Read the events of an event log from an offset. A consumer keeps the returned offset with the state
+    it derived from the events, and passes it back to resume without missing or repeating any event.
+
+    :param path: Location of the log file.
+    :param offset: The offset returned by the previous read, 0 to read the log from its start.
+    :param limit: The maximum number of events read, None for all of them.
+    :return: (list of events, offset of the next event). The offset only moves past whole lines, so an
+             event being written is read by the next call; lines torn by a crash are skipped.
+    """
+    events = []
+    try:
+        with open(path, "rb") as fp:
+            if offset:
+                fp.seek(offset - 1)
+                if fp.read(1) != b"\n":
+                    raise ValueError(f"Offset {offset} is not the start of an event of {path}")
+            while limit is None or len(events) < limit:
+                line = fp.readline()
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    continue  # Ended when the log was reopened, or empty
+    except FileNotFoundError:
+        pass  # Nothing was published yet
+    return events, offset
+
+
+class SocketSink:
+    """
+    A socket sink: the events streamed as JSON lines to a local listener, e.g. a notification daemon,
+    over a Unix socket or TCP. The connection is opened on the first event and reopened after an error;
+    events that cannot be sent fail the subscriber rather than the change, so a consumer that must see
+    every event reads an EventLog from its offset instead.
+    """
+
+    def __init__(self, address: str, timeout: float = 5.0):
+        """
+        :param address: The path of a Unix socket, or "host:port".
+        :param timeout: Seconds a send may block before the event is given up.
+        """
+        self.address = address
+        self.timeout = timeout
+        self._socket = None
+
+    def _connect(self):
+        import socket  # Imported by the sinks only: it costs the command line's one-shot commands 10 ms
+
+        if ":" in self.address and not os.path.exists(self.address):
+            host, _, port = self.address.rpartition(":")
+            connection = socket.create_connection((host, int(port)), self.timeout)
+        else:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.settimeout(self.timeout)
+            connection.connect(self.address)
+        return connection
+
+    def __call__(self, event: dict) -> None:
+        """
+        Send an event to the listener, reconnecting once if the connection was lost.
+
+        :param event: The change event.
+        """
+        line = json.dumps(event, separators=(",", ":")).encode("utf-8") + b"\n"
+        for attempt in range(2):
+            try:
+                if self._socket is None:
+                    self._socket = self._connect()
+                self._socket.sendall(line)
+                return
+            except OSError:
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self) -> None:
+        """
+        Close the connection, if open.
+        """
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
@@ -0,0 +1,116 @@
+import threading
+from bisect import bisect_left, insort
+from typing import Iterable, Optional
+from Storage.inventory import COPY_SEPARATOR
+
+
+def hold_id(isbn: str, user_id: str) -> str:
+    """
+    :param isbn: The ISBN of the book held.
+    :param user_id: The ID of the user waiting for it.
+    :return: The key of the hold in the holds store. A user has at most one hold per book, and ISBNs
+             cannot contain the separator, so the key is unambiguous.
+    """
+    return f"{isbn}{COPY_SEPARATOR}{user_id}"
+
+
+def hold_isbn(key: str) -> str:
+    """
+    :param key: The key of a hold.
+    :return: The ISBN of the book held.
+    """
+    return key.partition(COPY_SEPARATOR)[0]
+
+
+def _entry(hold: dict) -> tuple:
+    """
+    :return: The sort entry of a hold in its book's queue: higher priorities first, then first come, first served.
+    """
+    return -hold["priority"], hold["placed"], hold["user_id"]
+
+
+class HoldQueues:
+    """
+    The waiting lists of the books, built from the holds store and maintained on every change to it.
+
+    Every book with holds has its own sorted list of queue entries, so the next holder is its first
+    entry and a queue position is one bisection, whatever the number of holds on other books.
+    Queues are short (the patrons waiting for one book), so inserting into and removing from the
+    middle of one is a small memory move.
+    """
+
+    def __init__(self):
+        self._queues = {}  # ISBN -> sorted list of (-priority, placed, user ID) entries
+        self._count = 0  # Holds in every queue
+        self._lock = threading.Lock()  # Holds on different books change concurrently
+
+    def rebuild(self, holds: Iterable[dict]) -> None:
+        """
+        Build every queue from scratch.
+
+        :param holds: The hold records.
+        """
+        queues = {}
+        for hold in holds:
+            queues.setdefault(hold["isbn"], []).append(_entry(hold))
+        for queue in queues.values():
+            queue.sort()
+        with self._lock:
+            self._queues = queues
+            self._count = sum(map(len, queues.values()))
+
+    def add(self, hold: dict) -> None:
+        """
+        Put a hold in its book's queue.
+        """
+        with self._lock:
+            insort(self._queues.setdefault(hold["isbn"], []), _entry(hold))
+            self._count += 1
+
+    def discard(self, hold: dict) -> None:
+        """
+        Take a hold out of its book's queue, if it is there.
+        """
+        entry = _entry(hold)
+        with self._lock:
+            queue = self._queues.get(hold["isbn"])
+            if not queue:
+                return
+            position = bisect_left(queue, entry)
+            if position < len(queue) and queue[position] == entry:
+                del queue[position]
+                self._count -= 1
+                if not queue:
+                    del self._queues[hold["isbn"]]
+
+    def first(self, isbn: str) -> Optional[str]:
+        """
+        :return: The ID of the user next in line for a book, None if nobody waits for it.
+        """
+        queue = self._queues.get(isbn)
+        return queue[0][2] if queue else None
+
+    def position(self, hold: dict) -> int:
+        """
+        :return: The position of a hold in its book's queue, from 1.
+        """
+        return bisect_left(self._queues.get(hold["isbn"], ()), _entry(hold)) + 1
+
+    def waiting(self, isbn: str) -> list:
+        """
+        :return: The IDs of the users waiting for a book, next in line first.
+        """
+        return [entry[2] for entry in self._queues.get(isbn, ())]
+
+    def length(self, isbn: str) -> int:
+        """
+        :return: The number of users waiting for a book.
+        """
+        return len(self._queues.get(isbn, ()))
+
+    def counts(self) -> dict:
+        """
+        :return: The number of holds and the number of books with a hold on them.
+        """
+        with self._lock:
+            return {"holds": self._count, "books_held": len(self._queues)}
@@ -0,0 +1,318 @@
+import gc
+import threading
+from bisect import bisect_left, bisect_right, insort
+from operator import itemgetter
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+
+def normalize_key(value: str) -> str:
+    """
+    Normalize a value for case- and whitespace-insensitive matching.
+
+    :param value: The raw value, e.g. a title or a name.
+    :return: The value casefolded with runs of whitespace collapsed into single spaces.
+    """
+    return " ".join(value.split()).casefold()
+
+
+class HashIndex:
+    """
+    A secondary hash index mapping a field value to the record keys holding it.
+    A second map keyed on the precomputed normalized value serves insensitive lookups.
+
+    Most values (titles, for instance) are held by a single record, so an entry is the record key
+    itself until a second key joins it and it becomes a set: a one-element set costs about ten
+    times the memory of the reference, and creating a million of them dominated the index build.
+    """
+
+    def __init__(self, normalize: bool = True):
+        """
+        Create an empty index.
+
+        :param normalize: Whether to maintain the normalized map for insensitive lookups.
+        """
+        self.normalize = normalize
+        self._exact: dict = {}  # value -> record key, or set of record keys
+        self._normalized: dict = {}  # normalized value -> record key, or set of record keys
+
+    def __len__(self) -> int:
+        """
+        :return: The number of distinct values in the index.
+        """
+        return len(self._exact)
+
+    @staticmethod
+    def _add_entry(index: dict, index_key: str, key) -> None:
+        entry = index.get(index_key)
+        if entry is None:
+            index[index_key] = key
+        elif isinstance(entry, set):
+            entry.add(key)
+        elif entry != key:
+            index[index_key] = {entry, key}
+
+    @staticmethod
+    def _discard_entry(index: dict, index_key: str, key) -> None:
+        entry = index.get(index_key)
+        if isinstance(entry, set):
+            entry.discard(key)
+            if len(entry) == 1:
+                index[index_key] = next(iter(entry))
+        elif entry is not None and entry == key:
+            del index[index_key]
+
+    def add(self, value: str, key: str) -> None:
+        """
+        Register a record key under the given value.
+
+        :param value: The indexed field value.
+        :param key: The key of the record holding the value.
+        """
+        self._add_entry(self._exact, value, key)
+        if self.normalize:
+            self._add_entry(self._normalized, normalize_key(value), key)
+
+    def discard(self, value: str, key: str) -> None:
+        """
+        Remove a record key from the given value, dropping the value once it has no keys left.
+
+        :param value: The indexed field value.
+        :param key: The key of the record that held the value.
+        """
+        self._discard_entry(self._exact, value, key)
+        if self.normalize:
+            self._discard_entry(self._normalized, normalize_key(value), key)
+
+    def lookup(self, value: str, normalized: bool = False) -> set:
+        """
+        Find the record keys holding the given value.
+
+        :param value: The value to look up.
+        :param normalized: Match case- and whitespace-insensitively when True.
+        :return: A set of matching record keys (empty if none match).
+        """
+        entry = self._normalized.get(normalize_key(value)) if normalized else self._exact.get(value)
+        if entry is None:
+            return set()
+        return set(entry) if isinstance(entry, set) else {entry}
+
+    def rebuild(self, pairs: Iterable[Tuple[str, str]]) -> None:
+        """
+        Replace the index content with the given (value, key) pairs.
+
+        :param pairs: An iterable of (field value, record key) tuples.
+        """
+        self.clear()
+        exact = self._exact
+        for value, key in pairs:  # _add_entry inlined: this loop runs once per record at startup
+            entry = exact.get(value)
+            if entry is None:
+                exact[value] = key
+            elif isinstance(entry, set):
+                entry.add(key)
+            elif entry != key:
+                exact[value] = {entry, key}
+        if self.normalize:  # Normalize every distinct value once rather than once per record
+            normalized = self._normalized
+            for value, entry in exact.items():
+                normalized_value = normalize_key(value)
+                existing = normalized.get(normalized_value)
+                if existing is None:
+                    normalized[normalized_value] = set(entry) if isinstance(entry, set) else entry
+                else:
+                    if not isinstance(existing, set):
+                        existing = normalized[normalized_value] = {existing}
+                    if isinstance(entry, set):
+                        existing.update(entry)
+                    else:
+                        existing.add(entry)
+
+    def clear(self) -> None:
+        """
+        Remove every entry from the index.
+        """
+        self._exact.clear()
+        self._normalized.clear()
+
+
+class LazyIndex(HashIndex):
+    """
+    A HashIndex that defers its rebuild until the first lookup, for stores that are loaded
+    lazily and should not be scanned at startup. Until then add and discard are no-ops, as the
+    deferred rebuild reads the store in its current state.
+    """
+
+    def __init__(self, normalize: bool = True):
+        """
+        Create an empty index.
+
+        :param normalize: Whether to maintain the normalized map for insensitive lookups.
+        """
+        super().__init__(normalize)
+        self._pending = None  # The (value, key) pairs of the deferred rebuild
+        self._rebuild_lock = threading.Lock()  # Concurrent first lookups run the rebuild only once
+
+    def add(self, value: str, key: str) -> None:
+        if self._pending is None:
+            super().add(value, key)
+
+    def discard(self, value: str, key: str) -> None:
+        if self._pending is None:
+            super().discard(value, key)
+
+    def lookup(self, value: str, normalized: bool = False) -> set:
+        if self._pending is not None:
+            with self._rebuild_lock:
+                if self._pending is not None:
+                    HashIndex.rebuild(self, self._pending)
+                    self._pending = None
+        return super().lookup(value, normalized)
+
+    def rebuild(self, pairs) -> None:
+        """
+        Schedule a rebuild from the given (value, key) pairs. They are consumed on the next
+        lookup, so they should be a lazy iterable over the store.
+
+        :param pairs: An iterable of (field value, record key) tuples.
+        """
+        self.clear()
+        self._pending = pairs
+
+
+class SortedIndex:
+    """
+    Record keys kept sorted on a field, for paginated listings. Entries are (sort value, record key)
+    tuples in one sorted list, so a page is a bisect and a slice, and ties on the value are broken
+    by the record key, which makes any entry a stable cursor.
+
+    The list is built on first use, like LazyIndex, so listings that are never sorted cost nothing at
+    startup. After that, added entries go to an unsorted tail merged on the next read: a few of them are
+    inserted with bisect, a bulk import's worth is appended and sorted at once, instead of shifting half
+    of the list for every record.
+    """
+
+    def __init__(self, normalize: bool = True):
+        """
+        Create an empty index.
+
+        :param normalize: Whether to sort on the normalized value (case- and whitespace-insensitive order).
+        """
+        self.normalize = normalize
+        self._entries: list = []  # Sorted (sort value, record key) tuples
+        self._tail: list = []  # Entries added since the last read, not sorted yet
+        self._pending = None  # The (value, key) pairs of the deferred build
+        self._lock = threading.Lock()  # Guards the merge of the tail against concurrent mutations
+
+    def __len__(self) -> int:
+        """
+        :return: The number of entries in the index, once built.
+        """
+        return len(self._entries) + len(self._tail)
+
+    @property
+    def built(self) -> bool:
+        """
+        :return: False while the build from the pairs given to rebuild is still deferred.
+        """
+        return self._pending is None
+
+    def sort_value(self, value: str) -> str:
+        """
+        :param value: The raw field value.
+        :return: The value the entries are ordered by.
+        """
+        return normalize_key(value) if self.normalize else value
+
+    def add(self, value: str, key: str) -> None:
+        """
+        Register a record key under the given value.
+
+        :param value: The sorted field value.
+        :param key: The key of the record holding the value.
+        """
+        if self._pending is None:
+            entry = (self.sort_value(value), key)
+            with self._lock:
+                self._tail.append(entry)
+
+    def discard(self, value: str, key: str) -> None:
+        """
+        Remove the entry of a record key, if present.
+
+        :param value: The sorted field value the record held.
+        :param key: The key of the record.
+        """
+        if self._pending is not None:
+            return
+        entry = (self.sort_value(value), key)
+        with self._lock:
+            entries = self._entries
+            position = bisect_left(entries, entry)
+            if position < len(entries) and entries[position] == entry:
+                del entries[position]
+            elif entry in self._tail:
+                self._tail.remove(entry)
+
+    def rebuild(self, pairs: Callable[[], Iterable[Tuple[str, str]]]) -> None:
+        """
+        Schedule a rebuild from the store as it will be on first use.
+
+        :param pairs: A function returning an iterable of (field value, record key) tuples. It is called
+                      on first use rather than now, as an iterator over a dictionary cannot outlive changes to it.
+        """
+        with self._lock:
+            self._entries, self._tail, self._pending = [], [], pairs
+
+    def build(self) -> None:
+        """
+        Run the deferred build, if any. The caller must keep the store from changing meanwhile.
+        """
+        with self._lock:
+            if self._pending is None:
+                return
+            gc_enabled = gc.isenabled()
+            gc.disable()  # Allocating a million tuples would otherwise trigger collections scanning all of them
+            try:
+                entries = list(self._pending())
+                if self.normalize:  # Normalize every distinct value once rather than once per record
+                    values = list(map(itemgetter(0), entries))
+                    normalized = {value: normalize_key(value) for value in set(values)}
+                    entries = list(zip(map(normalized.__getitem__, values), map(itemgetter(1), entries)))
+                entries.sort()
+            finally:
+                if gc_enabled:
+                    gc.enable()
+            self._entries, self._pending = entries, None
+
+    def _merge_tail(self) -> None:
+        entries, tail = self._entries, self._tail
+        if len(tail) * 2000 < len(entries):  # A few changes: inserting moves less than a sort compares
+            for entry in tail:
+                insort(entries, entry)
+        else:
+            entries += tail
+            entries.sort()
+        self._tail = []
+
+    def chunks(self, after: Optional[tuple] = None, offset: int = 0, chunk_size: int = 500) -> Iterator[list]:
+        """
+        Iterate over the entries in order, one chunk at a time. Each chunk is located afresh by bisecting
+        past the last entry of the previous one, so mutations between chunks neither break the iteration
+        nor repeat or skip the entries that did not change.
+
+        :param after: Start after this (sort value, record key) entry; from the first entry when None.
+        :param offset: The number of entries to skip first (after the given entry, if any).
+        :param chunk_size: The number of entries per chunk.
+        :return: An iterator of lists of (sort value, record key) tuples.
+        """
+        self.build()
+        while True:
+            with self._lock:
+                if self._tail:
+                    self._merge_tail()
+                start = (bisect_right(self._entries, after) if after is not None else 0) + offset
+                chunk = self._entries[start:start + chunk_size]
+            if not chunk:
+                return
+            yield chunk
+            after, offset = chunk[-1], 0
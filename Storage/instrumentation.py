@@ -0,0 +1,283 @@
+import bisect
+import functools
+import io
+import json
+import threading
+import time
+
+# Upper bounds of the latency histogram buckets, in seconds (the last bucket is unbounded)
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# The instrumented operations: (owner class name, method name). The owners are resolved lazily
+# to avoid an import cycle with the storage modules.
+OPERATIONS = (
+    ("BookDB", "instantiate_data"), ("UserDB", "instantiate_data"),
+    ("ContextManager", "_load_previous_context"), ("ContextManager", "_replay_journal"),
+    ("BookDB", "_search_by_isbn"), ("BookDB", "_search_by_title"), ("BookDB", "_search_by_author"),
+    ("BookDB", "_search_full_text"), ("UserDB", "_search_by_id"), ("UserDB", "_search_by_name"),
+    ("BookDB", "add_book"), ("BookDB", "add_books"), ("BookDB", "update_book"), ("BookDB", "delete_book"),
+    ("UserDB", "add_user"), ("UserDB", "add_users"), ("UserDB", "update_password"), ("UserDB", "delete_user"),
+    ("ContextManager", "remove_book"), ("ContextManager", "remove_user"),
+    ("BookDB", "_get_books"), ("UserDB", "_get_users"), ("BookDB", "page_books"), ("UserDB", "page_users"),
+    ("BookDB", "page_available_books"), ("BookDB", "inventory_counts"),
+    ("ContextManager", "books_held_by"),
+    ("ContextManager", "checkout"), ("ContextManager", "checkin"), ("ContextManager", "is_book_available"),
+    ("ContextManager", "checkout_many"), ("ContextManager", "checkin_many"),
+    ("ContextManager", "place_hold"), ("ContextManager", "cancel_hold"), ("ContextManager", "holds_of"),
+    ("ContextManager", "renew"), ("ContextManager", "overdue_loans"), ("ContextManager", "loans_due_within"),
+    ("ContextManager", "import_books"), ("ContextManager", "import_users"),
+    ("ContextManager", "export_books"), ("ContextManager", "export_users"),
+    ("ContextManager", "save_data"),
+)
+
+
+class OperationStats:
+    """
+    Call count, outcome counts and latency histogram of one operation.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0  # Calls that raised an exception
+        self.failures = 0  # Calls that returned False, the storage layer's way of refusing an operation
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def record(self, seconds: float, outcome) -> None:
+        """
+        Account for one call.
+
+        :param seconds: The duration of the call.
+        :param outcome: The value returned by the call, or the exception it raised.
+        """
+        self.calls += 1
+        if isinstance(outcome, BaseException):
+            self.errors += 1
+        elif outcome is False:
+            self.failures += 1
+        self.total_seconds += seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def percentile(self, fraction: float) -> float:
+        """
+        Estimate a latency percentile from the histogram.
+
+        :param fraction: The percentile as a fraction, e.g. 0.99.
+        :return: The upper bound of the bucket holding the percentile (the maximum for the last bucket), in seconds.
+        """
+        rank, seen = fraction * self.calls, 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank and seen:
+                return min(bound, self.max_seconds)
+        return self.max_seconds
+
+    def to_dict(self) -> dict:
+        """
+        :return: The statistics as a JSON-serializable dictionary.
+        """
+        return {"calls": self.calls, "errors": self.errors, "failures": self.failures,
+                "total_seconds": self.total_seconds,
+                "mean_seconds": self.total_seconds / self.calls if self.calls else 0.0,
+                "p50_seconds": self.percentile(0.5), "p90_seconds": self.percentile(0.9),
+                "p99_seconds": self.percentile(0.99), "max_seconds": self.max_seconds,
+                "buckets": {str(bound): count for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), self.buckets)}}
+
+
+class Instrumentation:
+    """
+    Records call counts, errors and latency histograms of the storage operations listed in OPERATIONS.
+
+    While disabled the operations are the plain, unwrapped methods, so instrumentation costs nothing.
+    enable() replaces each of them on its defining class with a timing wrapper, which covers every
+    caller (the menu, the batch runner, the HTTP service) and disable() puts the originals back.
+    The statistics survive disable() until reset().
+
+    Set LIBRARY_INSTRUMENTATION=1 to enable it from startup, so loading is measured too.
+    """
+    _stats: dict = {}  # "Class.method" -> OperationStats
+    _originals: dict = {}  # (owner class, method name) -> original class attribute, while enabled
+    _profiles: dict = {}  # "Class.method" -> path of the profile of its next call
+    _lock = threading.Lock()  # Guards _stats, as operations run concurrently in the service
+
+    @classmethod
+    def enabled(cls) -> bool:
+        """
+        :return: True if the operations are currently instrumented.
+        """
+        return bool(cls._originals)
+
+    @classmethod
+    def _owners(cls) -> dict:
+        from Storage.BookDB.book_storage_handling import BookDB
+        from Storage.UserDB.user_storage_handling import UserDB
+        from Storage.storage import ContextManager
+        return {"BookDB": BookDB, "UserDB": UserDB, "ContextManager": ContextManager}
+
+    @classmethod
+    def enable(cls) -> None:
+        """
+        Wrap every operation in a timing wrapper. Does nothing if already enabled.
+        """
+        if cls.enabled():
+            return
+        owners = cls._owners()
+        for owner_name, method in OPERATIONS:
+            owner = owners[owner_name]
+            original = owner.__dict__[method]
+            cls._originals[(owner, method)] = original
+            setattr(owner, method, cls._wrap(f"{owner_name}.{method}", original))
+
+    @classmethod
+    def disable(cls) -> None:
+        """
+        Restore the unwrapped operations.
+        """
+        for (owner, method), original in cls._originals.items():
+            setattr(owner, method, original)
+        cls._originals = {}
+
+    @classmethod
+    def reset(cls) -> None:
+        """
+        Forget every recorded statistic.
+        """
+        with cls._lock:
+            cls._stats = {}
+
+    @classmethod
+    def _wrap(cls, name: str, original):
+        """
+        Build the timing wrapper of an operation, keeping its kind (classmethod, staticmethod or method).
+
+        :param name: The operation name, "Class.method".
+        :param original: The class attribute holding the operation.
+        :return: The replacement class attribute.
+        """
+        kind = type(original) if isinstance(original, (classmethod, staticmethod)) else None
+        function = original.__func__ if kind else original
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            if cls._profiles and name in cls._profiles:
+                return cls._profile_call(name, function, args, kwargs)
+            clock = time.perf_counter
+            started = clock()
+            try:
+                outcome = function(*args, **kwargs)
+            except BaseException as e:
+                cls._record(name, clock() - started, e)
+                raise
+            cls._record(name, clock() - started, outcome)
+            return outcome
+
+        return kind(timed) if kind else timed
+
+    @classmethod
+    def _record(cls, name: str, seconds: float, outcome) -> None:
+        with cls._lock:
+            stats = cls._stats.get(name)
+            if stats is None:
+                stats = cls._stats[name] = OperationStats()
+            stats.record(seconds, outcome)
+
+    @classmethod
+    def profile(cls, operation: str, path: str) -> None:
+        """
+        Capture a cProfile profile of the next call of an operation, enabling the instrumentation if needed.
+        The profile is written to the given path (readable with pstats or snakeviz) and summarized on stdout.
+
+        :param operation: The operation name, "Class.method", e.g. "ContextManager.save_data".
+        :param path: Where the profile is written.
+        """
+        if operation not in {f"{owner}.{method}" for owner, method in OPERATIONS}:
+            raise ValueError(f"Unknown operation '{operation}'")
+        cls.enable()
+        cls._profiles[operation] = path
+
+    @classmethod
+    def _profile_call(cls, name: str, function, args, kwargs):
+        import cProfile  # With pstats, a sixth of the import time of the storage layer: only loaded to profile
+        import pstats
+
+        path = cls._profiles.pop(name, None)
+        if path is None:  # Another thread took the profiled call
+            return function(*args, **kwargs)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            outcome = profiler.runcall(function, *args, **kwargs)
+        except BaseException as e:
+            cls._record(name, time.perf_counter() - started, e)
+            raise
+        finally:
+            profiler.dump_stats(path)
+        cls._record(name, time.perf_counter() - started, outcome)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(15)
+        print(f"Profile of {name} written to {path}\n{summary.getvalue()}")
+        return outcome
+
+    @classmethod
+    def snapshot(cls) -> dict:
+        """
+        :return: A dictionary mapping every operation called so far to its statistics (see OperationStats.to_dict).
+        """
+        with cls._lock:
+            return {name: stats.to_dict() for name, stats in sorted(cls._stats.items())}
+
+    @classmethod
+    def report(cls) -> str:
+        """
+        :return: A table of the statistics, one operation per line.
+        """
+        lines = [f"{'operation':<38}{'calls':>8}{'errors':>8}{'failed':>8}{'mean ms':>10}{'p50 ms':>10}"
+                 f"{'p99 ms':>10}{'max ms':>10}"]
+        for name, stats in cls.snapshot().items():
+            lines.append(f"{name:<38}{stats['calls']:>8}{stats['errors']:>8}{stats['failures']:>8}"
+                         f"{stats['mean_seconds'] * 1000:>10.3f}{stats['p50_seconds'] * 1000:>10.3f}"
+                         f"{stats['p99_seconds'] * 1000:>10.3f}{stats['max_seconds'] * 1000:>10.3f}")
+        return "\n".join(lines)
+
+    @classmethod
+    def to_prometheus(cls) -> str:
+        """
+        :return: The statistics in the Prometheus text exposition format.
+        """
+        snapshot = cls.snapshot()
+        lines = []
+        for metric, field, help_text in (("calls", "calls", "Calls to a library operation."),
+                                         ("errors", "errors", "Calls to a library operation that raised an error."),
+                                         ("failures", "failures", "Calls to a library operation that were refused.")):
+            lines += [f"# HELP library_operation_{metric}_total {help_text}",
+                      f"# TYPE library_operation_{metric}_total counter"]
+            lines += [f'library_operation_{metric}_total{{operation="{name}"}} {stats[field]}'
+                      for name, stats in snapshot.items()]
+        lines += ["# HELP library_operation_duration_seconds Latency of a library operation.",
+                  "# TYPE library_operation_duration_seconds histogram"]
+        for name, stats in snapshot.items():
+            cumulative = 0
+            for bound, count in stats["buckets"].items():
+                cumulative += count
+                lines.append(f'library_operation_duration_seconds_bucket{{operation="{name}",le="{bound}"}} '
+                             f'{cumulative}')
+            lines.append(f'library_operation_duration_seconds_sum{{operation="{name}"}} {stats["total_seconds"]}')
+            lines.append(f'library_operation_duration_seconds_count{{operation="{name}"}} {stats["calls"]}')
+        return "\n".join(lines) + "\n"
+
+    @classmethod
+    def dump(cls, path: str) -> None:
+        """
+        Write the statistics to a file: Prometheus text if the path ends with .prom or .txt, JSON otherwise.
+
+        :param path: The destination file.
+        """
+        with open(path, "w") as fp:
+            if path.endswith((".prom", ".txt")):
+                fp.write(cls.to_prometheus())
+            else:
+                json.dump(cls.snapshot(), fp, indent=4)
@@ -0,0 +1,225 @@
+import threading
+from collections import Counter
+from functools import partial
+from typing import Callable, Mapping, Optional
+
+# Every copy of a book has a copy ID: the ISBN itself for the first copy, so that single-copy books and
+# the loans stored before books had copies are unchanged, and "<ISBN>#<number>" for the others.
+# The loans store maps copy IDs to the ID of the user holding the copy.
+COPY_SEPARATOR = "#"
+
+
+def copy_id(isbn: str, number: int) -> str:
+    """
+    :param isbn: The ISBN of the book.
+    :param number: The copy number, from 1.
+    :return: The ID of that copy of the book.
+    """
+    return isbn if number == 1 else f"{isbn}{COPY_SEPARATOR}{number}"
+
+
+def copy_isbn(copy: str) -> str:
+    """
+    :param copy: A copy ID, or an ISBN.
+    :return: The ISBN of the book the copy belongs to.
+    """
+    isbn, separator, number = copy.rpartition(COPY_SEPARATOR)
+    return isbn if separator and number.isdigit() else copy
+
+
+class Inventory:
+    """
+    Copy counts and availability of the catalog, maintained on every change to the books or the loans
+    so that the global counters and the set of exhausted books never need a scan of the catalog.
+
+    The number of copies on loan of every lent ISBN is always maintained, which answers per-ISBN
+    availability with a single lookup. The counters over the whole catalog (total copies, copies
+    available, books with no copy left) need every book's copy count once, so they are built on first
+    use, like the listing orders, and maintained from then on. Books with no copy left are kept as a
+    set, rather than those with a copy left, as it is bounded by the number of loans rather than by the
+    size of the catalog; listings of available books skip its members.
+    """
+
+    def __init__(self):
+        self._lent = {}  # ISBN -> number of its copies on loan
+        self._on_loan = 0  # Copies on loan, books in the catalog or not
+        self._loans: Mapping = {}  # The loans store, copy ID -> user ID
+        self._copies_of: Optional[Callable[[str], int]] = None  # ISBN -> copies in the catalog (0 if absent)
+        self._total_of: Optional[Callable[[], int]] = None  # Sums the copies of the whole catalog
+        self._built = False
+        self._copies = {}  # ISBN -> copies in the catalog, for the lent ISBNs, while built
+        self._total = 0  # Copies in the catalog, while built
+        self._out = 0  # Copies of the catalog on loan, while built
+        self._exhausted = set()  # ISBNs in the catalog with every copy on loan, while built
+        self._lock = threading.RLock()  # Loans of different books change concurrently
+
+    def reset_catalog(self, copies_of: Callable[[str], int], total_of: Callable[[], int]) -> None:
+        """
+        Start over after the catalog was (re)loaded; the counters are built again on first use.
+
+        :param copies_of: A function returning the number of copies of a book, 0 if it is not in the catalog.
+        :param total_of: A function returning the number of copies of the whole catalog.
+        """
+        with self._lock:
+            self._copies_of, self._total_of = copies_of, total_of
+            self._built = False
+
+    def reset_loans(self, loans: Mapping) -> None:
+        """
+        Count the copies on loan of every ISBN after the loans were (re)loaded.
+
+        :param loans: The loans store, mapping copy IDs to user IDs. It is kept to find the loans of a book.
+        """
+        with self._lock:
+            self._loans = loans
+            self._lent = dict(Counter(map(copy_isbn, loans)))
+            self._on_loan = sum(self._lent.values())
+            self._built = False
+
+    @property
+    def built(self) -> bool:
+        """
+        :return: True once the catalog-wide counters are built.
+        """
+        return self._built
+
+    def build(self) -> None:
+        """
+        Build the catalog-wide counters. The caller must prevent changes to the catalog meanwhile.
+        """
+        with self._lock:
+            if self._built:
+                return
+            self._total = self._total_of()
+            self._copies = {isbn: self._copies_of(isbn) for isbn in self._lent}
+            self._out = 0
+            self._exhausted = set()
+            for isbn in self._lent:
+                self._account(isbn, 1)
+            self._built = True
+
+    def _account(self, isbn: str, sign: int) -> None:
+        """
+        Add (sign 1) or remove (sign -1) the contribution of a lent ISBN to the catalog-wide counters.
+        A book whose copies were all deleted or which left the catalog contributes no copy.
+        """
+        lent, copies = self._lent.get(isbn, 0), self._copies.get(isbn, 0)
+        self._out += sign * min(lent, copies)
+        if sign > 0 and 0 < copies <= lent:
+            self._exhausted.add(isbn)
+        elif sign < 0:
+            self._exhausted.discard(isbn)
+
+    def lent(self, isbn: str) -> int:
+        """
+        :return: The number of copies of a book on loan.
+        """
+        return self._lent.get(isbn, 0)
+
+    def lend(self, isbn: str) -> None:
+        """
+        Account for a copy of a book going on loan. Called by every new loan, replayed ones included.
+        """
+        with self._lock:
+            if self._built:
+                self._account(isbn, -1)
+                if isbn not in self._copies:
+                    self._copies[isbn] = self._copies_of(isbn)
+            self._lent[isbn] = self._lent.get(isbn, 0) + 1
+            self._on_loan += 1
+            if self._built:
+                self._account(isbn, 1)
+
+    def give_back(self, isbn: str) -> None:
+        """
+        Account for a copy of a book coming back from loan.
+        """
+        with self._lock:
+            if self._built:
+                self._account(isbn, -1)
+            lent = self._lent.get(isbn, 0) - 1
+            if lent > 0:
+                self._lent[isbn] = lent
+            else:
+                self._lent.pop(isbn, None)
+                self._copies.pop(isbn, None)
+            self._on_loan -= 1
+            if self._built and lent > 0:
+                self._account(isbn, 1)
+
+    def set_copies(self, isbn: str, previous: int, copies: int) -> None:
+        """
+        Account for a book being added (previous 0), changed or removed from the catalog (copies 0).
+
+        :param isbn: The ISBN of the book.
+        :param previous: Its number of copies before the change.
+        :param copies: Its number of copies after the change.
+        """
+        if not self._built or previous == copies:
+            return
+        with self._lock:
+            if not self._built:
+                return
+            self._total += copies - previous
+            if isbn in self._lent:
+                self._account(isbn, -1)
+                self._copies[isbn] = copies
+                self._account(isbn, 1)
+
+    def loans_of(self, isbn: str, copies: int, first: int = 1) -> dict:
+        """
+        :param isbn: The ISBN of a book.
+        :param copies: Its number of copies.
+        :param first: The number of the first copy to look at.
+        :return: A dictionary mapping the copy IDs of its copies on loan to the IDs of their holders.
+        """
+        if not self._lent.get(isbn):
+            return {}
+        holders = ((copy, self._loans.get(copy)) for copy in map(partial(copy_id, isbn), range(first, copies + 1)))
+        return {copy: holder for copy, holder in holders if holder is not None}
+
+    def free_copy(self, isbn: str, copies: int) -> Optional[str]:
+        """
+        :param isbn: The ISBN of a book.
+        :param copies: Its number of copies.
+        :return: The ID of its lowest-numbered copy not on loan, None if every copy is on loan.
+        """
+        if not self._lent.get(isbn):
+            return copy_id(isbn, 1) if copies > 0 else None
+        for number in range(1, copies + 1):
+            copy = copy_id(isbn, number)
+            if copy not in self._loans:
+                return copy
+        return None
+
+    def free_copies(self, isbn: str, copies: int, count: int) -> list:
+        """
+        :param isbn: The ISBN of a book.
+        :param copies: Its number of copies.
+        :param count: The number of copies wanted.
+        :return: The IDs of its lowest-numbered copies not on loan, at most count of them.
+        """
+        free = []
+        for number in range(1, copies + 1):
+            if len(free) == count:
+                break
+            copy = copy_id(isbn, number)
+            if copy not in self._loans:
+                free.append(copy)
+        return free
+
+    def exhausted(self) -> set:
+        """
+        :return: The ISBNs of the catalog with no copy left (the live set, not a copy). Requires build().
+        """
+        return self._exhausted
+
+    def counts(self, titles: int) -> dict:
+        """
+        :param titles: The number of books in the catalog.
+        :return: The numbers of titles, titles with a copy available, copies, copies on loan and copies
+                 available. Requires build().
+        """
+        with self._lock:
+            return {"titles": titles, "titles_available": titles - len(self._exhausted), "copies": self._total,
+                    "on_loan": self._on_loan, "available": self._total - self._out}
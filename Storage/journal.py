@@ -0,0 +1,141 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+
+class Journal:
+    """
+    An append-only write-ahead log of store mutations.
+
+    Every mutation (add_book, update_book, delete_book, add_user, update_password,
+    delete_user, checkout, checkin, renew, checkout_many, checkin_many, place_hold,
+    drop_hold; see ContextManager._replay_journal for how each is applied) is written
+    as one JSON line and optionally fsync'ed, so the cost of durability follows the
+    change rate instead of the catalog size.
+    On startup the journal is replayed over the last snapshot, and compaction folds it
+    back into the snapshot files and truncates it.
+    """
+
+    def __init__(self, path: str, fsync: bool = True, compact_threshold: int = 0,
+                 on_threshold: Optional[Callable[[], object]] = None):
+        """
+        Open (or create) the journal file for appending.
+
+        :param path: Location of the journal file.
+        :param fsync: Whether every record is fsync'ed to disk before append returns.
+        :param compact_threshold: Number of records after which on_threshold is called (0 disables it).
+        :param on_threshold: Callback used to compact the journal once the threshold is reached.
+        """
+        self.path = path
+        self.fsync = fsync
+        self.compact_threshold = compact_threshold
+        self.on_threshold = on_threshold
+        self._records = sum(1 for _ in self.replay())
+        self._compaction_suspended = False
+        self._lock = threading.Lock()  # Keeps records from concurrent threads whole and in order
+        self._fp = open(self.path, "a", encoding="utf-8")
+
+    def __len__(self) -> int:
+        """
+        :return: The number of records written since the last truncation.
+        """
+        return self._records
+
+    def append(self, op: str, **payload) -> None:
+        """
+        Append a single mutation record to the journal.
+
+        :param op: The name of the mutation, e.g. "add_book" or "checkout".
+        :param payload: The JSON-serialisable arguments needed to re-apply the mutation.
+        """
+        self.append_many(op, [payload])
+
+    def append_many(self, op: str, payloads: list) -> None:
+        """
+        Append several records of the same mutation with a single flush and fsync.
+
+        :param op: The name of the mutation shared by every record.
+        :param payloads: A list of dictionaries with the arguments of each record.
+        """
+        if not payloads:
+            return
+        lines = "".join(json.dumps({"op": op, **payload}, separators=(",", ":")) + "\n" for payload in payloads)
+        with self._lock:
+            self._fp.write(lines)
+            self._fp.flush()
+            if self.fsync:
+                os.fsync(self._fp.fileno())
+            self._records += len(payloads)
+        if not self._compaction_suspended:
+            self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        if self.compact_threshold and self._records >= self.compact_threshold and self.on_threshold:
+            self.on_threshold()
+
+    @contextmanager
+    def suspend_compaction(self):
+        """
+        Defer threshold-triggered compaction until the block ends, so bulk operations
+        pay for one snapshot rewrite instead of one every compact_threshold records.
+        """
+        self._compaction_suspended = True
+        try:
+            yield self
+        finally:
+            self._compaction_suspended = False
+            self._maybe_compact()
+
+    def replay(self) -> Iterator[dict]:
+        """
+        Yield the records stored in the journal in the order they were written.
+        A torn record at the end of the file (e.g. after a crash mid-write) is ignored.
+
+        :return: An iterator over the journal records.
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as fp:
+                for line in fp:
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        print("Ignoring incomplete journal record.")
+                        return
+        except FileNotFoundError:
+            return
+
+    def truncate(self) -> None:
+        """
+        Discard all records, typically after they have been folded into a snapshot.
+        """
+        with self._lock:
+            self._fp.truncate(0)
+            self._fp.seek(0)
+            self._fp.flush()
+            if self.fsync:
+                os.fsync(self._fp.fileno())
+            self._records = 0
+
+    def rotate(self, path: str) -> None:
+        """
+        Move the records written so far to another file and continue with an empty journal,
+        so a snapshot can be written while new mutations keep being journaled.
+
+        :param path: Where the current records are moved to.
+        """
+        with self._lock:
+            self._fp.close()
+            os.replace(self.path, path)
+            self._fp = open(self.path, "a", encoding="utf-8")
+            self._records = 0
+
+    def close(self) -> None:
+        """
+        Close the underlying journal file.
+        """
+        if not self._fp.closed:
+            self._fp.close()
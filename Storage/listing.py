@@ -0,0 +1,146 @@
+import base64
+import json
+import sys
+from itertools import islice
+from typing import Container, Iterable, Iterator, MutableMapping, Optional, TextIO, Tuple
+from Storage.indexing import SortedIndex
+
+
+def encode_cursor(order: Optional[str], position) -> str:
+    """
+    Build the opaque cursor of a listing page.
+
+    :param order: The listing order, None for store order.
+    :param position: The (sort value, key) entry of the last listed record or, in store order,
+                     the number of records listed so far.
+    :return: A URL-safe string.
+    """
+    payload = json.dumps([order, position], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii")
+
+
+def decode_cursor(cursor: str, order: Optional[str]):
+    """
+    Read back a cursor built by encode_cursor.
+
+    :param cursor: The cursor.
+    :param order: The order of the listing being resumed, which must be the cursor's.
+    :return: The position stored in the cursor: a (sort value, key) tuple, or a number in store order.
+    :raises ValueError: If the cursor is malformed or belongs to a listing in another order.
+    """
+    try:
+        cursor_order, position = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor '{cursor}'") from e
+    if cursor_order != order:
+        raise ValueError(f"The cursor belongs to a listing in {cursor_order or 'store'} order, "
+                         f"not in {order or 'store'} order")
+    if order is None and isinstance(position, int) and position >= 0:
+        return position
+    if order is not None and isinstance(position, list) and len(position) == 2:
+        return tuple(position)
+    raise ValueError(f"Invalid cursor '{cursor}'")
+
+
+def iter_listing(data: MutableMapping, index: Optional[SortedIndex], order: Optional[str] = None, offset: int = 0,
+                 cursor: Optional[str] = None, chunk_size: int = 500,
+                 exclude: Optional[Container] = None) -> Iterator[Tuple[object, str, dict]]:
+    """
+    Lazily list the records of a store, a chunk of keys at a time, so the listing is never
+    materialized and stores that can batch lookups (such as the sharded catalog) do so.
+    Records removed while the listing is consumed are skipped.
+
+    :param data: The store.
+    :param index: The sorted index of the listing order, None for store order.
+    :param order: The name of the listing order, None for store order (it is recorded in cursors).
+    :param offset: The number of records to skip (after the cursor, if any).
+    :param cursor: A cursor returned with a previous page, to resume right after it.
+    :param chunk_size: The number of records fetched at a time.
+    :param exclude: Keys left out of the listing, before their records are fetched. The offset then counts
+                    the records listed, so it is skipped key by key instead of in one step.
+    :return: An iterator of (position, key, record) tuples, where position is what encode_cursor records.
+    """
+    if offset < 0:
+        raise ValueError("The offset cannot be negative")
+    position = decode_cursor(cursor, order) if cursor else None
+    fetch_many = getattr(data, "fetch_many", None)
+    skipped = 0
+    if exclude is not None:
+        offset, skipped = 0, offset
+
+    def fetch(keys: list) -> dict:
+        keys = [key for key in keys if key in data]
+        return fetch_many(keys) if fetch_many is not None else {key: data[key] for key in keys}
+
+    def fetch_kept(entries: list) -> Iterator[Tuple[object, str, dict]]:
+        """
+        Fetch the records of the (position, key) entries not excluded, once the offset is skipped.
+        """
+        nonlocal skipped
+        entries = [entry for entry in entries if entry[1] not in exclude]
+        if skipped:
+            entries, skipped = entries[skipped:], max(skipped - len(entries), 0)
+        records = fetch([key for _, key in entries])
+        for entry_position, key in entries:
+            record = records.get(key)
+            if record is not None:
+                yield entry_position, key, record
+
+    if index is None:
+        listed = (position or 0) + offset
+        keys = islice(iter(data), listed, None)
+        while chunk := list(islice(keys, chunk_size)):
+            if exclude is not None:
+                yield from fetch_kept(list(zip(range(listed + 1, listed + len(chunk) + 1), chunk)))
+                listed += len(chunk)
+                continue
+            records = fetch(chunk)
+            for key in chunk:
+                listed += 1
+                if key in records:
+                    yield listed, key, records[key]
+        return
+    for chunk in index.chunks(position, offset, chunk_size):
+        if exclude is not None:
+            yield from fetch_kept([(entry, entry[1]) for entry in chunk])
+            continue
+        records = fetch([key for _, key in chunk])
+        for entry in chunk:
+            record = records.get(entry[1])
+            if record is not None:
+                yield entry, entry[1], record
+
+
+def take_page(listing: Iterator[Tuple[object, str, dict]], order: Optional[str], limit: int) -> tuple:
+    """
+    Take one page off a listing built by iter_listing.
+
+    :param listing: The listing.
+    :param order: The name of the listing order, None for store order.
+    :param limit: The maximum number of records on the page.
+    :return: (list of (key, record) tuples, cursor of the next page or None if this is the last page).
+    """
+    if limit < 1:
+        raise ValueError("The page limit must be positive")
+    page = list(islice(listing, limit + 1))
+    next_cursor = encode_cursor(order, page[limit - 1][0]) if len(page) > limit else None
+    return [(key, record) for _, key, record in page[:limit]], next_cursor
+
+
+def write_buffered(lines: Iterable[str], stream: Optional[TextIO] = None, chunk_size: int = 1000) -> int:
+    """
+    Write text in chunks of many lines per write call, instead of one print call per line,
+    which is what made listing a large store slow on a terminal.
+
+    :param lines: An iterable of strings, each ending with its newline, consumed lazily.
+    :param stream: Where the text is written, sys.stdout by default.
+    :param chunk_size: The number of strings joined per write call.
+    :return: The number of strings written.
+    """
+    stream = stream or sys.stdout
+    lines, written = iter(lines), 0
+    while chunk := list(islice(lines, chunk_size)):
+        stream.write("".join(chunk))
+        written += len(chunk)
+    stream.flush()
+    return written
@@ -0,0 +1,68 @@
+import threading
+from contextlib import contextmanager
+
+
+class StripedLock:
+    """
+    A fixed set of reentrant locks ("stripes") shared by an unbounded set of keys, each key hashing
+    to one stripe. Operations on different keys rarely contend, while memory stays constant however
+    many keys there are. Several keys are always locked in stripe order, so two threads locking
+    overlapping key sets cannot deadlock.
+    """
+
+    def __init__(self, stripes: int = 64):
+        """
+        :param stripes: The number of locks; more stripes mean fewer unrelated keys sharing a lock.
+        """
+        self._locks = [threading.RLock() for _ in range(stripes)]
+
+    def _stripe(self, key) -> int:
+        return hash(key) % len(self._locks)
+
+    @contextmanager
+    def holding(self, *keys):
+        """
+        Hold the stripes of the given keys for the duration of the block.
+
+        :param keys: Hashable keys, e.g. ("book", isbn) and ("user", user_id).
+        """
+        stripes = sorted({self._stripe(key) for key in keys})
+        for stripe in stripes:
+            self._locks[stripe].acquire()
+        try:
+            yield
+        finally:
+            for stripe in reversed(stripes):
+                self._locks[stripe].release()
+
+    def acquire_all(self, blocking: bool = True) -> bool:
+        """
+        Acquire every stripe, excluding all keyed operations until release_all.
+
+        :param blocking: When False, give up (holding nothing) as soon as a stripe is held by another thread.
+        :return: True if every stripe is now held.
+        """
+        for position, lock in enumerate(self._locks):
+            if not lock.acquire(blocking):
+                for acquired in reversed(self._locks[:position]):
+                    acquired.release()
+                return False
+        return True
+
+    def release_all(self) -> None:
+        """
+        Release every stripe acquired by acquire_all.
+        """
+        for lock in reversed(self._locks):
+            lock.release()
+
+    @contextmanager
+    def holding_all(self):
+        """
+        Hold every stripe for the duration of the block.
+        """
+        self.acquire_all()
+        try:
+            yield
+        finally:
+            self.release_all()
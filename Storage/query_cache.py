@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+_MISSING = object()
+
+
+class QueryCache:
+    """
+    A bounded LRU cache of search results, invalidated as a whole by a generation counter that
+    every mutation of the searched store bumps. The bump is a single increment, so mutations stay
+    as cheap as before; the entries of older generations are only dropped by the next lookup.
+
+    A result is tagged with the generation read before it was computed, so a result computed while
+    the store changed is never served after the change.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        """
+        :param capacity: The maximum number of results kept, 0 to disable the cache.
+        """
+        self.capacity = capacity
+        self.generation = 0  # Bumped by every mutation of the store
+        self._entries = OrderedDict()  # Query key -> result, least recently used first
+        self._entries_generation = 0  # The generation the entries were computed at
+        self._lock = threading.Lock()  # Searches run concurrently in the service
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0  # Results dropped to make room for newer ones
+        self.invalidations = 0  # Times the entries were dropped because the store changed
+
+    def invalidate(self) -> None:
+        """
+        Mark every cached result as stale. Called by the mutations of the store, under its lock.
+        """
+        self.generation += 1
+
+    def _drop_stale(self) -> None:
+        if self._entries_generation != self.generation:
+            if self._entries:
+                self._entries.clear()
+                self.invalidations += 1
+            self._entries_generation = self.generation
+
+    def lookup(self, key: Hashable, compute: Callable[[], dict]) -> dict:
+        """
+        Get the result of a query from the cache, or compute and cache it.
+
+        :param key: The query key, e.g. ("title", normalized, title); it must determine the result.
+        :param compute: A function computing the result.
+        :return: A copy of the result, so callers cannot alter the cached one.
+        """
+        if not self.capacity:
+            return compute()
+        with self._lock:
+            self._drop_stale()
+            result = self._entries.get(key, _MISSING)
+            if result is not _MISSING:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(result)
+            self.misses += 1
+            generation = self.generation
+        result = compute()  # Outside the lock: concurrent misses compute in parallel
+        with self._lock:
+            self._drop_stale()
+            if generation == self.generation:
+                self._entries[key] = result
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.capacity:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return dict(result)
+
+    def reset_stats(self) -> None:
+        """
+        Zero the hit, miss, eviction and invalidation counts, keeping the cached results.
+        """
+        with self._lock:
+            self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def stats(self) -> dict:
+        """
+        :return: The capacity, size, generation and hit/miss/eviction/invalidation counts of the cache.
+        """
+        with self._lock:
+            self._drop_stale()
+            lookups = self.hits + self.misses
+            return {"capacity": self.capacity, "size": len(self._entries), "generation": self.generation,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "invalidations": self.invalidations, "hit_ratio": self.hits / lookups if lookups else 0.0}
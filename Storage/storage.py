@@ -1,8 +1,41 @@
+import gc
+import glob
 import json
 import os
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack, nullcontext
+from functools import partial
+from typing import Iterable, Optional, TextIO, TYPE_CHECKING
 from Storage.UserDB.user_storage_handling import UserDB
 from Storage.BookDB.book_storage_handling import BookDB
-from Pydantic_Models.pydantic_models import Assignment, BookData, UserLoggingData
+from Storage.autosave import Autosaver
+from Storage.Backends.base_backend import INTEGER_FIELDS, STORE_FIELDS, StorageBackend
+from Storage.bulk_io import export_records, import_records
+from Storage.coordination import FileLock, merge_store, read_versions, write_atomically
+from Storage.due_dates import DAY_SECONDS, DueIndex, format_time
+from Storage.events import EventBus, EventLog, read_events
+from Storage.holds import HoldQueues, hold_id, hold_isbn
+from Storage.instrumentation import Instrumentation
+from Storage.inventory import copy_isbn
+from Storage.journal import Journal
+from Storage.listing import write_buffered
+from Storage.locking import StripedLock
+from Storage.validation import validate_records
+
+if TYPE_CHECKING:  # The menu methods import the models they build when they are called
+    from Pydantic_Models.pydantic_models import Assignment, BookData, Hold, UserLoggingData
+
+# The stores each journal operation changes. A read-only ContextManager loading only some of the stores
+# skips the records that change none of them; the others are replayed, into empty stores where needed.
+JOURNAL_STORES = {
+    "add_book": ("books",), "update_book": ("books",), "delete_book": ("books",),
+    "add_user": ("users",), "update_password": ("users",), "delete_user": ("users",),
+    "checkout": ("loans", "due_dates"), "checkin": ("loans", "due_dates"), "renew": ("due_dates",),
+    "checkout_many": ("loans", "due_dates", "holds"), "checkin_many": ("loans", "due_dates"),
+    "place_hold": ("holds",), "drop_hold": ("holds",),
+}
 
 
 class ContextManager(UserDB, BookDB):
@@ -12,126 +45,1150 @@ class ContextManager(UserDB, BookDB):
     Inherits from UserDB and BookDB to provide methods for managing users and books.
     """
 
-    _previous_context: dict  # Stores the previous book assignments (ISBN -> User ID mapping)
+    _previous_context: dict  # Stores the book assignments (copy ID -> User ID mapping, see Storage/inventory.py)
+    _user_loans: object  # Reverse loan index (User ID -> set of copy IDs held), provided by the backend
+    _holds: dict  # Users waiting for a book (hold ID -> hold record, see Storage/holds.py)
+    _user_holds: object  # Reverse hold index (User ID -> set of hold IDs), provided by the backend
+    _hold_queues: HoldQueues  # The waiting list of every book with holds, in serving order
+    _due_dates: dict  # When the loans were made and are due back (copy ID -> dates record, see Storage/due_dates.py)
+    _due_index: DueIndex  # The loans ordered by due date
     _assignment_path: str = os.path.join(os.path.dirname(__file__), 'AssignmentManager.json')
+    _holds_path: str = os.path.join(os.path.dirname(__file__), 'HoldQueue.json')
+    _due_dates_path: str = os.path.join(os.path.dirname(__file__), 'DueDates.json')
+    _sqlite_path: str = os.path.join(os.path.dirname(__file__), 'library.db')
+    _shards_path: str = os.path.join(os.path.dirname(__file__), 'BookDB', 'Shards')
+    _shard_count: int = 256  # Number of book shards created for a new sharded catalog
+    _shard_cache_bytes: int = 64 * 2 ** 20  # Memory budget of the shard LRU cache
+    _snapshot_compression: str = "zlib"  # Compression of the snapshot files: "none", "zlib", "bz2" or "lzma"
+    _journal_path: str = os.path.join(os.path.dirname(__file__), 'journal.log')  # Each process appends to journal-<pid>.log
+    _lock_path: str = os.path.join(os.path.dirname(__file__), 'library.lock')  # Advisory lock shared by every process
+    _versions_path: str = os.path.join(os.path.dirname(__file__), 'versions.json')  # Number of saves of each store
+    _journal_fsync: bool = True  # fsync every journal record before the mutation returns
+    _compact_threshold: int = 10000  # Fold the journal into the snapshots after this many records
+    _normalized_search: bool = False  # Ignore case and extra whitespace in title, author and name searches
+    _search_results_limit: int = 10  # Number of ranked results returned by the full-text search
+    _query_cache_size: int = 1024  # Search results cached per store (0 disables the cache)
+    _page_size: int = 20  # Number of records shown per page by the book and user listings
+    _loan_days: float = 14  # Loan period of a checkout, and the extension granted by a renewal
+    _max_renewals: int = 2  # Number of times a loan can be renewed
+    _delete_policy: str = "block"  # "block" refuses to delete users/books on loan, "cascade" checks them in first
+    _lock_stripes: int = 64  # Number of locks shared by the per-ISBN and per-user loan operations
+    _autosave_interval: float = 30.0  # Save pending changes in the background after this many seconds (0 disables)
+    _autosave_changes: int = 1000  # ... or as soon as this many records changed (0 disables)
+    _event_log_path: Optional[str] = None  # File the change events are appended to (see Storage/events.py), or None
 
-    def __init__(self):
+    def __init__(self, backend: Optional[StorageBackend] = None, stores: Optional[Iterable[str]] = None):
         """
         Initialize the ContextManager by loading user and book data from storage,
-        and then load previous book assignments.
+        then load previous book assignments and replay the journal over them.
+
+        :param backend: The storage backend, by default the one named by the LIBRARY_STORAGE_BACKEND
+                        environment variable ("json", "compact", "snapshot", "sharded" or "sqlite", "json"
+                        if unset).
+                        LIBRARY_INSTRUMENTATION=1 instruments the operations from the start, loading included.
+                        LIBRARY_EVENT_LOG=<path> appends the change events to that file instead of _event_log_path.
+        :param stores: Open the library for queries only, loading only these stores ("books", "users",
+                       "loans", "holds", "due_dates"), for the one-shot queries of the command line. The
+                       others are left empty, the journals of processes that exited without saving are
+                       replayed into the loaded stores but not adopted, and nothing is journaled or saved.
+        """
+        if os.environ.get("LIBRARY_INSTRUMENTATION") == "1":
+            Instrumentation.enable()
+        self._backend = backend or self._create_backend(os.environ.get("LIBRARY_STORAGE_BACKEND", "json"))
+        self._read_only = stores is not None
+        self._stores = set(STORE_FIELDS if stores is None else stores)
+        self._locks = StripedLock(self._lock_stripes)  # Keyed by ("book", ISBN) and ("user", user ID)
+        # Other processes change an SQLite database directly, behind the back of the caches
+        cache_size = self._query_cache_size if self._backend.journaled else 0
+        BookDB._book_query_cache.capacity = UserDB._user_query_cache.capacity = cache_size
+        BookDB._inventory = self._backend.create_inventory()  # ... and behind the back of the loan counters
+        self._process_lock = FileLock(self._lock_path)
+        self._journal = None
+        self._journal_lock = None  # Held for the process lifetime: it marks the journal as live
+        self._pending_journals = []  # Locks of journal files deleted by the next successful save: the journals
+                                     # of dead processes and the segments rotated out of this one
+        self._journal_segments = 0  # Number of segments rotated out of this process's journal
+        self._unsaved_stores = set()  # Stores whose last write failed, rewritten by the next save
+        self.save_metrics = {"saves": 0, "failures": 0, "last_seconds": 0.0, "max_seconds": 0.0,
+                             "total_seconds": 0.0, "last_blocking_seconds": 0.0, "last_bytes": 0,
+                             "total_bytes": 0, "last_stores": []}
+        gc_enabled = gc.isenabled()
+        gc.disable()  # Loading allocates millions of long-lived objects and frees none: collections only rescan them
+        try:
+            with self._process_lock:  # No other process is saving while the snapshots are read
+                self._versions = read_versions(self._versions_path)  # The versions of the snapshots being loaded
+                if "users" in self._stores:
+                    UserDB.instantiate_data(self._backend)  # Load users data from the storage
+                if "books" in self._stores:
+                    BookDB.instantiate_data(self._backend)  # Load books data from the storage
+                self._load_previous_context()  # Load any previous book assignment context
+                self._load_holds()  # Load the waiting lists
+                self._load_due_dates()  # Load the due dates of the loans
+                if self._backend.journaled and self._read_only:
+                    self._adopt_journals(None)  # Only read: the next read-write process adopts them
+                elif self._backend.journaled:
+                    journal_path = self._lock_own_journal()
+                    self._adopt_journals(journal_path)  # Recover what processes that exited without saving left
+                    self._journal = Journal(journal_path, fsync=self._journal_fsync,
+                                            compact_threshold=self._compact_threshold,
+                                            on_threshold=self._compact_journal)
+                    self._replay_journal(self._journal)  # Re-apply the mutations made since the last snapshot
+        finally:
+            if gc_enabled:
+                gc.enable()
+        UserDB._journal = BookDB._journal = self._journal
+        self.events = EventBus()  # The changes made through this ContextManager, for downstream consumers
+        UserDB._events = BookDB._events = self.events
+        self._event_log_path = os.environ.get("LIBRARY_EVENT_LOG", self._event_log_path)
+        if self._event_log_path and not self._read_only:
+            self.events.subscribe(EventLog(self._event_log_path), name="event_log")
+        self._autosaver = None
+        if self._backend.journaled and not self._read_only and (self._autosave_interval or self._autosave_changes):
+            self._autosaver = Autosaver(self, self._autosave_interval, self._autosave_changes)
+            self._autosaver.start()
+
+    @classmethod
+    def _create_backend(cls, name: str) -> StorageBackend:
+        """
+        Build a storage backend from its name.
+
+        :param name: "json" for the JSON files, "compact" for the JSON files held in compact in-memory
+                     records, "snapshot" for binary columnar snapshot files loaded into compact records,
+                     "sharded" for the sharded book catalog or "sqlite" for the SQLite database.
+        :return: The storage backend.
+        """
+        paths = {"books": BookDB._dbpath, "users": UserDB._dbpath, "loans": cls._assignment_path,
+                 "holds": cls._holds_path, "due_dates": cls._due_dates_path}
+        # Only the backend in use is imported, which keeps sqlite3 and the snapshot codecs out of the startup
+        if name in ("json", "compact"):
+            from Storage.Backends.json_backend import JSONBackend
+            return JSONBackend(paths, compact=name == "compact")
+        if name == "snapshot":
+            from Storage.Backends.snapshot_backend import SnapshotBackend
+            return SnapshotBackend(paths, compression=cls._snapshot_compression)
+        if name == "sharded":
+            from Storage.Backends.sharded_backend import ShardedBackend
+            return ShardedBackend(paths, cls._shards_path, cls._shard_count, cls._shard_cache_bytes)
+        if name == "sqlite":
+            from Storage.Backends.sqlite_backend import SQLiteBackend
+            return SQLiteBackend(cls._sqlite_path, paths)  # A new database imports the JSON files
+        raise ValueError(f"Unknown storage backend '{name}', expected 'json', 'compact', 'snapshot', 'sharded' "
+                         f"or 'sqlite'")
+
+    def _lock_own_journal(self) -> str:
+        """
+        Pick and lock the journal file of this ContextManager: journal-<pid>.log, or journal-<pid>-<n>.log
+        if another ContextManager of the same process already uses it.
+
+        :return: The journal file path.
+        """
+        base, extension = os.path.splitext(self._journal_path)
+        suffix = 0
+        while True:
+            path = f"{base}-{os.getpid()}{f'-{suffix}' if suffix else ''}{extension}"
+            self._journal_lock = FileLock(path)
+            if self._journal_lock.acquire(blocking=False):
+                return path
+            suffix += 1
+
+    def _adopt_journals(self, own_path: str) -> None:
+        """
+        Replay the journals of processes that exited without saving, including a journal.log left by
+        versions predating per-process journals. A live process holds the lock of its journal, so a
+        journal whose lock can be taken is an orphan. It stays locked until the next save has folded
+        it into the snapshots, and is deleted then.
+
+        :param own_path: The journal file of this ContextManager, replayed separately; None for a read-only
+                         ContextManager, which releases the journals once replayed.
+        """
+        base, extension = os.path.splitext(self._journal_path)
+        paths = glob.glob(f"{glob.escape(base)}*{extension}")
+        for path in sorted(paths, key=os.path.getmtime):
+            if path == own_path:
+                continue  # Left by an earlier process with the same ID: replayed as this process's own journal
+            lock = FileLock(path)
+            if not lock.acquire(blocking=False):
+                continue  # Owned by a running process
+            journal = Journal(path, fsync=False)
+            if len(journal):
+                print(f"Adopting the journal of a process that exited without saving: {path}")
+                self._replay_journal(journal)
+            journal.close()
+            if own_path is None:
+                lock.release()
+            else:
+                self._pending_journals.append(lock)
+
+    def _replay_journal(self, journal: Journal) -> int:
+        """
+        Re-apply every journal record on top of the loaded snapshots. Records hold the
+        resulting state rather than deltas, so replaying an already compacted record is harmless.
+
+        :param journal: The journal to replay.
+        :return: The number of records replayed.
         """
-        UserDB.instantiate_data()  # Load users data from the storage
-        BookDB.instantiate_data()  # Load books data from the storage
-        self._load_previous_context()  # Load any previous book assignment context
+        handlers = {
+            "add_book": lambda record: BookDB._put_book({**INTEGER_FIELDS["books"], **record["record"]}),
+            "update_book": lambda record: BookDB._put_book({**INTEGER_FIELDS["books"], **record["record"]}),
+            "delete_book": lambda record: BookDB._drop_book(record["isbn"]),
+            "add_user": lambda record: UserDB._put_user(record["record"]),
+            "update_password": lambda record: UserDB._put_user(
+                {**UserDB._data[record["user_id"]], "password": record["password"]}),
+            "delete_user": lambda record: UserDB._drop_user(record["user_id"]),
+            "checkout": lambda record: self._lend(record["isbn"], record["user_id"], record.get("dates")),
+            "checkin": lambda record: self._give_back(record["isbn"]),
+            "renew": lambda record: self._put_due_dates(record["record"]),
+            "checkout_many": lambda record: self._lend_many(record["loans"]),
+            "checkin_many": lambda record: self._give_back_many(record["copies"]),
+            "place_hold": lambda record: self._put_hold(record["record"]),
+            "drop_hold": lambda record: self._drop_hold(record["hold_id"]),
+        }
+        replayed = 0
+        for record in journal.replay():
+            if self._stores.isdisjoint(JOURNAL_STORES.get(record.get("op"), STORE_FIELDS)):
+                continue  # Read-only: the record only changes stores that were not loaded
+            try:
+                handlers[record["op"]](record)
+                replayed += 1
+            except KeyError as e:
+                print(f"Skipping invalid journal record {record}. Error: {e}")
+        if replayed:
+            print(f"Recovered {replayed} change(s) from the journal.")
+        return replayed
 
     def _load_previous_context(self):
         """
-        Load previous assignments from the JSON file. If the file doesn't exist or is
-        improperly formatted, an empty dictionary is initialized.
+        Load previous assignments from the storage backend, build the reverse loan index over them and
+        count the copies on loan of every book.
+        If the file doesn't exist or is improperly formatted, an empty dictionary is initialized.
         """
+        self._user_loans = self._backend.create_index("loans", "user_id", normalize=False)
+        self._changed_loans = {} if self._backend.journaled else None  # Copy ID -> holder as of the last load or save
         try:
-            with open(self._assignment_path, "r") as fp:
-                self._previous_context = json.load(fp)
+            self._previous_context = self._load_store("loans")
         except FileNotFoundError:
             print("Assignment file not found, starting with an empty context.")
             self._previous_context = {}
         except json.JSONDecodeError:
             print("Error decoding JSON file. Starting with an empty context.")
             self._previous_context = {}
+        self._user_loans.rebuild((user_id, copy) for copy, user_id in self._previous_context.items())
+        BookDB._inventory.reset_loans(self._previous_context)
+
+    def _load_store(self, store: str):
+        """
+        :param store: "loans", "holds" or "due_dates".
+        :return: The store opened by the storage backend, or an empty one if this ContextManager does not load it.
+        """
+        return self._backend.load(store) if store in self._stores else {}
+
+    def _assign(self, copy: str, user_id: str) -> None:
+        """
+        Record a loan without any validation, keeping the reverse loan index and the inventory up to date.
+        Used by checkout and journal replay.
+
+        :param copy: The copy ID of the book being lent (its ISBN for the first copy).
+        :param user_id: The ID of the user borrowing the book.
+        """
+        if self._changed_loans is not None and copy not in self._changed_loans:
+            self._changed_loans[copy] = self._previous_context.get(copy)
+        self._unassign(copy)
+        self._previous_context[copy] = user_id
+        self._user_loans.add(user_id, copy)
+        BookDB._inventory.lend(copy_isbn(copy))
+
+    def _unassign(self, copy: str) -> None:
+        """
+        Remove a loan if it exists, keeping the reverse loan index and the inventory up to date.
+        Used by checkin and journal replay.
+
+        :param copy: The copy ID of the book being returned.
+        """
+        user_id = self._previous_context.pop(copy, None)
+        if user_id is not None:
+            if self._changed_loans is not None:
+                self._changed_loans.setdefault(copy, user_id)
+            self._user_loans.discard(user_id, copy)
+            BookDB._inventory.give_back(copy_isbn(copy))
+
+    def _load_holds(self) -> None:
+        """
+        Load the holds from the storage backend and build the waiting lists and the reverse hold index
+        over them. A library saved before holds existed has no holds file and starts with no holds.
+        """
+        self._user_holds = self._backend.create_index("holds", "user_id", normalize=False)
+        self._hold_queues = self._backend.create_hold_queues()
+        self._changed_holds = {} if self._backend.journaled else None  # Hold ID -> hold as of the last load or save
+        try:
+            self._holds = self._load_store("holds")
+        except FileNotFoundError:
+            self._holds = {}
+        except json.JSONDecodeError:
+            print("Error decoding the holds file. Starting with no holds.")
+            self._holds = {}
+        self._user_holds.rebuild((hold["user_id"], hold["hold_id"]) for hold in self._holds.values())
+        self._hold_queues.rebuild(self._holds.values())  # Not read by the backends answering from their tables
+
+    def _put_hold(self, hold: dict) -> None:
+        """
+        Record a hold without any validation, keeping the waiting lists and the reverse hold index up to date.
+        Used by place_hold and journal replay.
+
+        :param hold: The hold record.
+        """
+        key = hold["hold_id"]
+        previous = self._holds.get(key)
+        if self._changed_holds is not None and key not in self._changed_holds:
+            self._changed_holds[key] = previous
+        if previous is not None:
+            self._hold_queues.discard(previous)
+            self._user_holds.discard(previous["user_id"], key)
+        self._holds[key] = hold
+        self._hold_queues.add(hold)
+        self._user_holds.add(hold["user_id"], key)
+
+    def _drop_hold(self, key: str) -> None:
+        """
+        Remove a hold if it exists, keeping the waiting lists and the reverse hold index up to date.
+        Used by the hold operations and journal replay.
+
+        :param key: The ID of the hold.
+        """
+        hold = self._holds.pop(key, None)
+        if hold is not None:
+            if self._changed_holds is not None:
+                self._changed_holds.setdefault(key, hold)
+            self._hold_queues.discard(hold)
+            self._user_holds.discard(hold["user_id"], key)
+
+    def _release_hold(self, key: str) -> None:
+        """
+        Remove a hold and journal it. The caller holds the lock of the book.
+
+        :param key: The ID of the hold.
+        """
+        hold = self._holds.get(key)
+        self._drop_hold(key)
+        if self._journal is not None:
+            self._journal.append("drop_hold", hold_id=key)
+        if self.events and hold is not None:
+            self.events.publish("hold_dropped", key, hold)
+
+    def _load_due_dates(self) -> None:
+        """
+        Load the due dates of the loans from the storage backend and build the due date index over them.
+        A library saved before loans had due dates has no due dates file: its loans have no due date.
+        """
+        self._due_index = self._backend.create_due_index()
+        self._changed_due_dates = {} if self._backend.journaled else None  # Copy ID -> dates at the last load or save
+        try:
+            self._due_dates = self._load_store("due_dates")
+        except FileNotFoundError:
+            self._due_dates = {}
+        except json.JSONDecodeError:
+            print("Error decoding the due dates file. Starting with no due dates.")
+            self._due_dates = {}
+        self._due_index.rebuild((copy, dates["due"]) for copy, dates in self._due_dates.items())
+
+    def _put_due_dates(self, dates: dict) -> None:
+        """
+        Record the dates of a loan without any validation, keeping the due date index up to date.
+        Used by checkout, renew and journal replay.
+
+        :param dates: The dates record of the loan.
+        """
+        copy = dates["copy"]
+        previous = self._due_dates.get(copy)
+        if self._changed_due_dates is not None and copy not in self._changed_due_dates:
+            self._changed_due_dates[copy] = previous
+        if previous is not None:
+            self._due_index.discard(copy, previous["due"])
+        self._due_dates[copy] = dates
+        self._due_index.add(copy, dates["due"])
+
+    def _drop_due_dates(self, copy: str) -> None:
+        """
+        Remove the dates of a loan if they exist, keeping the due date index up to date.
+        Used by checkin and journal replay.
+
+        :param copy: The copy ID of the book lent.
+        """
+        dates = self._due_dates.pop(copy, None)
+        if dates is not None:
+            if self._changed_due_dates is not None:
+                self._changed_due_dates.setdefault(copy, dates)
+            self._due_index.discard(copy, dates["due"])
+
+    def _lend(self, copy: str, user_id: str, dates: Optional[dict]) -> None:
+        """
+        Record a loan and its dates without any validation. Used by checkout, the handoff of a copy to a
+        waiting user and journal replay; the journals written before loans had due dates replay loans
+        without dates.
+
+        :param copy: The copy ID of the book being lent.
+        :param user_id: The ID of the user borrowing the book.
+        :param dates: The dates record of the loan, None if it has none.
+        """
+        self._assign(copy, user_id)
+        if dates is not None:
+            self._put_due_dates(dates)
+        else:
+            self._drop_due_dates(copy)  # Left by an earlier loan of the copy
+
+    def _give_back(self, copy: str) -> None:
+        """
+        Remove a loan and its dates if they exist. Used by checkin and journal replay.
+
+        :param copy: The copy ID of the book being returned.
+        """
+        self._unassign(copy)
+        self._drop_due_dates(copy)
+
+    def _lend_many(self, loans: list) -> None:
+        """
+        Record the loans of a batch checkout without any validation, fulfilling the holds of their users
+        on their books. Used by checkout_many and journal replay.
+
+        :param loans: {"isbn": copy ID, "user_id", "dates"} dictionaries, as journaled.
+        """
+        for loan in loans:
+            self._lend(loan["isbn"], loan["user_id"], loan["dates"])
+            self._drop_hold(hold_id(copy_isbn(loan["isbn"]), loan["user_id"]))
+
+    def _give_back_many(self, copies: list) -> None:
+        """
+        Remove the loans of a batch check-in and their dates. Used by checkin_many and journal replay.
+
+        :param copies: The copy IDs of the books being returned.
+        """
+        for copy in copies:
+            self._give_back(copy)
+
+    def _loan_dates(self, copy: str) -> dict:
+        """
+        :param copy: The copy ID of a book being lent now.
+        :return: The dates record of the loan, due back after the loan period.
+        """
+        now = int(time.time())
+        return {"copy": copy, "checked_out": now, "due": now + int(self._loan_days * DAY_SECONDS), "renewals": 0}
+
+    def _new_loan(self, copy: str, user_id: str) -> dict:
+        """
+        Lend a copy for the loan period from now and journal it. The caller holds the lock of the book.
+
+        :param copy: The copy ID of the book being lent.
+        :param user_id: The ID of the user borrowing the book.
+        :return: The dates record of the loan.
+        """
+        dates = self._loan_dates(copy)
+        self._lend(copy, user_id, dates)
+        if self._journal is not None:
+            self._journal.append("checkout", isbn=copy, user_id=user_id, dates=dates)
+        if self.events:
+            self.events.publish("checkout", copy, self._loan_record(copy, user_id))
+        return dates
+
+    def _loan_record(self, copy: str, user_id: str) -> dict:
+        """
+        :param copy: The copy ID of a book lent.
+        :param user_id: The ID of the user holding it.
+        :return: The loan as published in the change events: its dates record, if it has one, with the
+                 ISBN and the user ID, as the due date listings return it.
+        """
+        return {**self._due_dates.get(copy, {"copy": copy}), "isbn": copy_isbn(copy), "user_id": user_id}
+
+    def books_held_by(self, user_id: str) -> dict:
+        """
+        Find the books currently checked out by a user, using the reverse loan index.
+
+        :param user_id: The ID of the user.
+        :return: A dictionary of ISBNs and corresponding book data, empty if the user holds no books.
+        """
+        return {isbn: BookDB._data.get(isbn) for isbn in map(copy_isbn, self._user_loans.lookup(user_id))}
+
+    def remove_user(self, user_data: "UserLoggingData") -> bool:
+        """
+        Delete a user, honouring the delete policy for any books they still hold: with "block"
+        the deletion is refused, with "cascade" the books are checked in first. Their holds are cancelled.
+
+        :param user_data: The UserLoggingData object of the user to delete.
+        :return: True if the user is deleted successfully, False otherwise.
+        """
+        user_id = user_data.user_id
+        with UserDB._users_lock:
+            while True:
+                held = sorted(self._user_loans.lookup(user_id))
+                holds = sorted(self._user_holds.lookup(user_id))
+                books = [copy_isbn(copy) for copy in held] + [hold_isbn(key) for key in holds]
+                with self._locks.holding(("user", user_id), *(("book", isbn) for isbn in books)):
+                    current = sorted(self._user_loans.lookup(user_id)), sorted(self._user_holds.lookup(user_id))
+                    if current != (held, holds):
+                        continue  # A loan or a hold changed before the locks were taken
+                    if held and self._delete_policy != "cascade":
+                        print(f"User {user_id} still holds {len(held)} book(s): {', '.join(held)}")
+                        return False
+                    if not UserDB.delete_user(user_data):
+                        return False
+                    for copy in held:
+                        self._checkin(copy, user_id)
+                    for key in holds:
+                        self._release_hold(key)
+                    return True
+
+    def remove_book(self, book_data: "BookData") -> bool:
+        """
+        Delete a book, honouring the delete policy if any of its copies is checked out: with "block"
+        the deletion is refused, with "cascade" the copies are checked in first. Its holds are cancelled.
+
+        :param book_data: The BookData object of the book to delete.
+        :return: True if the book is deleted successfully, False otherwise.
+        """
+        isbn = book_data.isbn
+        with BookDB._books_lock:
+            while True:
+                holders = BookDB._inventory.loans_of(isbn, BookDB._book_copies(isbn))
+                with self._locks.holding(("book", isbn), *(("user", holder) for holder in holders.values())):
+                    if BookDB._inventory.loans_of(isbn, BookDB._book_copies(isbn)) != holders:
+                        continue  # A copy was checked out or in before the locks were taken
+                    if holders and self._delete_policy != "cascade":
+                        print(f"Book with ISBN {isbn} is checked out by user(s) {', '.join(holders.values())}.")
+                        return False
+                    if not BookDB.delete_book(book_data):
+                        return False
+                    for copy, holder in holders.items():
+                        self._checkin(copy, holder)
+                    for user_id in self._hold_queues.waiting(isbn):
+                        self._release_hold(hold_id(isbn, user_id))
+                    return True
+
+    def available_copies(self, isbn: str) -> int:
+        """
+        :param isbn: The ISBN of a book.
+        :return: The number of its copies that are not on loan, 0 if it is not in the catalog.
+        """
+        lent = BookDB._inventory.lent(isbn)
+        if not lent:  # The common case needs no record
+            return BookDB._book_copies(isbn) if isbn in BookDB._data else 0
+        return max(BookDB._book_copies(isbn) - lent, 0)
 
     def is_book_available(self, isbn: str) -> bool:
         """
-        Check if a book is available for checkout based on its ISBN.
+        Check if a copy of a book is available for checkout based on its ISBN.
 
         :param isbn: The ISBN of the book to check.
         :return: True if the book is available, False otherwise.
         """
-        if isbn in self._previous_context.keys() or isbn not in BookDB._data.keys():
-            return False
-        return True
+        if not BookDB._inventory.lent(isbn):
+            return isbn in BookDB._data
+        return self.available_copies(isbn) > 0
 
-    def checkout(self, assignment_info: Assignment) -> bool:
+    def checkout(self, assignment_info: "Assignment") -> bool:
         """
-        Assign a book to a user for checkout if the book is available and both
-        book and user IDs are valid.
+        Assign a copy of a book (the lowest-numbered one available) to a user for checkout if a copy
+        is available, both book and user IDs are valid and the user does not already hold a copy.
+        A hold of the user on the book is fulfilled by the checkout.
 
         :param assignment_info: Assignment data containing ISBN and User ID.
         :return: True if the checkout is successful, False otherwise.
         """
-        isbn, user_id = assignment_info.isbn, assignment_info.user_id
-        if isbn in BookDB._data.keys() and user_id in UserDB._data.keys() and self.is_book_available(isbn):
-            self._previous_context[isbn] = user_id
-            print(f"Book with ISBN {isbn} assigned to user with ID {user_id}.")
-            return True
-        else:
-            print("Invalid ISBN or login ID, or the book is unavailable.")
-            return False
+        return self._checkout(assignment_info.isbn, assignment_info.user_id)
+
+    def _checkout(self, isbn: str, user_id: str) -> bool:
+        """
+        Check out a book for trusted callers (the command line, whose arguments are already text),
+        without building an Assignment.
+
+        :param isbn: The ISBN of the book.
+        :param user_id: The ID of the user borrowing it.
+        :return: True if the checkout is successful, False otherwise.
+        """
+        with self._locks.holding(("book", isbn), ("user", user_id)), self._backend.transaction():
+            copy = None
+            if isbn in BookDB._data.keys() and user_id in UserDB._data.keys():
+                if self._held_copy(isbn, user_id) is not None:
+                    print(f"User with ID {user_id} already holds a copy of the book with ISBN {isbn}.")
+                    return False
+                copy = BookDB._inventory.free_copy(isbn, BookDB._book_copies(isbn))
+            if copy is not None:
+                dates = self._new_loan(copy, user_id)
+                if self._hold_queues.length(isbn) and hold_id(isbn, user_id) in self._holds:
+                    self._release_hold(hold_id(isbn, user_id))
+                print(f"Book with ISBN {isbn}{f' (copy {copy})' if copy != isbn else ''} "
+                      f"assigned to user with ID {user_id}, due back on {format_time(dates['due'])}.")
+                return True
+            else:
+                print("Invalid ISBN or login ID, or the book is unavailable.")
+                return False
+
+    def _held_copy(self, isbn: str, user_id: str):
+        """
+        :param isbn: The ISBN of a book, or the copy ID of one of its copies.
+        :param user_id: The ID of a user.
+        :return: The copy ID of the copy of the book the user holds, None if they hold none.
+        """
+        if self._previous_context.get(isbn) == user_id:
+            return isbn
+        return next((copy for copy in self._user_loans.lookup(user_id) if copy_isbn(copy) == isbn), None)
 
-    def checkin(self, assignment_info: Assignment) -> bool:
+    def checkin(self, assignment_info: "Assignment") -> bool:
         """
-        Check-in a book and remove the assignment based on the ISBN and User ID.
+        Check-in a book and remove the assignment based on the ISBN (or copy ID) and User ID.
 
         :param assignment_info: Assignment data containing ISBN and User ID.
         :return: True if the check-in is successful, False otherwise.
         """
+        return self._checkin(assignment_info.isbn, assignment_info.user_id)
+
+    def _checkin(self, isbn: str, user_id: str) -> bool:
+        """
+        Check-in a book for trusted callers (the cascading deletes and the command line), without building
+        an Assignment.
+        The copy is handed to the next user waiting for the book, if any.
+
+        :param isbn: The ISBN of the book, or the copy ID of the copy being returned.
+        :param user_id: The ID of the user holding it.
+        :return: True if the check-in is successful, False otherwise.
+        """
+        with self._locks.holding(("book", copy_isbn(isbn)), ("user", user_id)), self._backend.transaction():
+            copy = self._held_copy(isbn, user_id)
+            if copy is not None:
+                loan = self._loan_record(copy, user_id) if self.events else None
+                self._give_back(copy)
+                if self._journal is not None:
+                    self._journal.append("checkin", isbn=copy)
+                if self.events:
+                    self.events.publish("checkin", copy, loan)
+                print(f"Assignment of book with ISBN {isbn} removed.")
+                self._hand_off(copy)
+                return True
+            else:
+                print(f"No assignment found for ISBN: {isbn} and User ID: {user_id}.")
+                return False
+
+    def _hand_off(self, copy: str) -> Optional[str]:
+        """
+        Lend a copy just checked in to the next user waiting for its book, dropping on the way the holds
+        of users who were deleted or have got a copy meanwhile. The caller holds the lock of the book.
+
+        :param copy: The copy ID of the copy checked in.
+        :return: The ID of the user the copy was handed to, None if nobody was waiting for it.
+        """
+        isbn = copy_isbn(copy)
+        if isbn not in BookDB._data:
+            return None  # Being deleted: its holds are cancelled
+        while (user_id := self._hold_queues.first(isbn)) is not None:
+            self._release_hold(hold_id(isbn, user_id))
+            if user_id in UserDB._data and self._held_copy(isbn, user_id) is None:
+                self._new_loan(copy, user_id)
+                print(f"Book with ISBN {isbn} handed to user with ID {user_id}, next in line.")
+                return user_id
+        return None
+
+    def checkout_many(self, assignments: list) -> dict:
+        """
+        Check out several books at once, e.g. a patron's stack at a self-service station, all or nothing.
+        The locks of every book and user involved are taken together, every book and user is validated
+        once, and the loans are only made if all of them can be. They are journaled as one record, so a
+        crash cannot keep part of them either.
+
+        :param assignments: Assignment data containing ISBN and User ID, one per book.
+        :return: A dictionary with "ok", True if every book was checked out, and "items", the result of
+                 every assignment in order: its "isbn", "user_id" and "ok", plus "copy" and "due" for the
+                 loans made, or "error" for the assignments that failed the batch.
+        """
+        pairs = [(assignment.isbn, assignment.user_id) for assignment in assignments]
+        locks = {("book", isbn) for isbn, _ in pairs} | {("user", user_id) for _, user_id in pairs}
+        with self._locks.holding(*locks), self._backend.transaction():
+            errors = self._checkout_errors(pairs)
+            items = [{"isbn": isbn, "user_id": user_id, "ok": not errors} for isbn, user_id in pairs]
+            if errors:
+                for position, error in errors.items():
+                    items[position]["error"] = error
+                    print(error)
+                print(f"None of the {len(pairs)} book(s) were checked out.")
+                return {"ok": False, "items": items}
+            free = {isbn: BookDB._inventory.free_copies(isbn, BookDB._book_copies(isbn), wanted)
+                    for isbn, wanted in Counter(isbn for isbn, _ in pairs).items()}
+            loans = []
+            for item in items:
+                copy = free[item["isbn"]].pop(0)
+                loans.append({"isbn": copy, "user_id": item["user_id"], "dates": self._loan_dates(copy)})
+                item.update(copy=copy, due=loans[-1]["dates"]["due"])
+            fulfilled = [self._holds[key] for key in (hold_id(item["isbn"], item["user_id"]) for item in items)
+                         if key in self._holds] if self.events else []
+            self._lend_many(loans)
+            if self._journal is not None and loans:
+                self._journal.append("checkout_many", loans=loans)
+            if self.events:
+                self.events.publish_many("checkout", [(loan["isbn"], self._loan_record(loan["isbn"], loan["user_id"]))
+                                                      for loan in loans])
+                self.events.publish_many("hold_dropped", [(hold["hold_id"], hold) for hold in fulfilled])
+            copies = [loan["isbn"] for loan in loans]
+            print(f"{len(copies)} book(s) checked out{': ' if copies else '.'}{', '.join(copies)}")
+            return {"ok": True, "items": items}
+
+    def _checkout_errors(self, pairs: list) -> dict:
+        """
+        Validate the assignments of a batch checkout. The caller holds the locks of their books and users.
+
+        :param pairs: The (ISBN, user ID) pairs of the batch.
+        :return: A dictionary mapping the positions of the invalid pairs to the reason, empty if all are valid.
+        """
+        missing_books = {isbn for isbn, _ in pairs if isbn not in BookDB._data}
+        missing_users = {user_id for _, user_id in pairs if user_id not in UserDB._data}
+        errors, wanted, seen = {}, Counter(), set()
+        for position, (isbn, user_id) in enumerate(pairs):
+            if isbn in missing_books:
+                errors[position] = f"No book with ISBN {isbn}."
+            elif user_id in missing_users:
+                errors[position] = f"No user with ID {user_id}."
+            elif (isbn, user_id) in seen:
+                errors[position] = f"The book with ISBN {isbn} is listed twice for user with ID {user_id}."
+            elif self._held_copy(isbn, user_id) is not None:
+                errors[position] = f"User with ID {user_id} already holds a copy of the book with ISBN {isbn}."
+            else:
+                seen.add((isbn, user_id))
+                wanted[isbn] += 1
+        available = {isbn: self.available_copies(isbn) for isbn in wanted}
+        for position, (isbn, user_id) in enumerate(pairs):
+            if position not in errors and wanted[isbn] > available[isbn]:
+                errors[position] = (f"{wanted[isbn]} copies of the book with ISBN {isbn} are wanted, "
+                                    f"{available[isbn]} available.")
+        return errors
+
+    def checkin_many(self, assignments: list) -> dict:
+        """
+        Check in several books at once, all or nothing: the loans are only removed if every one of them
+        exists, and they are journaled as one record. The copies are then handed to the users waiting
+        for their books, if any, as by checkin.
+
+        :param assignments: Assignment data containing ISBN (or copy ID) and User ID, one per book.
+        :return: A dictionary with "ok", True if every book was checked in, and "items", the result of
+                 every assignment in order: its "isbn", "user_id" and "ok", plus "copy" and "handed_to"
+                 (the next user in line, or None) for the loans removed, or "error" for the assignments
+                 that failed the batch.
+        """
+        pairs = [(assignment.isbn, assignment.user_id) for assignment in assignments]
+        locks = {("book", copy_isbn(isbn)) for isbn, _ in pairs} | {("user", user_id) for _, user_id in pairs}
+        with self._locks.holding(*locks), self._backend.transaction():
+            items, errors, copies, seen = [], {}, [], set()
+            for position, (isbn, user_id) in enumerate(pairs):
+                copy = self._held_copy(isbn, user_id)
+                items.append({"isbn": isbn, "user_id": user_id, "ok": False})
+                if copy is None:
+                    errors[position] = f"No assignment found for ISBN: {isbn} and User ID: {user_id}."
+                elif copy in seen:
+                    errors[position] = f"The book with ISBN {isbn} is listed twice for user with ID {user_id}."
+                seen.add(copy)
+                copies.append(copy)
+            if errors:
+                for position, error in errors.items():
+                    items[position]["error"] = error
+                    print(error)
+                print(f"None of the {len(pairs)} book(s) were checked in.")
+                return {"ok": False, "items": items}
+            returned = [(copy, self._loan_record(copy, user_id))
+                        for copy, (_, user_id) in zip(copies, pairs)] if self.events else []
+            self._give_back_many(copies)
+            if self._journal is not None and copies:
+                self._journal.append("checkin_many", copies=copies)
+            if self.events:
+                self.events.publish_many("checkin", returned)
+            print(f"{len(copies)} book(s) checked in{': ' if copies else '.'}{', '.join(copies)}")
+            for item, copy in zip(items, copies):
+                item.update(ok=True, copy=copy, handed_to=self._hand_off(copy))
+            return {"ok": True, "items": items}
+
+    def place_hold(self, hold: "Hold") -> bool:
+        """
+        Put a user in the waiting list of a book none of whose copies is available. When a copy is
+        checked in, it goes to the waiting user with the highest priority who has waited longest.
+
+        :param hold: Hold data containing ISBN, User ID and priority.
+        :return: True if the hold is placed, False otherwise.
+        """
+        isbn, user_id = hold.isbn, hold.user_id
+        with self._locks.holding(("book", isbn), ("user", user_id)), self._backend.transaction():
+            key = hold_id(isbn, user_id)
+            if isbn not in BookDB._data.keys() or user_id not in UserDB._data.keys():
+                print("Invalid ISBN or login ID.")
+            elif self._held_copy(isbn, user_id) is not None:
+                print(f"User with ID {user_id} already holds a copy of the book with ISBN {isbn}.")
+            elif key in self._holds:
+                print(f"User with ID {user_id} is already waiting for the book with ISBN {isbn}, "
+                      f"at position {self._hold_queues.position(self._holds[key])}.")
+            elif self.is_book_available(isbn) and not self._hold_queues.length(isbn):
+                print(f"A copy of the book with ISBN {isbn} is available, it can be checked out.")
+            else:
+                record = {"hold_id": key, "isbn": isbn, "user_id": user_id, "priority": hold.priority,
+                          "placed": time.time_ns()}
+                self._put_hold(record)
+                if self._journal is not None:
+                    self._journal.append("place_hold", record=record)
+                if self.events:
+                    self.events.publish("hold_placed", key, record)
+                print(f"User with ID {user_id} is waiting for the book with ISBN {isbn}, "
+                      f"at position {self._hold_queues.position(record)}.")
+                return True
+            return False
+
+    def cancel_hold(self, assignment_info: "Assignment") -> bool:
+        """
+        Take a user off the waiting list of a book.
+
+        :param assignment_info: Assignment data containing ISBN and User ID.
+        :return: True if the hold is cancelled, False if there was none.
+        """
         isbn, user_id = assignment_info.isbn, assignment_info.user_id
-        if isbn in self._previous_context.keys() and self._previous_context[isbn] == user_id:
-            del self._previous_context[isbn]
-            print(f"Assignment of book with ISBN {isbn} removed.")
+        with self._locks.holding(("book", isbn), ("user", user_id)), self._backend.transaction():
+            if hold_id(isbn, user_id) not in self._holds:
+                print(f"No hold found for ISBN: {isbn} and User ID: {user_id}.")
+                return False
+            self._release_hold(hold_id(isbn, user_id))
+            print(f"Hold of user with ID {user_id} on the book with ISBN {isbn} cancelled.")
             return True
-        else:
-            print(f"No assignment found for ISBN: {isbn} and User ID: {user_id}.")
+
+    def hold_position(self, isbn: str, user_id: str) -> Optional[int]:
+        """
+        :param isbn: The ISBN of a book.
+        :param user_id: The ID of a user.
+        :return: The position of the user in the waiting list of the book, from 1, None if they are not in it.
+        """
+        hold = self._holds.get(hold_id(isbn, user_id))
+        return self._hold_queues.position(hold) if hold is not None else None
+
+    def holds_of(self, user_id: str) -> dict:
+        """
+        Find the books a user is waiting for, using the reverse hold index.
+
+        :param user_id: The ID of the user.
+        :return: A dictionary mapping the ISBNs to the user's position in their waiting list, the length of the
+                 list and the priority of the hold; empty if the user has no holds.
+        """
+        holds = {}
+        for key in self._user_holds.lookup(user_id):
+            hold = self._holds.get(key)
+            if hold is not None:
+                holds[hold["isbn"]] = {"position": self._hold_queues.position(hold),
+                                       "waiting": self._hold_queues.length(hold["isbn"]), "priority": hold["priority"]}
+        return holds
+
+    def hold_queue(self, isbn: str) -> list:
+        """
+        :param isbn: The ISBN of a book.
+        :return: The IDs of the users waiting for it, next in line first.
+        """
+        return self._hold_queues.waiting(isbn)
+
+    def renew(self, assignment_info: "Assignment") -> bool:
+        """
+        Extend a loan by another loan period, counted from its due date, or from now if it is overdue.
+        The renewal is refused if other users are waiting for the book or the loan was already renewed
+        _max_renewals times. A loan made before loans had due dates gets its first due date.
+
+        :param assignment_info: Assignment data containing ISBN (or copy ID) and User ID.
+        :return: True if the loan is renewed, False otherwise.
+        """
+        return self._renew(assignment_info.isbn, assignment_info.user_id)
+
+    def _renew(self, isbn: str, user_id: str) -> bool:
+        """
+        Renew a loan for trusted callers (the command line), without building an Assignment.
+
+        :param isbn: The ISBN of the book, or the copy ID of the copy lent.
+        :param user_id: The ID of the user holding it.
+        :return: True if the loan is renewed, False otherwise.
+        """
+        with self._locks.holding(("book", copy_isbn(isbn)), ("user", user_id)), self._backend.transaction():
+            copy = self._held_copy(isbn, user_id)
+            if copy is None:
+                print(f"No assignment found for ISBN: {isbn} and User ID: {user_id}.")
+                return False
+            now = int(time.time())
+            dates = self._due_dates.get(copy) or {"copy": copy, "checked_out": 0, "due": now, "renewals": 0}
+            waiting = self._hold_queues.length(copy_isbn(copy))
+            if waiting:
+                print(f"{waiting} user(s) are waiting for the book with ISBN {isbn}, the loan cannot be renewed.")
+            elif dates["renewals"] >= self._max_renewals:
+                print(f"The loan of the book with ISBN {isbn} was already renewed {dates['renewals']} time(s).")
+            else:
+                record = {**dates, "due": max(dates["due"], now) + int(self._loan_days * DAY_SECONDS),
+                          "renewals": dates["renewals"] + 1}
+                self._put_due_dates(record)
+                if self._journal is not None:
+                    self._journal.append("renew", record=record)
+                if self.events:
+                    self.events.publish("renewal", copy, self._loan_record(copy, user_id))
+                print(f"Loan of book with ISBN {isbn} to user with ID {user_id} renewed, "
+                      f"due back on {format_time(record['due'])}.")
+                return True
             return False
 
-    def save_data(self) -> bool:
+    def overdue_loans(self, now: Optional[float] = None, limit: Optional[int] = None) -> list:
+        """
+        Find the loans past their due date, using the due date index.
+
+        :param now: The time the due dates are compared with, in seconds since the epoch (the current time
+                    by default).
+        :param limit: The maximum number of loans returned, None for all of them.
+        :return: The loans, most overdue first: dictionaries with the copy, its ISBN, the user holding it,
+                 the checkout and due times (0 for a checkout made before loans had due dates) and the
+                 number of renewals.
         """
-        Save the current assignment data to the JSON file, along with user and book data.
+        return self._loans_due(None, time.time() if now is None else now, limit)
 
-        :return: True if the data is saved successfully, False otherwise.
+    def loans_due_within(self, days: float, now: Optional[float] = None, limit: Optional[int] = None) -> list:
         """
-        super().save_data()  # Save user data
-        BookDB.save_data()  # Save book data
+        Find the loans not overdue yet but due in the next days, using the due date index.
+
+        :param days: The number of days ahead.
+        :param now: The start of the period, in seconds since the epoch (the current time by default).
+        :param limit: The maximum number of loans returned, None for all of them.
+        :return: The loans, soonest due first, as returned by overdue_loans.
+        """
+        now = time.time() if now is None else now
+        return self._loans_due(now, now + days * DAY_SECONDS, limit)
+
+    def _loans_due(self, start: Optional[float], end: float, limit: Optional[int]) -> list:
+        """
+        :return: The loans due in [start, end), soonest due first. Dates left without a loan by a merge
+                 with another process's save are skipped.
+        """
+        loans = []
+        for _, copy in self._due_index.between(start, end, limit):
+            user_id, dates = self._previous_context.get(copy), self._due_dates.get(copy)
+            if user_id is not None and dates is not None:
+                loans.append({**dates, "isbn": copy_isbn(copy), "user_id": user_id})
+        return loans
+
+    def save_data(self, quiet: bool = False) -> bool:
+        """
+        Save the stores changed since the last save through the storage backend; unchanged stores
+        are not rewritten. Mutations only wait while the changed stores are copied: the journal is
+        then rotated, so new mutations keep being journaled while the copies are written, and the
+        rotated segment is deleted once every write succeeded.
+
+        Other processes may share the Storage directory: the save holds their common file lock, and
+        stores another process saved since this one loaded or saved them are first merged (see
+        _merge_saved_stores), so neither process overwrites the other's changes.
+
+        The duration and size of every save are recorded in save_metrics.
+
+        :param quiet: For the saves nobody asked for (autosave, journal compaction): print nothing on
+                      success, and report failures and merges on stderr, so they never mix with the output
+                      of the command running meanwhile.
+        :return: True if the data is saved successfully (or nothing needed saving), False otherwise.
+        """
+        out = sys.stderr if quiet else None
+        if self._read_only:
+            print("The library was opened read-only, with only some of its stores: nothing was saved.")
+            return False
+        started = time.perf_counter()
+        with ExitStack() as catalog_locks:
+            for lock in (UserDB._users_lock, BookDB._books_lock, self._locks.holding_all()):
+                catalog_locks.enter_context(lock)
+            self._process_lock.acquire()
+            try:
+                stores, copies, written = self._snapshot_changes(out)
+            except Exception as e:
+                self._process_lock.release()
+                return self._save_failed(e, out)
+        blocking = time.perf_counter() - started
         try:
-            with open(self._assignment_path, "w") as fp:
-                json.dump(self._previous_context, fp)
-            print("Assignments saved successfully!")
-            return True
+            if not stores:
+                if not quiet:
+                    print("Nothing to save.")
+                return True
+            for store, data in copies:
+                written += self._backend.save(store, data)
+            for lock in self._pending_journals[:]:
+                os.remove(lock.path)  # Every change these journals held is now part of the snapshots
+                lock.release()
+                self._pending_journals.remove(lock)
         except Exception as e:
-            print(f"Unable to save assignments. Error: {e}")
-            return False
+            self._unsaved_stores.update(stores)
+            return self._save_failed(e, out)
+        finally:
+            self._process_lock.release()
+        seconds = time.perf_counter() - started
+        metrics = self.save_metrics
+        metrics.update(saves=metrics["saves"] + 1, last_seconds=seconds, max_seconds=max(metrics["max_seconds"], seconds),
+                       total_seconds=metrics["total_seconds"] + seconds, last_blocking_seconds=blocking,
+                       last_bytes=written, total_bytes=metrics["total_bytes"] + written, last_stores=stores)
+        if not quiet:
+            print(f"Saved {', '.join(stores)} ({written} bytes) in {seconds:.3f}s.")
+        return True
+
+    def _snapshot_changes(self, out: Optional[TextIO] = None) -> tuple:
+        """
+        First half of a save, run while every lock is held: merge the stores saved by other processes,
+        stamp the versions, write the changed stores that cannot be copied cheaply, copy the others,
+        rotate the journal and reset the change tracking.
+
+        :param out: The stream of the merge messages, None for stdout.
+        :return: (names of the changed stores, [(store, copy)] left to write, bytes already written).
+        """
+        self._merge_saved_stores(out)
+        changes = {"users": UserDB._changed_users, "books": BookDB._changed_books, "loans": self._changed_loans,
+                   "holds": self._changed_holds, "due_dates": self._changed_due_dates}
+        stores = [store for store, changed in changes.items() if changed or store in self._unsaved_stores]
+        if not stores and not self._pending_journals:
+            return [], [], 0
+        self._stamp_versions(stores)  # Before writing, so a save interrupted half-way is still noticed by others
+        data = {"users": UserDB._data, "books": BookDB._data, "loans": self._previous_context, "holds": self._holds,
+                "due_dates": self._due_dates}
+        copies, written = [], 0
+        for store in stores:
+            if isinstance(data[store], dict):
+                copies.append((store, data[store].copy()))  # Records are replaced, never mutated in place
+            else:
+                written += self._backend.save(store, data[store])
+        if self._journal is not None and len(self._journal):
+            self._rotate_journal()
+        for changed in changes.values():
+            if changed is not None:
+                changed.clear()
+        self._unsaved_stores.clear()
+        return stores, copies, written
+
+    def _rotate_journal(self) -> None:
+        """
+        Move this process's journal records to a new segment file, still locked by this process
+        and deleted by the save, and continue with an empty journal under a fresh lock.
+        """
+        base, extension = os.path.splitext(self._journal.path)
+        self._journal_segments += 1
+        segment_path = f"{base}-saving-{self._journal_segments}{extension}"
+        segment_lock = self._journal_lock  # flock follows the file, which becomes the segment
+        self._journal.rotate(segment_path)
+        segment_lock.path = segment_path
+        self._pending_journals.append(segment_lock)
+        self._journal_lock = FileLock(self._journal.path)
+        self._journal_lock.acquire()
+
+    def _save_failed(self, error: Exception, out: Optional[TextIO] = None) -> bool:
+        self.save_metrics["failures"] += 1
+        print(f"Unable to save data. Error: {error}", file=out)
+        return False
+
+    def pending_changes(self) -> int:
+        """
+        :return: The number of records changed since the last save.
+        """
+        changes = (UserDB._changed_users, BookDB._changed_books, self._changed_loans, self._changed_holds,
+                   self._changed_due_dates)
+        return sum(len(changed) for changed in changes if changed is not None)
+
+    def _merge_saved_stores(self, out: Optional[TextIO] = None) -> None:
+        """
+        Merge into memory every store another process saved since this one last loaded or saved it,
+        keeping this process's own changes. Must be called with the process lock held.
+
+        :param out: The stream of the messages, None for stdout.
+        """
+        saved_versions = read_versions(self._versions_path)
+        stores = {
+            "books": (BookDB._data, BookDB._changed_books, lambda isbn, book: BookDB._put_book(book), BookDB._drop_book),
+            "users": (UserDB._data, UserDB._changed_users, lambda user_id, user: UserDB._put_user(user),
+                      UserDB._drop_user),
+            "loans": (self._previous_context, self._changed_loans, self._assign, self._unassign),
+            "holds": (self._holds, self._changed_holds, lambda key, hold: self._put_hold(hold), self._drop_hold),
+            "due_dates": (self._due_dates, self._changed_due_dates, lambda copy, dates: self._put_due_dates(dates),
+                          self._drop_due_dates),
+        }
+        for store, (current, changed, put, drop) in stores.items():
+            if saved_versions.get(store, 0) == self._versions.get(store, 0):
+                continue
+            if store not in self._backend.merged_stores:
+                print(f"The {store} were also saved by another process and are not merged by this backend.", file=out)
+                continue
+            conflicts = merge_store(current, self._backend.load(store), dict(changed or {}), put, drop)
+            if conflicts:
+                print(f"Kept the version saved by another process of {len(conflicts)} conflicting {store}: "
+                      f"{', '.join(conflicts[:10])}{' ...' if len(conflicts) > 10 else ''}", file=out)
+
+    def _stamp_versions(self, stores: list) -> None:
+        """
+        Record a new save of the given stores in the version file, so other processes merge them
+        before their next save. Must be called with the process lock held.
+
+        :param stores: The stores about to be written.
+        """
+        saved_versions = read_versions(self._versions_path)
+        self._versions = {store: saved_versions.get(store, 0) + (store in stores)
+                          for store in ("books", "users", "loans", "holds", "due_dates")}
+        if self._versions != saved_versions:
+            write_atomically(self._versions_path, lambda fp: json.dump(self._versions, fp))
+
+    def _compact_journal(self) -> None:
+        """
+        Journal threshold callback. It runs inside the mutation that crossed the threshold, which
+        may already hold some locks, so it only saves if every lock is free or held by this thread;
+        otherwise the save is retried after a later mutation rather than risking a deadlock.
+        """
+        with ExitStack() as held:
+            for lock in (UserDB._users_lock, BookDB._books_lock):
+                if not lock.acquire(blocking=False):
+                    return
+                held.callback(lock.release)
+            if not self._locks.acquire_all(blocking=False):
+                return
+            held.callback(self._locks.release_all)
+            self.save_data(quiet=True)
 
     @staticmethod
-    def take_assignment_data() -> Assignment:
+    def take_assignment_data() -> "Assignment":
         """
         Take input from the user for assignment (book check-out/check-in).
 
         :return: An Assignment object containing user-inputted ISBN and User ID.
         """
+        from Pydantic_Models.pydantic_models import Assignment
+
         input_assignment_data = Assignment()
         input_assignment_data.isbn = input("Please enter the ISBN of the book: ")
         input_assignment_data.user_id = input("Please enter your user ID: ")
         return input_assignment_data
 
     @staticmethod
-    def take_book_data() -> BookData:
+    def take_batch_data() -> list:
+        """
+        Take input from the user for a batch check-out/check-in: one user and several books.
+
+        :return: A list of Assignment objects, one per ISBN entered.
+        """
+        from Pydantic_Models.pydantic_models import Assignment
+
+        user_id = input("Please enter your user ID: ").strip()
+        isbns = input("Please enter the ISBNs of the books, separated by commas: ")
+        return [Assignment(isbn=isbn.strip(), user_id=user_id) for isbn in isbns.split(",") if isbn.strip()]
+
+    @staticmethod
+    def take_book_data() -> "BookData":
         """
         Take input from the user for book data (add, update, delete).
 
         :return: A BookData object containing user-inputted book details.
         """
+        from Pydantic_Models.pydantic_models import BookData
+
         input_book_data = BookData()
         input_book_data.title = input("Please enter the book title: ")
         input_book_data.author = input("Please enter the book author: ")
         input_book_data.isbn = input("Please enter the book ISBN: ")
+        copies = input("Please enter the number of copies (1 if left blank): ").strip()
+        input_book_data.copies = int(copies) if copies.isdigit() else 1
         return input_book_data
 
     @staticmethod
-    def take_user_data() -> UserLoggingData:
+    def take_user_data() -> "UserLoggingData":
         """
         Take input from the user for user data (add, update, delete).
 
         :return: A UserLoggingData object containing user-inputted user details.
         """
+        from Pydantic_Models.pydantic_models import UserLoggingData
+
         input_user_data = UserLoggingData()
         input_user_data.user_id = input("Please enter the user ID: ")
         input_user_data.password = input("Please enter the user password: ")
@@ -152,7 +1209,7 @@ class ContextManager(UserDB, BookDB):
         Delete a book from the database using user input.
         """
         data = self.take_book_data()
-        resp = BookDB.delete_book(data)
+        resp = self.remove_book(data)
         if resp:
             print("Deleted book successfully!")
 
@@ -165,33 +1222,87 @@ class ContextManager(UserDB, BookDB):
         if resp:
             print("Updated book successfully!")
 
-    @staticmethod
-    def search_book():
+    @classmethod
+    def search_book(cls):
         """
-        Search for a book in the database by title, author, or ISBN based on user input.
+        Search for a book in the database by title, author, ISBN or free text based on user input.
 
         :return: The search results or an empty dictionary if no results are found.
         """
-        input_by_user = input("Enter 1 to search by title\nEnter 2 to search by author\nEnter 3 to search by ISBN: ")
+        input_by_user = input("Enter 1 to search by title\nEnter 2 to search by author\nEnter 3 to search by ISBN\n"
+                              "Enter 4 to search titles and authors by keywords: ")
         if input_by_user == "1":
-            return BookDB._search_by_title(input("Enter the title of the book: "))
+            return BookDB._search_by_title(input("Enter the title of the book: "), cls._normalized_search)
         elif input_by_user == "2":
-            return BookDB._search_by_author(input("Enter the author of the book: "))
+            return BookDB._search_by_author(input("Enter the author of the book: "), cls._normalized_search)
         elif input_by_user == "3":
             return BookDB._search_by_isbn(input("Enter the ISBN of the book: "))
+        elif input_by_user == "4":
+            return BookDB._search_full_text(input("Enter keywords from the title or author: "),
+                                            cls._search_results_limit)
         else:
             print("Invalid input")
             return {}
 
-    @staticmethod
-    def get_books_data() -> None:
+    @classmethod
+    def _page_through(cls, page, format_record) -> None:
         """
-        Retrieve all book data from the database.
+        Display a listing one page at a time, asking before showing the next page.
+
+        :param page: A function taking the cursor of a page (None for the first one) and returning
+                     (list of (key, record) tuples, cursor of the next page or None), e.g. BookDB.page_books.
+        :param format_record: A function taking (number, key, record) and returning the display text.
         """
-        return BookDB._get_books()
+        cursor, shown = None, 0
+        while True:
+            records, cursor = page(cursor)
+            write_buffered(format_record(number, key, record)
+                           for number, (key, record) in enumerate(records, start=shown + 1))
+            shown += len(records)
+            if cursor is None:
+                print(f"End of the listing, {shown} shown.")
+                return
+            if input(f"{shown} shown. Press Enter for the next page, or q to stop: ").strip().lower() == "q":
+                return
 
-    @staticmethod
-    def search_user():
+    @classmethod
+    def get_books_data(cls) -> None:
+        """
+        Display the books one page at a time, in the order chosen by the user.
+        """
+        if not BookDB._data:
+            print("No books found.")
+            return
+        orders = {"": None, "1": "isbn", "2": "title", "3": "author"}
+        choice = input("Enter 1 to sort by ISBN, 2 by title, 3 by author, or nothing for the catalog order: ").strip()
+        if choice not in orders:
+            print("Invalid input")
+            return
+        cls._page_through(lambda cursor: BookDB.page_books(orders[choice], cursor=cursor, limit=cls._page_size),
+                          BookDB._format_book)
+
+    @classmethod
+    def list_available_books(cls) -> None:
+        """
+        Display the inventory counters, then the books with a copy available one page at a time,
+        in the order chosen by the user.
+        """
+        counts = BookDB.inventory_counts()
+        print(f"{counts['available']} of {counts['copies']} copies available ({counts['on_loan']} on loan), "
+              f"{counts['titles_available']} of {counts['titles']} titles with a copy available.")
+        if not counts["titles_available"]:
+            return
+        orders = {"": None, "1": "isbn", "2": "title", "3": "author"}
+        choice = input("Enter 1 to sort by ISBN, 2 by title, 3 by author, or nothing for the catalog order: ").strip()
+        if choice not in orders:
+            print("Invalid input")
+            return
+        cls._page_through(
+            lambda cursor: BookDB.page_available_books(orders[choice], cursor=cursor, limit=cls._page_size),
+            BookDB._format_book)
+
+    @classmethod
+    def search_user(cls):
         """
         Search for a user in the database by user ID or name based on user input.
 
@@ -203,17 +1314,26 @@ class ContextManager(UserDB, BookDB):
             return UserDB._search_by_id(user_id)
         elif input_by_user == "2":
             username = input("Enter the username: ")
-            return UserDB._search_by_name(username)
+            return UserDB._search_by_name(username, cls._normalized_search)
         else:
             print("Invalid input")
             return {}
 
-    @staticmethod
-    def get_all_users() -> None:
+    @classmethod
+    def get_all_users(cls) -> None:
         """
-        Retrieve all user data from the database.
+        Display the users one page at a time, in the order chosen by the user.
         """
-        return UserDB._get_users()
+        if not UserDB._data:
+            print("No users found.")
+            return
+        orders = {"": None, "1": "user_id", "2": "name"}
+        choice = input("Enter 1 to sort by user ID, 2 by name, or nothing for the store order: ").strip()
+        if choice not in orders:
+            print("Invalid input")
+            return
+        cls._page_through(lambda cursor: UserDB.page_users(orders[choice], cursor=cursor, limit=cls._page_size),
+                          UserDB._format_user)
 
     def add_user_data(self) -> None:
         """
@@ -229,7 +1349,7 @@ class ContextManager(UserDB, BookDB):
         Delete a user from the database using user input.
         """
         data = self.take_user_data()
-        resp = UserDB.delete_user(data)
+        resp = self.remove_user(data)
         if resp:
             print("Deleted user successfully!")
 
@@ -244,13 +1364,177 @@ class ContextManager(UserDB, BookDB):
 
     def track_availability(self) -> bool:
         """
-        Check if a book is available for checkout by its ISBN.
+        Check if a book is available for checkout by its ISBN, showing how many of its copies are.
 
         :return: True if the book is available, False otherwise.
         """
         isbn = input("Enter the ISBN to check availability: ")
+        if isbn in BookDB._data:
+            print(f"{self.available_copies(isbn)} of {BookDB._book_copies(isbn)} copies available.")
         return self.is_book_available(isbn)
 
+    def _deferred_compaction(self):
+        """
+        :return: A context manager deferring journal compaction during bulk operations.
+        """
+        return self._journal.suspend_compaction() if self._journal is not None else nullcontext()
+
+    def import_books(self, path: str, rejects_path: str = None) -> tuple:
+        """
+        Bulk import books from a CSV or JSONL file, streaming it in chunks that are validated in one
+        call each (see Storage/validation.py) and handed to the batched insert.
+
+        :param path: Path of the file to import.
+        :param rejects_path: Where rejected rows are reported (defaults to "<path>.rejects.jsonl").
+        :return: A tuple with the number of imported and rejected books.
+        """
+        with self._deferred_compaction():
+            return import_records(path, partial(validate_records, "books", fill_defaults=True),
+                                  BookDB.add_book_records, rejects_path)
+
+    def import_users(self, path: str, rejects_path: str = None) -> tuple:
+        """
+        Bulk import users from a CSV or JSONL file, streaming it in chunks that are validated in one
+        call each (see Storage/validation.py) and handed to the batched insert.
+
+        :param path: Path of the file to import.
+        :param rejects_path: Where rejected rows are reported (defaults to "<path>.rejects.jsonl").
+        :return: A tuple with the number of imported and rejected users.
+        """
+        with self._deferred_compaction():
+            return import_records(path, partial(validate_records, "users", fill_defaults=True),
+                                  UserDB.add_user_records, rejects_path)
+
+    @staticmethod
+    def export_books(path: str, order: Optional[str] = None) -> int:
+        """
+        Stream every book into a CSV or JSONL file.
+
+        :param path: Path of the file to write.
+        :param order: None for store order, or "isbn", "title" or "author".
+        :return: The number of exported books.
+        """
+        return export_records(path, (book for _, book in BookDB.iter_books(order)), list(STORE_FIELDS["books"][1]))
+
+    @staticmethod
+    def export_users(path: str, order: Optional[str] = None) -> int:
+        """
+        Stream every user into a CSV or JSONL file.
+
+        :param path: Path of the file to write.
+        :param order: None for store order, or "user_id" or "name".
+        :return: The number of exported users.
+        """
+        return export_records(path, (user for _, user in UserDB.iter_users(order)), list(STORE_FIELDS["users"][1]))
+
+    def import_data(self) -> None:
+        """
+        Bulk import books or users from a CSV/JSONL file chosen by the user.
+        """
+        store = input("Enter 1 to import books\nEnter 2 to import users: ")
+        if store not in ("1", "2"):
+            print("Invalid input")
+            return
+        path = input("Enter the path of the .csv or .jsonl file: ")
+        try:
+            imported, rejected = self.import_books(path) if store == "1" else self.import_users(path)
+        except (OSError, ValueError) as e:
+            print(f"Unable to import data. Error: {e}")
+            return
+        print(f"Imported {imported} record(s), rejected {rejected}.")
+        if rejected:
+            print(f"Rejected rows were written to {path}.rejects.jsonl")
+
+    def export_data(self) -> None:
+        """
+        Bulk export books or users into a CSV/JSONL file chosen by the user.
+        """
+        store = input("Enter 1 to export books\nEnter 2 to export users: ")
+        if store not in ("1", "2"):
+            print("Invalid input")
+            return
+        path = input("Enter the path of the .csv or .jsonl file: ")
+        try:
+            exported = self.export_books(path) if store == "1" else self.export_users(path)
+        except (OSError, ValueError) as e:
+            print(f"Unable to export data. Error: {e}")
+            return
+        print(f"Exported {exported} record(s) to {path}.")
+
+    @staticmethod
+    def query_cache_stats() -> dict:
+        """
+        :return: The statistics of the book and user search result caches (see QueryCache.stats).
+        """
+        return {"books": BookDB._book_query_cache.stats(), "users": UserDB._user_query_cache.stats()}
+
+    def read_event_log(self, offset: int = 0, limit: Optional[int] = 1000) -> dict:
+        """
+        Read the change events of the event log from an offset (see read_events), for consumers maintaining
+        derived state outside this process. The log holds the changes of every process sharing it.
+
+        :param offset: The next_offset of the previous read, 0 to read the log from its start.
+        :param limit: The maximum number of events returned, None for all of them.
+        :return: A dictionary with the "events" and the "next_offset" to resume from.
+        """
+        if not self._event_log_path:
+            raise ValueError("No event log is kept: set LIBRARY_EVENT_LOG or ContextManager._event_log_path")
+        events, next_offset = read_events(self._event_log_path, offset, limit)
+        return {"events": events, "next_offset": next_offset}
+
+    def show_stats(self) -> None:
+        """
+        Display the call counts and latencies of the operations and the search cache statistics, then let
+        the user export them, profile the next call of an operation or switch the instrumentation on or off.
+        """
+        if not Instrumentation.enabled() and not Instrumentation.snapshot():
+            print("Instrumentation is disabled.")
+        else:
+            print(Instrumentation.report())
+        for store, stats in self.query_cache_stats().items():
+            print(f"Search cache ({store}): {stats['size']}/{stats['capacity']} results, {stats['hits']} hits, "
+                  f"{stats['misses']} misses ({stats['hit_ratio']:.1%} hit ratio), {stats['evictions']} evictions, "
+                  f"{stats['invalidations']} invalidations")
+        choice = input("Enter 1 to export the stats to a file (.json, or .prom for Prometheus text)\n"
+                       "Enter 2 to profile the next call of an operation\n"
+                       f"Enter 3 to {'disable' if Instrumentation.enabled() else 'enable'} the instrumentation\n"
+                       "Enter 4 to reset the stats\n"
+                       "Press Enter to go back: ")
+        try:
+            if choice == "1":
+                path = input("Enter the path of the .json or .prom file: ")
+                Instrumentation.dump(path)
+                print(f"Stats written to {path}.")
+            elif choice == "2":
+                operation = input("Enter the operation, e.g. ContextManager.save_data: ")
+                path = input("Enter the path of the profile file: ")
+                Instrumentation.profile(operation, path)
+                print(f"The next call of {operation} will be profiled.")
+            elif choice == "3":
+                if Instrumentation.enabled():
+                    Instrumentation.disable()
+                else:
+                    Instrumentation.enable()
+                print(f"Instrumentation {'enabled' if Instrumentation.enabled() else 'disabled'}.")
+            elif choice == "4":
+                Instrumentation.reset()
+                BookDB._book_query_cache.reset_stats()
+                UserDB._user_query_cache.reset_stats()
+                print("Stats reset.")
+            elif choice:
+                print("Invalid input")
+        except (OSError, ValueError) as e:
+            print(f"Unable to complete the operation. Error: {e}")
+
+    def list_user_books(self) -> dict:
+        """
+        List the books checked out by a user, taking the user ID as input.
+
+        :return: A dictionary of ISBNs and corresponding book data held by the user.
+        """
+        user_id = input("Enter the user ID: ")
+        return self.books_held_by(user_id)
+
     def checkin_book(self) -> bool:
         """
         Perform a book check-in operation by taking user input for the book and user.
@@ -262,12 +1546,91 @@ class ContextManager(UserDB, BookDB):
 
     def checkout_book(self) -> bool:
         """
-        Perform a book checkout operation by taking user input for the book and user.
+        Perform a book checkout operation by taking user input for the book and user, offering
+        a hold on the book if no copy of it is available.
 
         :return: True if the checkout is successful, False otherwise.
         """
         assignment_data = self.take_assignment_data()
-        return self.checkout(assignment_data)
+        if self.checkout(assignment_data):
+            return True
+        isbn, user_id = assignment_data.isbn, assignment_data.user_id
+        if (isbn in BookDB._data and user_id in UserDB._data and not self.is_book_available(isbn)
+                and self._held_copy(isbn, user_id) is None and hold_id(isbn, user_id) not in self._holds):
+            if input("No copy is available. Enter y to be handed the next copy returned: ").strip().lower() == "y":
+                from Pydantic_Models.pydantic_models import Hold
+
+                self.place_hold(Hold(isbn=isbn, user_id=user_id))
+        return False
+
+    def checkout_books(self) -> bool:
+        """
+        Check out several books to a user at once, all or nothing, by taking user input.
+
+        :return: True if every book was checked out, False if none was.
+        """
+        return self.checkout_many(self.take_batch_data())["ok"]
+
+    def checkin_books(self) -> bool:
+        """
+        Check in several books of a user at once, all or nothing, by taking user input.
+
+        :return: True if every book was checked in, False if none was.
+        """
+        return self.checkin_many(self.take_batch_data())["ok"]
+
+    def manage_holds(self) -> None:
+        """
+        Place or cancel a hold, or show the holds of a user or the waiting list of a book, based on user input.
+        """
+        choice = input("Enter 1 to place a hold\nEnter 2 to cancel a hold\nEnter 3 to list the holds of a user\n"
+                       "Enter 4 to show the waiting list of a book: ")
+        if choice == "1":
+            from Pydantic_Models.pydantic_models import Hold
+
+            assignment_data = self.take_assignment_data()
+            priority = input("Please enter the priority (0 if left blank, higher is served first): ").strip()
+            self.place_hold(Hold(isbn=assignment_data.isbn, user_id=assignment_data.user_id,
+                                 priority=int(priority) if priority.lstrip("-").isdigit() else 0))
+        elif choice == "2":
+            self.cancel_hold(self.take_assignment_data())
+        elif choice == "3":
+            holds = self.holds_of(input("Enter the user ID: "))
+            if not holds:
+                print("No holds found.")
+            for isbn, hold in holds.items():
+                print(f"ISBN {isbn}: position {hold['position']} of {hold['waiting']} (priority {hold['priority']})")
+        elif choice == "4":
+            waiting = self.hold_queue(input("Enter the ISBN of the book: "))
+            print(f"{len(waiting)} user(s) waiting{': ' if waiting else '.'}{', '.join(waiting)}")
+        else:
+            print("Invalid input")
+
+    def manage_loans(self) -> None:
+        """
+        List the overdue loans or the loans due soon, or renew a loan, based on user input.
+        """
+        choice = input("Enter 1 to list the overdue loans\nEnter 2 to list the loans due in the next days\n"
+                       "Enter 3 to renew a loan: ")
+        if choice == "1":
+            loans = self.overdue_loans()
+        elif choice == "2":
+            days = input("Enter the number of days: ").strip()
+            if not days.isdigit():
+                print("Invalid input")
+                return
+            loans = self.loans_due_within(int(days))
+        elif choice == "3":
+            self.renew(self.take_assignment_data())
+            return
+        else:
+            print("Invalid input")
+            return
+        if not loans:
+            print("No loans found.")
+        for loan in loans:
+            print(f"ISBN {loan['copy']}: user {loan['user_id']}, due {format_time(loan['due'])} "
+                  f"(renewed {loan['renewals']} time(s))")
 
     def __enter__(self):
         """
@@ -282,3 +1645,21 @@ class ContextManager(UserDB, BookDB):
         """
         print("Exiting context manager...")
         self.save_data()
+        self.close()
+
+    def close(self) -> None:
+        """
+        Release the event subscribers, the journal and the storage backend. The journal file is removed
+        if everything in it has been saved; otherwise it is left for the next process to adopt.
+        """
+        if self._autosaver is not None:
+            self._autosaver.stop()
+        self.events.close()  # The queued subscribers handle the last events first
+        if self._journal is not None:
+            self._journal.close()
+            if not len(self._journal):
+                os.remove(self._journal.path)
+            self._journal_lock.release()
+        for lock in self._pending_journals:
+            lock.release()
+        self._backend.close()
@@ -0,0 +1,180 @@
+import json
+from itertools import compress
+from operator import itemgetter
+from typing import Optional, Tuple
+from Storage.Backends.base_backend import INTEGER_FIELDS, STORE_FIELDS
+
+# Validation comes in two tiers. Interactive and batch commands build the Pydantic models, one
+# record at a time. Bulk data (imports, and the stores read from disk) is validated a whole batch
+# per call against the plain-dictionary record shapes, so pydantic-core checks every record without
+# a model object being created and dumped back into a dictionary per record: about 0.3 microseconds
+# a record instead of 2.5. Records the storage layer builds itself (journal replay, cascaded
+# check-ins) are trusted and not validated again.
+#
+# Importing pydantic and building the adapters takes about 0.3 seconds, several times what a one-shot
+# command of the command line takes otherwise, so they are only built on first use. A store read from
+# disk is first checked by _well_formed, which only uses built-in functions running in C; the stores
+# the library wrote itself pass it, and pydantic is only needed to tell which records of a store
+# failing it are invalid, and why.
+_adapters = {}  # Store -> pydantic TypeAdapter over a list of its records ("loans": over the whole store)
+_record_defaults = {}  # "books" or "users" -> field defaults of the model, applied to imported rows leaving fields out
+# Lower bounds of the integer fields, as declared by the record shapes
+MINIMUM_VALUES = {"books": {"copies": 1}, "users": {}, "holds": {}, "due_dates": {"renewals": 0}}
+
+
+def _adapter(store: str):
+    """
+    :param store: One of "books", "users", "loans", "holds" or "due_dates".
+    :return: The pydantic TypeAdapter validating the records of the store, built on first use.
+    """
+    adapter = _adapters.get(store)
+    if adapter is None:
+        from pydantic import TypeAdapter
+        from Pydantic_Models.pydantic_models import BookRecord, DueDateRecord, HoldRecord, UserRecord
+
+        shapes = {"books": list[BookRecord], "users": list[UserRecord], "loans": dict[str, str],
+                  "holds": list[HoldRecord], "due_dates": list[DueDateRecord]}
+        adapter = _adapters[store] = TypeAdapter(shapes[store])
+    return adapter
+
+
+def _defaults(store: str) -> dict:
+    """
+    :param store: "books" or "users".
+    :return: The field defaults of the model of the store.
+    """
+    defaults = _record_defaults.get(store)
+    if defaults is None:
+        from Pydantic_Models.pydantic_models import BookData, UserLoggingData
+
+        model = {"books": BookData, "users": UserLoggingData}[store]
+        defaults = _record_defaults[store] = {name: field.default for name, field in model.model_fields.items()}
+    return defaults
+
+
+def _well_formed(store: str, records: list) -> bool:
+    """
+    Check a whole store with built-in functions only: every record is a dictionary holding exactly the
+    fields of the store, with text in the text fields and integers within their bounds in the integer
+    fields, as the strict validation of its record shape requires. Each check is a single pass of map
+    over the records, so the loop runs in C: about 0.1 microseconds a field instead of pydantic-core's 0.3,
+    and without importing pydantic.
+
+    :param store: One of "books", "users", "holds" or "due_dates".
+    :param records: The records of the store.
+    :return: True if every record is valid, False if at least one is not (or may not be).
+    """
+    if not records:
+        return True
+    if set(map(type, records)) != {dict}:
+        return False
+    fields, integers = STORE_FIELDS[store][1], INTEGER_FIELDS[store]
+    if not all(map(dict.fromkeys(fields).keys().__eq__, map(dict.keys, records))):
+        return False
+    for field in fields:
+        if set(map(type, map(itemgetter(field), records))) != {int if field in integers else str}:
+            return False
+    return all(min(map(itemgetter(field), records)) >= minimum for field, minimum in MINIMUM_VALUES[store].items())
+
+
+def _describe(errors: list) -> dict:
+    """
+    :param errors: The errors of a ValidationError raised on a list of records.
+    :return: A dictionary mapping the position of every invalid record to a description of its errors.
+    """
+    reasons = {}
+    for error in errors:
+        position, location = error["loc"][0], ".".join(str(part) for part in error["loc"][1:])
+        reason = f"{location}: {error['msg']}" if location else error["msg"]
+        reasons[position] = f"{reasons[position]}; {reason}" if position in reasons else reason
+    return reasons
+
+
+def validate_records(store: str, rows: list, fill_defaults: bool = False) -> Tuple[list, list]:
+    """
+    Validate a batch of book or user rows in a single call.
+
+    :param store: "books" or "users".
+    :param rows: The rows, normally dictionaries; anything else is rejected.
+    :param fill_defaults: Give fields missing from a row their model default, as the models do, instead
+                          of rejecting the row.
+    :return: (list of valid records as new dictionaries holding exactly the record fields,
+             list of (position in rows, reason) tuples for the rejected rows).
+    """
+    from pydantic import ValidationError
+
+    if fill_defaults:
+        defaults = _defaults(store)
+        rows = [{**defaults, **row} if isinstance(row, dict) and not defaults.keys() <= row.keys() else row
+                for row in rows]
+    adapter = _adapter(store)
+    try:
+        return adapter.validate_python(rows), []
+    except ValidationError as e:
+        reasons = _describe(e.errors())
+    kept = [position not in reasons for position in range(len(rows))]
+    return adapter.validate_python(list(compress(rows, kept))), sorted(reasons.items())
+
+
+def validate_store(store: str, data: dict, path: Optional[str] = None, chunk_size: int = 10000) -> dict:
+    """
+    Validate a whole store read from disk: books, users, holds and due dates must be records of the
+    right shape stored under their own key, loans must map copy IDs to user IDs. Invalid entries are
+    dropped rather than failing the load, and written to "<path>.rejects.jsonl" so that nothing is lost.
+    Records stored before an integer field existed are given its default value, in place. The check is
+    strict: the stored values are not converted, so a copy count stored as text is rejected rather than
+    kept as text.
+
+    A store passing _well_formed, as every store the library wrote does, needs nothing more. Otherwise
+    its records are checked by pydantic-core a chunk at a time and the validated copies thrown away, so
+    the check does not double the memory of a large store.
+
+    :param store: One of "books", "users", "loans", "holds" or "due_dates".
+    :param data: The store as decoded from its file.
+    :param path: The file it was read from, where the rejects file goes.
+    :param chunk_size: The number of records validated per call.
+    :return: The store, without its invalid entries.
+    """
+    if not isinstance(data, dict):
+        raise ValueError(f"The {store} store is not a JSON object")
+    reasons = {}
+    if store == "loans":
+        if not set(map(type, data)) | set(map(type, data.values())) <= {str}:
+            from pydantic import ValidationError
+
+            try:
+                _adapter("loans").validate_python(data)
+            except ValidationError as e:
+                reasons = {error["loc"][0]: error["msg"] for error in e.errors()}
+    else:
+        key_field = STORE_FIELDS[store][0]
+        keys, records = list(data), list(data.values())
+        for field, default in INTEGER_FIELDS[store].items():
+            for record in records:
+                if type(record) is dict and field not in record:
+                    record[field] = default
+        if not _well_formed(store, records):
+            from pydantic import ValidationError
+
+            adapter = _adapter(store)
+            for start in range(0, len(records), chunk_size):
+                try:
+                    adapter.validate_python(records[start:start + chunk_size], strict=True)
+                except ValidationError as e:
+                    reasons.update((keys[start + position], reason)
+                                   for position, reason in _describe(e.errors()).items())
+        try:
+            matching = list(map(itemgetter(key_field), records)) == keys  # Compared in C
+        except (KeyError, TypeError):  # Malformed records, already rejected above
+            matching = False
+        if not matching:
+            for key, record in data.items():
+                if key not in reasons and record[key_field] != key:
+                    reasons[key] = f"{key_field}: stored under the key '{key}' but holds '{record[key_field]}'"
+    if reasons:
+        rejects_path = f"{path or store}.rejects.jsonl"
+        with open(rejects_path, "a", encoding="utf-8") as fp:
+            fp.writelines(json.dumps({"key": key, "record": data.pop(key), "error": reason}) + "\n"
+                          for key, reason in reasons.items())
+        print(f"Skipped {len(reasons)} invalid {store} record(s) while loading; they were written to {rejects_path}")
+    return data
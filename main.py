@@ -2,8 +2,74 @@
 This code simply acts as a wrapper around all other codes and runs the
 management system
 
+Without arguments the interactive menu is started. With --batch FILE the JSONL
+commands in FILE ('-' for standard input) are executed without any prompts and
+one JSON result per command is written to standard output. With --serve the
+library is served over HTTP/JSON until interrupted. A subcommand, e.g.
+"search-book --author X" or "checkout ISBN USER_ID", runs that single command and
+prints its JSON result (see Menu/cli.py); "python main.py -h" lists them.
+
 """
 
+import time
+started = time.perf_counter() # the one-shot commands report their startup from here with --timing
+
+import argparse
+import sys
+from contextlib import redirect_stdout
+from Menu.cli import CommandLine # importing the one-shot commands, which defer loading the storage layer
+
+
+def run_batch(args) -> int:
+    from Menu.batch import BatchRunner # importing the batch command runner
+    from Storage.storage import ContextManager
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    commands = sys.stdin if args.batch == "-" else open(args.batch, "r")
+    with redirect_stdout(sys.stderr): # keep the loading messages out of the JSON results
+        manager = ContextManager()
+    try:
+        failures = BatchRunner(manager, save_every=args.save_every).run(commands, output)
+    finally:
+        manager.close()
+        if commands is not sys.stdin:
+            commands.close()
+        if output is not sys.stdout:
+            output.close()
+    return 1 if failures else 0
+
+
+def run_service(args) -> int:
+    import asyncio
+    from Service.http_service import LibraryService # importing the HTTP/JSON service
+    from Storage.storage import ContextManager
+
+    host, _, port = args.serve.rpartition(":")
+    manager = ContextManager()
+    try:
+        asyncio.run(LibraryService(manager).serve_forever(host or "127.0.0.1", int(port)))
+    except KeyboardInterrupt:
+        print("Gracefully exiting....")
+    finally:
+        manager.close()
+    return 0
+
+
+parser = argparse.ArgumentParser(description="Library Management System")
+parser.add_argument("--batch", metavar="FILE", help="execute the JSONL commands in FILE ('-' for stdin) without prompts")
+parser.add_argument("--save-every", type=int, default=0, metavar="N", help="in batch mode, save after every N commands")
+parser.add_argument("--output", metavar="FILE", help="in batch mode, write the JSON results to FILE instead of stdout")
+parser.add_argument("--serve", metavar="[HOST:]PORT", help="serve the library over HTTP/JSON, e.g. --serve 127.0.0.1:8080")
+CommandLine.add_subcommands(parser)
+args = parser.parse_args()
+
+if args.subcommand:
+    exit(CommandLine.run_subcommand(args, started))
+if args.batch:
+    exit(run_batch(args))
+if args.serve:
+    exit(run_service(args))
+
 from Menu.menu import Menu # importing menu manager
 
 
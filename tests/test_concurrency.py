@@ -0,0 +1,122 @@
+import io
+import os
+import random
+import sys
+import tempfile
+import threading
+import unittest
+from collections import Counter
+from contextlib import redirect_stdout
+from Benchmark.benchmark import configure_storage
+from Storage.BookDB.book_storage_handling import BookDB
+from Storage.inventory import copy_isbn
+from Storage.storage import ContextManager
+
+THREADS = 32
+OPERATIONS = 300  # Per thread
+BOOKS = 40
+USERS = 64
+
+
+class ConcurrentLoansTest(unittest.TestCase):
+    """
+    Hammers checkout and check-in from 32 threads over few books and copies, so that most operations
+    contend for the same copies, and checks that no copy is ever lent twice and that the inventory
+    counters match the loans afterwards.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        configure_storage(self.directory.name)
+        self.backend = os.environ.get("LIBRARY_STORAGE_BACKEND")
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # Switch threads as often as possible, inside the critical sections too
+
+    def tearDown(self):
+        sys.setswitchinterval(self.switch_interval)
+        if self.backend is None:
+            os.environ.pop("LIBRARY_STORAGE_BACKEND", None)
+        else:
+            os.environ["LIBRARY_STORAGE_BACKEND"] = self.backend
+        self.directory.cleanup()
+
+    def _load(self, backend: str) -> ContextManager:
+        os.environ["LIBRARY_STORAGE_BACKEND"] = backend
+        manager = ContextManager()
+        with manager._backend.transaction():
+            BookDB.add_book_records([{"isbn": f"b{number}", "title": f"Title {number}", "author": "Author",
+                                      "copies": 1 + number % 3} for number in range(BOOKS)])
+            manager.add_user_records([{"user_id": f"u{number}", "password": "password", "name": "Name"}
+                                      for number in range(USERS)])
+        return manager
+
+    def _hammer(self, manager: ContextManager) -> list:
+        """
+        :return: The problems seen by the event subscriber: copies lent while on loan, or returned while not.
+        """
+        on_loan, problems = {}, []
+
+        def watch(event):  # Published under the locks of the change, in the order the changes were made
+            copy, user_id = event["key"], event["data"]["user_id"]
+            if event["type"] == "checkout":
+                if copy in on_loan:
+                    problems.append(f"{copy} lent to {user_id} while on loan to {on_loan[copy]}")
+                on_loan[copy] = user_id
+            elif on_loan.pop(copy, None) != user_id:
+                problems.append(f"{copy} returned by {user_id}, who did not hold it")
+
+        manager.events.subscribe(watch, types=("checkout", "checkin"))
+        barrier = threading.Barrier(THREADS)
+
+        def worker(seed: int):
+            generator = random.Random(seed)
+            barrier.wait()
+            for _ in range(OPERATIONS):
+                isbn, user_id = f"b{generator.randrange(BOOKS)}", f"u{generator.randrange(USERS)}"
+                if generator.random() < 0.55:
+                    manager._checkout(isbn, user_id)
+                else:
+                    manager._checkin(isbn, user_id)
+
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(THREADS)]
+        with redirect_stdout(io.StringIO()):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return problems
+
+    def _check(self, backend: str) -> None:
+        with redirect_stdout(io.StringIO()):
+            manager = self._load(backend)
+        try:
+            self.assertEqual(self._hammer(manager), [])
+            loans = dict(manager._previous_context.items())
+            self.assertGreater(len(loans), 0)
+            holders = Counter((copy_isbn(copy), user_id) for copy, user_id in loans.items())
+            self.assertEqual([pair for pair, count in holders.items() if count > 1], [], "a user holds two copies")
+            lent = Counter(map(copy_isbn, loans))
+            for number in range(BOOKS):
+                isbn = f"b{number}"
+                self.assertEqual(BookDB._inventory.lent(isbn), lent[isbn], isbn)
+                self.assertLessEqual(lent[isbn], BookDB._book_copies(isbn), isbn)
+                self.assertEqual(manager.available_copies(isbn), BookDB._book_copies(isbn) - lent[isbn], isbn)
+            counts = BookDB.inventory_counts()
+            self.assertEqual(counts["on_loan"], len(loans))
+            self.assertEqual(counts["available"], counts["copies"] - len(loans))
+            self.assertEqual({user_id: manager._user_loans.lookup(user_id) for user_id in set(loans.values())},
+                             {user_id: {copy for copy, holder in loans.items() if holder == user_id}
+                              for user_id in set(loans.values())})
+        finally:
+            with redirect_stdout(io.StringIO()):
+                manager.close()
+
+    def test_no_double_checkout_json(self):
+        self._check("json")
+
+    def test_no_double_checkout_sqlite(self):
+        self._check("sqlite")
+
+
+if __name__ == "__main__":
+    unittest.main()
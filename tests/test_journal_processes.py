@@ -0,0 +1,144 @@
+import glob
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from Benchmark.benchmark import configure_storage, storage_settings
+from Menu.batch import BatchRunner
+from Storage.BookDB.book_storage_handling import BookDB
+from Storage.UserDB.user_storage_handling import UserDB
+from Storage.storage import ContextManager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The other process: opens the library, then executes the batch commands read from its stdin, one JSON
+# object per line, answering each with its JSON result. "fail_saves" makes every later write of a store fail.
+OTHER_PROCESS = """
+import contextlib, importlib, io, json, sys
+for module, owner, attribute, value in json.loads(sys.argv[1]):
+    setattr(getattr(importlib.import_module(module), owner), attribute, value)
+from Menu.batch import BatchRunner
+from Storage.storage import ContextManager
+with contextlib.redirect_stdout(io.StringIO()):
+    manager = ContextManager()
+runner = BatchRunner(manager)
+def failing_save(store, data):
+    raise OSError("No space left on device")
+print(json.dumps("ready"), flush=True)
+for line in sys.stdin:
+    command = json.loads(line)
+    if command["command"] == "fail_saves":
+        manager._backend.save = failing_save
+        response = {"ok": True}
+    else:
+        response = runner.execute(command)
+    print(json.dumps(response, default=list), flush=True)
+"""
+
+
+class JournalProcessesTest(unittest.TestCase):
+    """
+    Two processes sharing the JSON stores: saves merge what the other process saved, and the journal
+    of a process killed before saving, or whose save failed, is replayed by the next process opening the library.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        configure_storage(self.directory.name)
+        self.backend = os.environ.get("LIBRARY_STORAGE_BACKEND")
+        os.environ["LIBRARY_STORAGE_BACKEND"] = "json"
+        manager, _ = self._open()
+        with redirect_stdout(io.StringIO()):
+            BookDB.add_book_records([{"isbn": "s1", "title": "Title", "author": "Author", "copies": 1}])
+            manager.add_user_records([{"user_id": "x", "password": "password", "name": "Name"}])
+            manager.save_data()
+        manager.close()
+        self.manager = None
+        self.other = subprocess.Popen([sys.executable, "-c", OTHER_PROCESS, json.dumps(storage_settings(
+            self.directory.name))], cwd=ROOT, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        self.assertEqual(json.loads(self.other.stdout.readline()), "ready")
+
+    def tearDown(self):
+        if self.other.poll() is None:
+            self.other.stdin.close()
+            self.other.wait()
+        self.other.stdout.close()
+        if self.manager is not None:
+            self.manager.close()
+        if self.backend is None:
+            os.environ.pop("LIBRARY_STORAGE_BACKEND", None)
+        else:
+            os.environ["LIBRARY_STORAGE_BACKEND"] = self.backend
+        self.directory.cleanup()
+
+    @staticmethod
+    def _open() -> tuple:
+        with redirect_stdout(io.StringIO()) as printed:
+            manager = ContextManager()
+        return manager, printed.getvalue()
+
+    def _other(self, command: str, **args) -> dict:
+        self.other.stdin.write(json.dumps({"command": command, "args": args}) + "\n")
+        self.other.stdin.flush()
+        return json.loads(self.other.stdout.readline())
+
+    def _execute(self, command: str, **args) -> dict:
+        return BatchRunner(self.manager).execute({"command": command, "args": args})
+
+    def _kill_other(self) -> None:
+        self.other.kill()  # Nothing runs on exit: the journal is all the other process leaves
+        self.other.wait()
+        self.other.stdin.close()
+
+    def _journals(self) -> list:
+        return sorted(os.path.basename(path) for path in glob.glob(os.path.join(self.directory.name, "journal*.log")))
+
+    def test_saves_of_both_processes_are_merged(self):
+        self.manager, _ = self._open()
+        self.assertTrue(self._other("update_book", isbn="s1", title="Their title", author="Author")["ok"])
+        self.assertTrue(self._other("add_book", isbn="c1", title="Title", author="Author")["ok"])
+        self.assertTrue(self._other("add_user", user_id="y", password="password", name="Name")["ok"])
+        self.assertTrue(self._other("save")["ok"])
+        self.assertTrue(self._execute("update_book", isbn="s1", title="Our title", author="Author")["ok"])
+        self.assertTrue(self._execute("add_book", isbn="p1", title="Title", author="Author")["ok"])
+        with redirect_stdout(io.StringIO()) as printed:
+            self.assertTrue(self.manager.save_data())
+        self.assertIn("Kept the version saved by another process of 1 conflicting books: s1", printed.getvalue())
+        self.manager.close()
+        self.manager, _ = self._open()
+        self.assertEqual(set(BookDB._data), {"s1", "c1", "p1"})
+        self.assertEqual(BookDB._data["s1"]["title"], "Their title")  # The copy saved first wins
+        self.assertEqual(set(UserDB._data), {"x", "y"})
+
+    def test_journal_of_a_killed_process_is_adopted(self):
+        self.assertTrue(self._other("add_book", isbn="c1", title="Title", author="Author", copies=2)["ok"])
+        self.assertTrue(self._other("checkout", isbn="c1", user_id="x")["ok"])
+        self.assertTrue(self._other("delete_book", isbn="s1", title="Title", author="Author")["ok"])
+        self._kill_other()
+        self.assertEqual(len(self._journals()), 1)
+        self.manager, printed = self._open()
+        self.assertIn("Adopting the journal of a process that exited without saving", printed)
+        self.assertEqual(set(BookDB._data), {"c1"})
+        self.assertEqual(dict(self.manager._previous_context), {"c1": "x"})
+        self.assertEqual(BookDB.inventory_counts()["available"], 1)
+        with redirect_stdout(io.StringIO()):
+            self.assertTrue(self.manager.save_data())
+        self.manager.close()
+        self.assertEqual(self._journals(), [])  # Folded into the stores, then deleted
+        self.manager, printed = self._open()
+        self.assertNotIn("Adopting", printed)
+        self.assertEqual(set(BookDB._data), {"c1"})
+
+    def test_failed_save_keeps_the_rotated_segment(self):
+        self.assertTrue(self._other("add_book", isbn="c1", title="Title", author="Author")["ok"])
+        self.assertTrue(self._other("fail_saves")["ok"])
+        self.assertFalse(self._other("save")["ok"])
+        self.assertTrue(any("-saving-1" in name for name in self._journals()))
+        self.assertTrue(self._other("add_book", isbn="c2", title="Title", author="Author")["ok"])  # After the rotation
+        self._kill_other()
+        self.manager, _ = self._open()
+        self.assertEqual(set(BookDB._data), {"s1", "c1", "c2"})
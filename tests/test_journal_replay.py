@@ -0,0 +1,85 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from Benchmark.benchmark import configure_storage
+from Menu.batch import BatchRunner
+from Storage.BookDB.book_storage_handling import BookDB
+from Storage.UserDB.user_storage_handling import UserDB
+from Storage.storage import ContextManager
+
+JOURNALED_OPS = {"add_book", "update_book", "delete_book", "add_user", "update_password", "delete_user", "checkout",
+                 "checkin", "renew", "checkout_many", "checkin_many", "place_hold", "drop_hold"}
+
+
+class JournalReplayTest(unittest.TestCase):
+    """
+    Every journaled mutation, made and then lost by a crash before any save, is recovered by the next
+    opening of the library: the stores, the loan counters and the waiting lists are those the crash left.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        configure_storage(self.directory.name)
+        self.backend = os.environ.get("LIBRARY_STORAGE_BACKEND")
+        os.environ["LIBRARY_STORAGE_BACKEND"] = "json"
+        with redirect_stdout(io.StringIO()):
+            self.manager = ContextManager()
+            BookDB.add_book_records([{"isbn": isbn, "title": "Title", "author": "Author", "copies": copies}
+                                     for isbn, copies in (("b1", 2), ("b2", 1), ("b3", 1))])
+            self.manager.add_user_records([{"user_id": user_id, "password": "password", "name": "Name"}
+                                           for user_id in ("x", "y", "z")])
+            self.manager.save_data()
+
+    def tearDown(self):
+        self.manager.close()
+        if self.backend is None:
+            os.environ.pop("LIBRARY_STORAGE_BACKEND", None)
+        else:
+            os.environ["LIBRARY_STORAGE_BACKEND"] = self.backend
+        self.directory.cleanup()
+
+    def _execute(self, command: str, **args) -> None:
+        response = BatchRunner(self.manager).execute({"command": command, "args": args})
+        self.assertTrue(response["ok"], response)
+
+    def _state(self) -> dict:
+        return {"books": dict(BookDB._data), "users": dict(UserDB._data), "loans": dict(self.manager._previous_context),
+                "holds": dict(self.manager._holds), "due_dates": dict(self.manager._due_dates),
+                "inventory": BookDB.inventory_counts(), "waiting": self.manager.hold_queue("n1"),
+                "user_loans": self.manager._user_loans.lookup("y")}
+
+    def _crash(self) -> list:
+        """
+        Stop using the library as a killed process would: nothing is saved or cleaned up, and the journal
+        is only closed and unlocked, as the operating system does. Returns the operations it recorded.
+        """
+        journal = self.manager._journal
+        journal.close()
+        self.manager._journal_lock.release()
+        with open(journal.path) as fp:
+            return [json.loads(line)["op"] for line in fp]
+
+    def test_every_journaled_mutation_is_replayed(self):
+        self._execute("add_book", isbn="n1", title="New", author="Author")
+        self._execute("update_book", isbn="b2", title="Renamed", author="Someone else", copies=2)
+        self._execute("delete_book", isbn="b3", title="Title", author="Author")
+        self._execute("add_user", user_id="w", password="password", name="Name")
+        self._execute("update_user", user_id="x", password="changed", name="Name")
+        self._execute("delete_user", user_id="z", password="password", name="Name")
+        self._execute("checkout", isbn="b1", user_id="x")
+        self._execute("renew", isbn="b1", user_id="x")  # Still on loan, so the crash leaves the renewed due date
+        self._execute("checkout_many", user_id="y", items=[{"isbn": "n1"}, {"isbn": "b2"}, {"isbn": "b1"}])
+        self._execute("checkin_many", user_id="y", items=[{"isbn": "b2"}])
+        self._execute("checkout", isbn="b2", user_id="w")
+        self._execute("checkin", isbn="b2", user_id="w")
+        self._execute("place_hold", isbn="n1", user_id="x")
+        self._execute("place_hold", isbn="n1", user_id="w")
+        self._execute("cancel_hold", isbn="n1", user_id="x")
+        before = self._state()
+        self.assertEqual(set(self._crash()), JOURNALED_OPS)
+        with redirect_stdout(io.StringIO()):
+            self.manager = ContextManager()
+        self.assertEqual(self._state(), before)
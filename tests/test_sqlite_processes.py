@@ -0,0 +1,153 @@
+import io
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from Benchmark.benchmark import configure_storage, storage_settings
+from Menu.batch import BatchRunner
+from Storage.BookDB.book_storage_handling import BookDB
+from Storage.storage import ContextManager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The other process: opens the library, then runs the checkouts and check-ins read from its stdin,
+# "checkout ISBN USER_ID" or "checkin ISBN USER_ID" per line, answering each with its JSON result
+OTHER_PROCESS = """
+import contextlib, importlib, io, json, sys
+for module, owner, attribute, value in json.loads(sys.argv[1]):
+    setattr(getattr(importlib.import_module(module), owner), attribute, value)
+from Storage.storage import ContextManager
+with contextlib.redirect_stdout(io.StringIO()):
+    manager = ContextManager()
+print(json.dumps("ready"), flush=True)
+for line in sys.stdin:
+    command, isbn, user_id = line.split()
+    with contextlib.redirect_stdout(io.StringIO()):
+        done = getattr(manager, "_" + command)(isbn, user_id)
+    print(json.dumps(done), flush=True)
+"""
+
+
+class SQLiteProcessesTest(unittest.TestCase):
+    """
+    Two processes sharing one SQLite database, both opened before either lends anything: each must see
+    the loans of the other, so a copy the other process lent is never lent again.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        configure_storage(self.directory.name)
+        self.backend = os.environ.get("LIBRARY_STORAGE_BACKEND")
+        os.environ["LIBRARY_STORAGE_BACKEND"] = "sqlite"
+        with redirect_stdout(io.StringIO()):
+            self.manager = ContextManager()
+            BookDB.add_book_records([{"isbn": "s1", "title": "Title", "author": "Author", "copies": 1},
+                                     {"isbn": "s2", "title": "Title", "author": "Author", "copies": 2}])
+            self.manager.add_user_records([{"user_id": user_id, "password": "password", "name": "Name"}
+                                           for user_id in ("x", "y", "z")])
+        self.other = subprocess.Popen([sys.executable, "-c", OTHER_PROCESS, json.dumps(storage_settings(
+            self.directory.name))], cwd=ROOT, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        self.assertEqual(json.loads(self.other.stdout.readline()), "ready")
+
+    def tearDown(self):
+        self.other.stdin.close()
+        self.other.wait()
+        self.other.stdout.close()
+        self.manager._backend.close()
+        if self.backend is None:
+            os.environ.pop("LIBRARY_STORAGE_BACKEND", None)
+        else:
+            os.environ["LIBRARY_STORAGE_BACKEND"] = self.backend
+        self.directory.cleanup()
+
+    def _other(self, command: str, isbn: str, user_id: str) -> bool:
+        self.other.stdin.write(f"{command} {isbn} {user_id}\n")
+        self.other.stdin.flush()
+        return json.loads(self.other.stdout.readline())
+
+    def _checkout(self, isbn: str, user_id: str) -> bool:
+        with redirect_stdout(io.StringIO()):
+            return self.manager._checkout(isbn, user_id)
+
+    def test_copy_lent_by_this_process_is_refused_to_the_other(self):
+        self.assertTrue(self._checkout("s1", "x"))
+        self.assertFalse(self._other("checkout", "s1", "y"))
+        self.assertEqual(self.manager._previous_context["s1"], "x")
+        self.assertEqual(self.manager.available_copies("s1"), 0)
+
+    def test_copy_lent_by_the_other_process_is_refused_to_this_one(self):
+        self.assertTrue(self._other("checkout", "s1", "y"))
+        self.assertFalse(self.manager.is_book_available("s1"))
+        self.assertFalse(self._checkout("s1", "x"))
+        self.assertEqual(self.manager._previous_context["s1"], "y")
+
+    def test_copies_are_shared_between_the_processes(self):
+        self.assertTrue(self._checkout("s2", "x"))
+        self.assertTrue(self._other("checkout", "s2", "y"))  # The second copy
+        self.assertFalse(self._checkout("s2", "z"))
+        self.assertEqual(BookDB.inventory_counts()["available"], 1)  # s1
+        self.assertTrue(self._other("checkin", "s2", "y"))
+        self.assertTrue(self._checkout("s2", "z"))
+        self.assertEqual(dict(self.manager._previous_context), {"s2": "x", "s2#2": "z"})
+
+
+class SQLiteSwitchTest(unittest.TestCase):
+    """
+    A library kept in JSON files switched to SQLite keeps its records, and a database another
+    process keeps locked fails the command instead of the process.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        configure_storage(self.directory.name)
+        self.backend = os.environ.get("LIBRARY_STORAGE_BACKEND")
+        os.environ["LIBRARY_STORAGE_BACKEND"] = "json"
+        with redirect_stdout(io.StringIO()):
+            manager = ContextManager()
+            BookDB.add_book_records([{"isbn": "j1", "title": "Title", "author": "Author", "copies": 2}])
+            manager.add_user_records([{"user_id": "x", "password": "password", "name": "Name"}])
+            manager._checkout("j1", "x")
+            manager.save_data()
+        manager.close()
+        os.environ["LIBRARY_STORAGE_BACKEND"] = "sqlite"
+        with redirect_stdout(io.StringIO()):
+            self.manager = ContextManager()
+
+    def tearDown(self):
+        self.manager._backend.close()
+        if self.backend is None:
+            os.environ.pop("LIBRARY_STORAGE_BACKEND", None)
+        else:
+            os.environ["LIBRARY_STORAGE_BACKEND"] = self.backend
+        self.directory.cleanup()
+
+    def test_json_stores_are_imported_once(self):
+        self.assertEqual(dict(self.manager._previous_context), {"j1": "x"})
+        self.assertEqual(BookDB.inventory_counts()["available"], 1)
+        for store in ("books", "users", "loans", "due_dates"):  # Emptied since: the JSON files must stay out
+            self.manager._backend.execute(f"DELETE FROM {store}")
+        self.manager._backend.close()
+        with redirect_stdout(io.StringIO()):
+            self.manager = ContextManager()
+        self.assertEqual(BookDB.inventory_counts()["titles"], 0)
+        self.assertEqual(len(self.manager._previous_context), 0)
+
+    def test_locked_database_fails_the_command(self):
+        other = sqlite3.connect(ContextManager._sqlite_path)
+        other.execute("BEGIN IMMEDIATE")
+        self.manager._backend.execute("PRAGMA busy_timeout = 50")
+        command = {"command": "add_book", "args": {"isbn": "j2", "title": "Title", "author": "Author"}}
+        response = BatchRunner(self.manager).execute(command)
+        self.assertFalse(response["ok"])
+        self.assertIn("database is locked", response["error"])
+        other.rollback()
+        other.close()
+        self.assertTrue(BatchRunner(self.manager).execute(command)["ok"])
+
+
+if __name__ == "__main__":
+    unittest.main()